@@ -0,0 +1,113 @@
+# app/core/bot_matcher.py
+import os
+import re
+import hashlib
+import time
+import logging
+import threading
+from typing import Iterable, Optional
+
+from app.core.cache import TTLCache
+
+# --- Configuration ---
+# Crawler signatures are case-insensitive substrings of the User-Agent, one per line in
+# BOT_BLOCKLIST_FILE ('#' starts a comment). They are compiled into one trie-shaped regex,
+# so a lookup is a single scan of the User-Agent however long the list is, and verdicts
+# for repeated User-Agents come from an LRU keyed by a digest of the header; headers
+# longer than BOT_VERDICT_CACHE_MAX_UA_LENGTH are scanned but never cached, so clients
+# cannot fill the cache with large strings. The file is re-read when its mtime changes,
+# checked at most every BOT_BLOCKLIST_RELOAD_SECONDS. Without the file the built-in list is used.
+BOT_BLOCKLIST_FILE = os.getenv("BOT_BLOCKLIST_FILE", "bot_blocklist.txt")
+BOT_BLOCKLIST_RELOAD_SECONDS = float(os.getenv("BOT_BLOCKLIST_RELOAD_SECONDS", "5"))
+BOT_VERDICT_CACHE_SIZE = int(os.getenv("BOT_VERDICT_CACHE_SIZE", "10000"))
+BOT_VERDICT_CACHE_TTL_SECONDS = 3600
+BOT_VERDICT_CACHE_MAX_UA_LENGTH = 512
+
+DEFAULT_BOT_SIGNATURES = ("gptbot", "bytespider", "claudebot", "ccbot", "anthropic-ai", "omgilibot", "facebookexternalhit")
+
+logger = logging.getLogger(__name__)
+
+def _trie_pattern(node: dict) -> str:
+    # A signature ending here already decides the verdict, so longer ones below it are dropped.
+    if "" in node:
+        return ""
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items())]
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+def compile_signatures(signatures: Iterable[str]) -> Optional[re.Pattern]:
+    """
+    One regex for all signatures, or None for an empty list. The alternation is built from
+    a prefix trie, so the engine branches once per character instead of trying every
+    signature at every position of the User-Agent.
+    """
+    trie: dict = {}
+    for signature in {s.strip().lower() for s in signatures if s.strip()}:
+        node = trie
+        for char in signature:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    if not trie:
+        return None
+    return re.compile(_trie_pattern(trie))
+
+def read_signatures(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [line.split("#", 1)[0].strip() for line in f if line.split("#", 1)[0].strip()]
+
+class BotMatcher:
+    def __init__(self, path: Optional[str] = None, signatures: Iterable[str] = DEFAULT_BOT_SIGNATURES):
+        self.path = path
+        self._default_signatures = tuple(signatures)
+        self._verdicts = TTLCache(maxsize=BOT_VERDICT_CACHE_SIZE, ttl_seconds=BOT_VERDICT_CACHE_TTL_SECONDS)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self.signature_count = 0
+        self._load(self._default_signatures)
+        self.maybe_reload(force=True)
+
+    def _load(self, signatures: Iterable[str]):
+        signatures = list(signatures)
+        pattern = compile_signatures(signatures)
+        self._pattern, self.signature_count = pattern, len(set(s.lower() for s in signatures))
+        self._verdicts.clear()
+
+    def maybe_reload(self, force: bool = False):
+        """Recompiles the list if the file changed since the last load. Cheap enough to call per request."""
+        now = time.monotonic()
+        if self.path is None or (not force and now < self._next_check):
+            return
+        with self._lock:
+            self._next_check = now + BOT_BLOCKLIST_RELOAD_SECONDS
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return
+            try:
+                signatures = read_signatures(self.path) if mtime is not None else self._default_signatures
+            except OSError as e:
+                # Keep the current list rather than opening the gate on a bad read.
+                logger.error(f"Could not read bot blocklist {self.path}: {e}")
+                return
+            self._mtime = mtime
+            self._load(signatures)
+            logger.info(f"Bot blocklist loaded: {self.signature_count} signatures from {self.path if mtime else 'defaults'}.")
+
+    def match(self, user_agent: str) -> Optional[str]:
+        """Returns the matching signature for this User-Agent, or None."""
+        self.maybe_reload()
+        cache_key = None
+        if len(user_agent) <= BOT_VERDICT_CACHE_MAX_UA_LENGTH:
+            cache_key = hashlib.blake2b(user_agent.encode(), digest_size=16).digest()
+            verdict = self._verdicts.get(cache_key)
+            if verdict is not None:
+                return verdict or None
+        found = self._pattern.search(user_agent.lower()) if self._pattern else None
+        verdict = found.group(0) if found else ""
+        if cache_key is not None:
+            self._verdicts.set(cache_key, verdict)
+        return verdict or None
+
+matcher = BotMatcher(BOT_BLOCKLIST_FILE)
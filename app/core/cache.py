@@ -0,0 +1,80 @@
+# app/core/cache.py
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    A small in-process LRU cache with per-entry expiry.
+    Safe to share between the event loop and worker threads (all access is locked).
+    `on_evict(key, value)` is called whenever an entry leaves the cache for any reason
+    (expiry, LRU eviction, explicit pop or clear).
+    """
+    def __init__(self, maxsize: int, ttl_seconds: float, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, key: Hashable, value: Any):
+        if self._on_evict:
+            self._on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value, or `default` if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self._evict(key, value)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        """Stores a value. `ttl_seconds` overrides the cache default for this entry."""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            return
+        with self._lock:
+            previous = self._data.pop(key, _MISSING)
+            if previous is not _MISSING and previous[1] is not value:
+                self._evict(key, previous[1])
+            self._data[key] = (time.monotonic() + ttl, value)
+            while len(self._data) > self.maxsize:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                self._evict(old_key, old_value)
+
+    def pop(self, key: Hashable) -> Any:
+        """Removes an entry and returns its value (or None)."""
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            if entry is _MISSING:
+                return None
+            self._evict(key, entry[1])
+            return entry[1]
+
+    def clear(self):
+        with self._lock:
+            while self._data:
+                key, (_, value) = self._data.popitem(last=False)
+                self._evict(key, value)
+
+    def items(self) -> list:
+        """A snapshot of the unexpired (key, value) pairs, oldest first. Does not refresh recency."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at > now]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
@@ -2,6 +2,7 @@ import os
 import logging  # Import the logging library
 from google.cloud import firestore_v1
 from google.oauth2 import service_account
+from google.auth.credentials import AnonymousCredentials
 from dotenv import load_dotenv
 import firebase_admin
 from firebase_admin import credentials
@@ -13,22 +14,33 @@ load_dotenv()
 # Get the path to our service account key from the environment variable
 key_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
-if not key_path:
-    raise ValueError(
-        "FATAL: The 'GOOGLE_APPLICATION_CREDENTIALS' environment variable is not set. "
-        "Ensure you have a .env file in the root directory with the line: "
-        "GOOGLE_APPLICATION_CREDENTIALS=\"service-account.json\""
-    )
+# When FIRESTORE_EMULATOR_HOST is set (local benchmarks and tests), the client talks to
+# the emulator and no service account is required.
+emulator_host = os.getenv("FIRESTORE_EMULATOR_HOST")
 
-try:
-    credentials_obj = service_account.Credentials.from_service_account_file(key_path)
-except FileNotFoundError:
-    raise FileNotFoundError(
-        f"FATAL: The service account file was not found at the path specified "
-        f"by GOOGLE_APPLICATION_CREDENTIALS: '{key_path}'. Ensure the file exists."
+if emulator_host and not key_path:
+    credentials_obj = AnonymousCredentials()
+    db = firestore_v1.AsyncClient(
+        project=os.getenv("GOOGLE_CLOUD_PROJECT", "promptforge-c27e8"),
+        credentials=credentials_obj,
     )
+else:
+    if not key_path:
+        raise ValueError(
+            "FATAL: The 'GOOGLE_APPLICATION_CREDENTIALS' environment variable is not set. "
+            "Ensure you have a .env file in the root directory with the line: "
+            "GOOGLE_APPLICATION_CREDENTIALS=\"service-account.json\""
+        )
+
+    try:
+        credentials_obj = service_account.Credentials.from_service_account_file(key_path)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"FATAL: The service account file was not found at the path specified "
+            f"by GOOGLE_APPLICATION_CREDENTIALS: '{key_path}'. Ensure the file exists."
+        )
 
-db = firestore_v1.AsyncClient(credentials=credentials_obj)
+    db = firestore_v1.AsyncClient(credentials=credentials_obj)
 
 def initialize_firebase():
     """
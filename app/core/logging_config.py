@@ -0,0 +1,90 @@
+# app/core/logging_config.py
+import os
+import json
+import queue
+import atexit
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, Optional
+
+# --- Configuration ---
+# Request threads only put records on a bounded in-memory queue; a QueueListener thread
+# does the file writes and rotation. When the queue is full (the disk cannot keep up)
+# records are dropped and counted instead of blocking the event loop.
+# LOG_FORMAT=json writes one JSON object per line instead of the text format.
+LOG_FILE = os.getenv("LOG_FILE", "api_requests.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "3"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+TEXT_FORMAT = '%(asctime)s | %(levelname)s | %(message)s'
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record and counts it."""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record. Structured fields passed as `extra={"fields": {...}}` become top-level keys."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler: Optional[DroppingQueueHandler] = None
+file_handler: Optional[RotatingFileHandler] = None
+listener: Optional[QueueListener] = None
+
+def setup_logging(logger: Optional[logging.Logger] = None) -> QueueListener:
+    """Routes `logger` (the root logger by default) at INFO through the queue to the rotating log file."""
+    global queue_handler, file_handler, listener
+    logger = logger or logging.getLogger()
+    if listener is not None:
+        return listener
+
+    file_handler = RotatingFileHandler(LOG_FILE, mode='a', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    file_handler.setFormatter(JsonLinesFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    file_handler.setLevel(logging.INFO)
+
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.setLevel(logging.INFO)
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    # Flush what is still queued when the process exits.
+    atexit.register(listener.stop)
+
+    logger.setLevel(logging.INFO)
+    logger.addHandler(queue_handler)
+    return listener
+
+def flush():
+    """Blocks until every record queued so far has been written (stops and restarts the listener thread)."""
+    if listener is not None:
+        listener.stop()
+        listener.start()
+
+def get_stats() -> Dict[str, Any]:
+    """Queue depth and dropped record count on this replica (for the metrics endpoint)."""
+    return {
+        "format": LOG_FORMAT,
+        "queued": log_queue.qsize(),
+        "max_queue_size": LOG_QUEUE_SIZE,
+        "dropped": queue_handler.dropped if queue_handler else 0,
+    }
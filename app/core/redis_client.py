@@ -0,0 +1,30 @@
+# app/core/redis_client.py
+import os
+import logging
+from dotenv import load_dotenv
+from redis.asyncio import Redis
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis-service:6379")
+
+# Shared by the velocity trap (app.main) and the L2 tier of the LLM response cache.
+try:
+    # Fail gracefully if Redis is not found (local testing)
+    redis_client = Redis.from_url(REDIS_URL, decode_responses=True, encoding="utf-8", socket_connect_timeout=1)
+    logging.getLogger().info("Redis cache connection established for PromptForge.")
+except Exception as e:
+    logging.getLogger().error(f"Could not initialize Redis. Security features disabled. Error: {e}")
+    redis_client = None
+
+async def ping() -> bool:
+    """True if Redis answers. Checked at startup so Redis-backed background loops are not
+    started (and left retrying) against a server that is not there."""
+    if redis_client is None:
+        return False
+    try:
+        return bool(await redis_client.ping())
+    except Exception as e:
+        logging.getLogger().warning(f"Redis at {REDIS_URL} is unreachable: {e}")
+        return False
+
+__all__ = ['REDIS_URL', 'redis_client', 'ping']
@@ -0,0 +1,51 @@
+# app/core/singleflight.py
+import uuid
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+# --- In-process coalescing ---
+# Concurrent callers with the same key share one execution of `fn`. The work runs in its
+# own task, so a caller that disconnects (is cancelled) does not cancel it for the others.
+_inflight: Dict[Hashable, asyncio.Task] = {}
+
+def _forget(key: Hashable, task: asyncio.Task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()  # Mark as retrieved; every waiter has already been handed the error.
+
+async def run(key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """Runs `fn()` once for all concurrent callers with the same key and returns its result to each."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(fn())
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _forget(key, t))
+    return await asyncio.shield(task)
+
+def inflight_count() -> int:
+    return len(_inflight)
+
+# --- Cross-replica lock (Redis) ---
+# A lock per key, held only by its owner token, so replicas can agree on which one makes
+# the upstream call. The TTL bounds how long a crashed owner can block the key.
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+async def acquire_redis_lock(redis, key: str, ttl_ms: int) -> Optional[str]:
+    """Returns an owner token if the lock was taken, None if another owner holds it."""
+    token = uuid.uuid4().hex
+    if await redis.set(key, token, nx=True, px=ttl_ms):
+        return token
+    return None
+
+async def release_redis_lock(redis, key: str, token: str):
+    """Releases the lock only if it is still held by `token`."""
+    await redis.eval(_RELEASE_SCRIPT, 1, key, token)
+
+async def redis_lock_held(redis, key: str) -> bool:
+    return bool(await redis.exists(key))
@@ -0,0 +1,59 @@
+# app/core/streaming.py
+import json
+from typing import AsyncIterator, Type
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+async def _ndjson_lines(items: AsyncIterator[dict], model: Type[BaseModel]) -> AsyncIterator[str]:
+    async for item in items:
+        # Validate through the response model so streamed rows expose the same fields as the JSON endpoint.
+        yield model(**item).model_dump_json() + "\n"
+
+def ndjson_response(items: AsyncIterator[dict], model: Type[BaseModel]) -> StreamingResponse:
+    """
+    Streams documents to the client as newline-delimited JSON, one line per item,
+    as soon as the underlying async iterator produces them.
+    """
+    return StreamingResponse(_ndjson_lines(items, model), media_type=NDJSON_MEDIA_TYPE)
+
+# --- Server-Sent Events ---
+SSE_MEDIA_TYPE = "text/event-stream"
+
+def sse_event(event: str, data: BaseModel | dict) -> str:
+    """Formats one SSE frame. `data` is sent as a single JSON line."""
+    payload = data.model_dump_json() if isinstance(data, BaseModel) else json.dumps(data)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """
+    Streams pre-formatted SSE frames (see sse_event). Proxy buffering is disabled so each
+    frame reaches the client as soon as it is produced.
+    """
+    return StreamingResponse(
+        events, media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --- Named events (NDJSON or SSE) ---
+# For endpoints that can stream either format: items are (event_name, model) pairs. SSE
+# keeps the event name; NDJSON emits only the model, so its fields must tell events apart.
+def wants_sse(request: Request) -> bool:
+    return SSE_MEDIA_TYPE in request.headers.get("accept", "")
+
+async def _event_ndjson_lines(events: AsyncIterator[tuple[str, BaseModel]]) -> AsyncIterator[str]:
+    async for _, item in events:
+        yield item.model_dump_json() + "\n"
+
+async def _event_sse_frames(events: AsyncIterator[tuple[str, BaseModel]]) -> AsyncIterator[str]:
+    async for name, item in events:
+        yield sse_event(name, item)
+
+def event_stream_response(request: Request, events: AsyncIterator[tuple[str, BaseModel]]) -> StreamingResponse:
+    """SSE when the client sends `Accept: text/event-stream`, NDJSON otherwise."""
+    if wants_sse(request):
+        return sse_response(_event_sse_frames(events))
+    return StreamingResponse(_event_ndjson_lines(events), media_type=NDJSON_MEDIA_TYPE)
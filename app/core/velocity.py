@@ -0,0 +1,72 @@
+# app/core/velocity.py
+import os
+import time
+import logging
+from typing import Optional
+
+from app.core.cache import TTLCache
+
+# --- Configuration ---
+# The velocity trap bans an IP for VELOCITY_BAN_SECONDS once it sends more than
+# VELOCITY_LIMIT_PER_SECOND requests within one clock second. The ban check, counter
+# increment, counter expiry and ban issuance run as one Lua script, so each request costs
+# a single Redis round trip. IPs seen banned are also remembered locally for up to
+# LOCAL_BAN_SECONDS and rejected without touching Redis at all.
+VELOCITY_LIMIT_PER_SECOND = int(os.getenv("VELOCITY_LIMIT_PER_SECOND", "15"))
+VELOCITY_BAN_SECONDS = int(os.getenv("VELOCITY_BAN_SECONDS", "3600"))
+LOCAL_BAN_SECONDS = float(os.getenv("VELOCITY_LOCAL_BAN_SECONDS", "30"))
+LOCAL_BAN_MAX_ENTRIES = 10_000
+
+ALLOWED, BANNED, BAN_ISSUED = "allowed", "banned", "ban_issued"
+
+# KEYS[1] = ban key, KEYS[2] = this second's counter; ARGV[1] = limit, ARGV[2] = ban seconds.
+# Returns {verdict, n}: 0 = allowed (n = count), 1 = already banned (n = ban ms left),
+# 2 = banned by this request (n = count).
+VELOCITY_SCRIPT = """
+local ban_ms = redis.call('PTTL', KEYS[1])
+if ban_ms > 0 or ban_ms == -1 then
+    return {1, ban_ms}
+end
+local count = redis.call('INCR', KEYS[2])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[2], 2)
+end
+if count > tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], 'banned', 'EX', ARGV[2])
+    return {2, count}
+end
+return {0, count}
+"""
+
+local_bans = TTLCache(maxsize=LOCAL_BAN_MAX_ENTRIES, ttl_seconds=LOCAL_BAN_SECONDS)
+_scripts = {}
+
+def _script(redis):
+    # register_script hashes the source once and uses EVALSHA, re-sending the body only on NOSCRIPT.
+    script = _scripts.get(id(redis))
+    if script is None:
+        script = _scripts[id(redis)] = redis.register_script(VELOCITY_SCRIPT)
+    return script
+
+def _remember_ban(client_ip: str, ban_seconds: float):
+    local_bans.set(client_ip, True, ttl_seconds=min(LOCAL_BAN_SECONDS, ban_seconds))
+
+async def check(redis, client_ip: str, now: Optional[float] = None) -> str:
+    """Returns ALLOWED, BANNED or BAN_ISSUED for this request. Redis errors propagate (callers fail open)."""
+    if local_bans.get(client_ip):
+        return BANNED
+    second = int(time.time() if now is None else now)
+    verdict, value = await _script(redis)(
+        keys=[f"ban:{client_ip}", f"vel:{client_ip}:{second}"],
+        args=[VELOCITY_LIMIT_PER_SECOND, VELOCITY_BAN_SECONDS],
+    )
+    verdict, value = int(verdict), int(value)
+    if verdict == 1:
+        # A ban without expiry (-1) was set by hand; remember it for the full local window.
+        _remember_ban(client_ip, value / 1000 if value > 0 else LOCAL_BAN_SECONDS)
+        return BANNED
+    if verdict == 2:
+        logging.getLogger().error(f"VELOCITY BAN: {client_ip} hit {value} req/s")
+        _remember_ban(client_ip, VELOCITY_BAN_SECONDS)
+        return BAN_ISSUED
+    return ALLOWED
@@ -1,25 +1,27 @@
 import os
-import time
-import json
+import asyncio
 import logging
 import sys
-from logging.handlers import RotatingFileHandler
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, APIRouter, Request, Response, status, Depends
+from fastapi import FastAPI, APIRouter, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 from dotenv import load_dotenv
 
 # --- Security & Rate Limiting ---
-from redis.asyncio import Redis
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 
 # --- Internal Imports ---
 from app.middleware.logging_middleware import LoggingMiddleware
-from app.routers import prompts, templates, sandbox, metrics, execution
+from app.middleware.security_middleware import BotBlockMiddleware, VelocityTrapMiddleware
+from app.routers import prompts, templates, sandbox, metrics, execution, jobs
 from app.core.db import initialize_firebase
+from app.core.logging_config import setup_logging
+from app.core.redis_client import REDIS_URL, redis_client, ping as redis_ping
+from app.services import batch_service, firestore_service, job_queue
 
 # --------------------------------------------------------------------
 # 1. Configuration & Setup
@@ -27,27 +29,16 @@ from app.core.db import initialize_firebase
 
 # Load environment variables
 load_dotenv()
-REDIS_URL = os.getenv("REDIS_URL", "redis://redis-service:6379")
 
-# Setup Logging
-log_formatter = logging.Formatter('%(asctime)s | %(levelname)s | %(message)s')
-log_handler = RotatingFileHandler('api_requests.log', mode='a', maxBytes=5*1024*1024, backupCount=3)
-log_handler.setFormatter(log_formatter)
-log_handler.setLevel(logging.INFO)
+# Setup Logging: api_requests.log is written by a background thread (see app/core/logging_config.py)
+setup_logging()
 root_logger = logging.getLogger()
-root_logger.setLevel(logging.INFO)
-root_logger.addHandler(log_handler)
 
 initialize_firebase()
 
 # --- SECURITY: Redis Connection ---
-try:
-    # Fail gracefully if Redis is not found (local testing)
-    cache = Redis.from_url(REDIS_URL, decode_responses=True, encoding="utf-8", socket_connect_timeout=1)
-    root_logger.info("Redis cache connection established for PromptForge.")
-except Exception as e:
-    root_logger.error(f"Could not initialize Redis. Security features disabled. Error: {e}")
-    cache = None
+# Created in app.core.redis_client (None if Redis could not be initialised).
+cache = redis_client
 
 # --- SECURITY: Proxy-Aware IP Detection ---
 def get_real_ip(request: Request):
@@ -63,10 +54,34 @@ limiter = Limiter(key_func=get_real_ip, storage_uri=REDIS_URL, default_limits=["
 # 2. App Initialization
 # --------------------------------------------------------------------
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Starts and stops background maintenance tasks."""
+    background_tasks = [asyncio.create_task(batch_service.run_job_resumer())]
+    job_workers = []
+    if firestore_service.RATING_SHARD_COUNT > 0:
+        background_tasks.append(asyncio.create_task(firestore_service.run_rating_shard_compactor()))
+        root_logger.info(f"Rating shard compactor started ({firestore_service.RATING_SHARD_COUNT} shards).")
+    # Redis-backed loops only start if Redis answers now; otherwise API keys are simply not
+    # cached and async jobs wait for run_job_worker.py.
+    if await redis_ping():
+        background_tasks.append(asyncio.create_task(firestore_service.run_api_key_invalidation_subscriber()))
+        job_workers = job_queue.start_workers()
+        if job_workers:
+            root_logger.info(f"Started {len(job_workers)} in-process background job worker(s).")
+    else:
+        root_logger.warning("Redis is unreachable: API key caching and in-process job workers are disabled.")
+    yield
+    await job_queue.stop_workers(job_workers)
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
 app = FastAPI(
     title="PromptForge API",
     description="API for managing and optimizing LLM prompts.",
     version="1.0.1",
+    lifespan=lifespan,
 )
 
 # Connect Limiter to App
@@ -77,62 +92,10 @@ app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 # 3. Security Middleware (Must Run First)
 # --------------------------------------------------------------------
 
-# --- LAYER 1: The "Bouncer" (Bot Block) ---
-@app.middleware("http")
-async def block_bad_bots(request: Request, call_next):
-    user_agent = request.headers.get("user-agent", "").lower()
-    bad_bots = ["gptbot", "bytespider", "claudebot", "ccbot", "anthropic-ai", "omgilibot", "facebookexternalhit"]
-    
-    if any(bot in user_agent for bot in bad_bots):
-        root_logger.warning(f"BLOCKED BOT: {user_agent} from {get_real_ip(request)}")
-        return Response(
-            content=json.dumps({"detail": "Bot access denied."}), 
-            status_code=status.HTTP_403_FORBIDDEN,
-            media_type="application/json"
-        )
-    return await call_next(request)
-
-# --- LAYER 2: The "Velocity Trap" (Fail-Open Version) ---
-@app.middleware("http")
-async def velocity_trap(request: Request, call_next):
-    # If Redis failed to init, skip this check entirely
-    if not cache: 
-        return await call_next(request)
-
-    client_ip = get_real_ip(request)
-    
-    try:
-        # 1. Check Jail
-        is_banned = await cache.get(f"ban:{client_ip}")
-        if is_banned:
-            return Response(
-                content=json.dumps({"detail": "IP Banned for suspicious velocity. Try again in 1 hour."}), 
-                status_code=status.HTTP_403_FORBIDDEN,
-                media_type="application/json"
-            )
-
-        # 2. Check Velocity
-        current_time = int(time.time())
-        velocity_key = f"vel:{client_ip}:{current_time}"
-        
-        request_count = await cache.incr(velocity_key)
-        if request_count == 1:
-            await cache.expire(velocity_key, 2)
-            
-        if request_count > 15:
-            root_logger.error(f"VELOCITY BAN: {client_ip} hit {request_count} req/s")
-            await cache.setex(f"ban:{client_ip}", 3600, "banned")
-            return Response(
-                content=json.dumps({"detail": "Velocity limit exceeded. You are banned."}),
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                media_type="application/json"
-            )
-            
-    except Exception as e:
-        # FAIL OPEN: Don't crash if Redis vanishes
-        pass 
-
-    return await call_next(request)
+# Pure ASGI layers (app/middleware/security_middleware.py). Starlette wraps each new
+# middleware around the previous ones, so the velocity trap runs before the bot filter.
+app.add_middleware(BotBlockMiddleware)
+app.add_middleware(VelocityTrapMiddleware, redis=cache)
 
 # --------------------------------------------------------------------
 # 4. Standard Middleware & Routers
@@ -157,6 +120,7 @@ api_router.include_router(templates.router, prefix="/templates")
 api_router.include_router(sandbox.router, prefix="/sandbox")
 api_router.include_router(metrics.router, prefix="/metrics")
 api_router.include_router(execution.router, prefix="/users")
+api_router.include_router(jobs.router, prefix="/jobs")
 
 # Mount API at /api/v1 (No Mock Auth here!)
 app.include_router(api_router, prefix="/api/v1")
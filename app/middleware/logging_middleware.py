@@ -1,39 +1,67 @@
 # app/middleware/logging_middleware.py
 import time
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 import logging
 
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
 # FIX 1: Remove the redundant logging.basicConfig. Configuration is now in main.py.
 # FIX 2: Get a logger instance. It will inherit the root configuration.
 logger = logging.getLogger(__name__)
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
-        self, request: Request, call_next: RequestResponseEndpoint
-    ) -> Response:
-        """
-        Intercepts all requests to log key information to the configured log file.
-        """
+class LoggingMiddleware:
+    """
+    Pure ASGI access log: wraps `send` to capture the status code and logs one line per
+    request once the response has been sent. No per-request task or body re-streaming,
+    so streaming responses pass through untouched.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         start_time = time.time()
+        status_code = 500
 
-        response = await call_next(request)
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
 
-        process_time_ms = (time.time() - start_time) * 1000
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Also runs when an exception escapes the app before a response was started;
+            # the error middleware outside this one then answers 500, which is what gets logged.
+            self._log(scope, status_code, (time.time() - start_time) * 1000)
 
+    @staticmethod
+    def _log(scope: Scope, status_code: int, process_time_ms: float) -> None:
         user_id = "anonymous"
-        if hasattr(request.state, "user") and request.state.user:
-            user_id = request.state.user.get("uid", "unknown")
-        
+        user = scope.get("state", {}).get("user")
+        if user:
+            user_id = user.get("uid", "unknown")
+        client = scope.get("client")
+        fields = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "status_code": status_code,
+            "user_id": user_id,
+            "client_ip": client[0] if client else None,
+            "latency_ms": round(process_time_ms, 2),
+        }
+
         log_message = (
-            f"method={request.method} "
-            f"path='{request.url.path}' "
-            f"status_code={response.status_code} "
+            f"method={fields['method']} "
+            f"path='{fields['path']}' "
+            f"status_code={status_code} "
             f"user_id='{user_id}' "
-            f"client_ip='{request.client.host}' "
+            f"client_ip='{fields['client_ip']}' "
             f"latency_ms={process_time_ms:.2f}"
         )
-        
-        logger.info(log_message)
-        
-        return response
\ No newline at end of file
+
+        # The text format logs the message; LOG_FORMAT=json also emits `fields` as JSON keys.
+        logger.info(log_message, extra={"fields": fields})
@@ -0,0 +1,75 @@
+# app/middleware/security_middleware.py
+import json
+import logging
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core import bot_matcher, velocity
+
+# Both layers are pure ASGI: they read the scope headers and either answer directly or
+# hand the untouched receive/send channels to the next app.
+logger = logging.getLogger(__name__)
+
+def real_ip(scope: Scope, headers: Headers) -> str:
+    """Same rule as main.get_real_ip: first X-Forwarded-For hop, else the socket peer."""
+    forwarded = headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return (client[0] if client else None) or "127.0.0.1"
+
+def _json_response(detail: str, status_code: int) -> Response:
+    return Response(content=json.dumps({"detail": detail}), status_code=status_code, media_type="application/json")
+
+# --- LAYER 1: The "Bouncer" (Bot Block) ---
+class BotBlockMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        user_agent = headers.get("user-agent", "")
+        # Signatures from bot_blocklist.txt, compiled into one regex with an LRU of verdicts.
+        if bot_matcher.matcher.match(user_agent):
+            logger.warning(f"BLOCKED BOT: {user_agent.lower()} from {real_ip(scope, headers)}")
+            await _json_response("Bot access denied.", 403)(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+# --- LAYER 2: The "Velocity Trap" (Fail-Open Version) ---
+class VelocityTrapMiddleware:
+    def __init__(self, app: ASGIApp, redis=None):
+        self.app = app
+        self.redis = redis
+
+    async def _verdict(self, scope: Scope) -> Optional[str]:
+        # If Redis failed to init, skip this check entirely
+        if not self.redis:
+            return None
+        try:
+            # Ban check, counter and ban issuance in one round trip (or none for known bans).
+            return await velocity.check(self.redis, real_ip(scope, Headers(scope=scope)))
+        except Exception:
+            # FAIL OPEN: Don't crash if Redis vanishes
+            return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        verdict = await self._verdict(scope)
+        if verdict == velocity.BANNED:
+            await _json_response("IP Banned for suspicious velocity. Try again in 1 hour.", 403)(scope, receive, send)
+            return
+        if verdict == velocity.BAN_ISSUED:
+            await _json_response("Velocity limit exceeded. You are banned.", 429)(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -7,6 +7,7 @@ from app.schemas.prompt import (
     PromptExecuteResponse,
     UserAPIKey
 )
+from app.core.streaming import sse_response
 from app.services import llm_service, firestore_service, security_service
 
 # FIX: The 'prefix' argument is removed.
@@ -40,6 +41,28 @@ async def execute_managed_prompt(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
+@router.post("/execute/stream")
+async def stream_managed_prompt(
+    request: ManagedExecutionRequest,
+    current_user: Dict = Depends(security_service.get_current_user)
+):
+    """
+    (SECURE) Streams a managed execution as Server-Sent Events: `token` deltas, then a
+    final `done` event with token counts, cost, time to first token and total latency.
+    Failures, including a missing API key, arrive as an `error` event.
+    """
+    if current_user["uid"] != request.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not authorized to execute prompts for this user."
+        )
+    events = llm_service.stream_managed_prompt(
+        user_id=current_user["uid"],
+        model_name=request.model_name,
+        prompt_text=request.prompt_text
+    )
+    return sse_response(events)
+
 @router.post("/{user_id}/keys", status_code=status.HTTP_204_NO_CONTENT)
 async def save_user_api_key(
     user_id: str,
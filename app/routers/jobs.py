@@ -0,0 +1,30 @@
+# app/routers/jobs.py
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, Optional
+
+from app.core.streaming import sse_response
+from app.services import job_queue, security_service
+from app.schemas.prompt import Job
+
+router = APIRouter(
+    tags=["Jobs"],
+)
+
+# Jobs created by public endpoints have no owner and are readable by anyone holding the ID;
+# jobs created by signed-in users are only visible to them.
+optional_user_dependency = Depends(security_service.get_optional_current_user)
+
+@router.get("/{job_id}", response_model=Job)
+async def get_job_status(job_id: str, current_user: Optional[Dict] = optional_user_dependency):
+    """Status of a background job and, once it has succeeded, the endpoint's normal response in `result`."""
+    job = await job_queue.get_job(job_id, current_user)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str, current_user: Optional[Dict] = optional_user_dependency):
+    """Server-Sent Events: `status` on each status change, then `done` with the finished job."""
+    if await job_queue.get_job(job_id, current_user) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return sse_response(job_queue.job_events(job_id, current_user))
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Dict, Any, Optional
 from google.cloud.firestore_v1.async_client import AsyncClient
 from app.core.db import get_firestore_client
+from app.core.streaming import ndjson_response
+from app.core import logging_config
 
 
-from app.services import firestore_service, security_service
-from app.schemas.prompt import PromptSummary, RecentActivity, RatingCreate
+from app.services import firestore_service, security_service, response_cache, llm_scheduler, llm_resilience, llm_hedging, analysis_cache
+from app.schemas.prompt import PromptSummary, PromptSummaryPage, RecentActivity, RatingCreate
 
 
 router = APIRouter(
@@ -14,11 +16,27 @@ router = APIRouter(
 
 
 @router.get("/prompts/all", response_model=List[PromptSummary])
-async def get_all_prompts_metrics():
+async def get_all_prompts_metrics(
+    stream: bool = Query(False, description="Stream summaries as NDJSON instead of a JSON array.")
+):
     """(PUBLIC) Retrieves summary metrics for all non-deleted prompts."""
+    if stream:
+        return ndjson_response(firestore_service.stream_all_prompt_metrics(), PromptSummary)
     prompts_data = await firestore_service.get_all_prompt_metrics()
     return [PromptSummary(**prompt) for prompt in prompts_data]
 
+@router.get("/prompts/all/page", response_model=PromptSummaryPage)
+async def get_prompts_metrics_page(
+    page_size: int = Query(firestore_service.DEFAULT_PAGE_SIZE, ge=1, le=firestore_service.MAX_PAGE_SIZE),
+    page_token: Optional[str] = None
+):
+    """(PUBLIC) Retrieves one page of prompt summary metrics with an opaque next-page token."""
+    try:
+        prompts_data, next_token = await firestore_service.get_prompt_metrics_page(page_size, page_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PromptSummaryPage(items=[PromptSummary(**prompt) for prompt in prompts_data], next_page_token=next_token)
+
 @router.get("/prompts/starred", response_model=List[PromptSummary])
 async def get_starred_prompts_for_user(
     current_user: Dict = Depends(security_service.get_current_user)
@@ -37,6 +55,60 @@ async def get_recent_user_activity(
     user_id = current_user["uid"]
     return await firestore_service.get_recent_activity_for_user(user_id, limit)
 
+@router.get("/cache")
+async def get_response_cache_stats(
+    current_user: Dict = Depends(security_service.get_current_user)
+):
+    """(ADMIN) Hit/miss counters per tier of the LLM response cache on this replica."""
+    if not current_user.get("admin", False):
+        raise HTTPException(status_code=403, detail="Admin access required.")
+    return response_cache.get_stats()
+
+@router.get("/analysis-cache")
+async def get_analysis_cache_stats(
+    current_user: Dict = Depends(security_service.get_current_user)
+):
+    """(ADMIN) Hit rate per endpoint of the diagnose/breakdown/optimize result cache on this replica."""
+    if not current_user.get("admin", False):
+        raise HTTPException(status_code=403, detail="Admin access required.")
+    return analysis_cache.get_stats()
+
+@router.get("/logging")
+async def get_logging_stats(
+    current_user: Dict = Depends(security_service.get_current_user)
+):
+    """(ADMIN) Log queue depth and records dropped because the log writer fell behind, on this replica."""
+    if not current_user.get("admin", False):
+        raise HTTPException(status_code=403, detail="Admin access required.")
+    return logging_config.get_stats()
+
+@router.get("/scheduler")
+async def get_llm_scheduler_stats(
+    current_user: Dict = Depends(security_service.get_current_user)
+):
+    """(ADMIN) Queue depth, in-flight calls and slot wait times per LLM provider and model on this replica."""
+    if not current_user.get("admin", False):
+        raise HTTPException(status_code=403, detail="Admin access required.")
+    return llm_scheduler.get_stats()
+
+@router.get("/circuit-breakers")
+async def get_circuit_breaker_stats(
+    current_user: Dict = Depends(security_service.get_current_user)
+):
+    """(ADMIN) Circuit-breaker state per LLM provider and credential scope on this replica."""
+    if not current_user.get("admin", False):
+        raise HTTPException(status_code=403, detail="Admin access required.")
+    return llm_resilience.get_stats()
+
+@router.get("/hedging")
+async def get_hedging_stats(
+    current_user: Dict = Depends(security_service.get_current_user)
+):
+    """(ADMIN) Rolling latency percentiles, hedge thresholds and hedge counts per model on this replica."""
+    if not current_user.get("admin", False):
+        raise HTTPException(status_code=403, detail="Admin access required.")
+    return llm_hedging.get_stats()
+
 # V-- THIS IS PART 2 OF THE FIX --V
 # The original function was failing because it called a transactional
 # database function without creating and passing in a transaction.
@@ -1,16 +1,18 @@
 # app/routers/prompts.py
-from fastapi import APIRouter, Depends, HTTPException, Response
-from typing import List, Dict
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
+from typing import List, Dict, Literal, Optional
 from google.cloud.firestore_v1.async_client import AsyncClient
 
 # Your own project's imports
 from app.core.db import get_firestore_client
-from app.services import firestore_service, llm_service, security_service
+from app.core.streaming import ndjson_response, sse_response, event_stream_response
+from app.services import batch_service, firestore_service, job_queue, llm_service, security_service
 from app.schemas.prompt import (
     Prompt, PromptCreate, PromptUpdate, PromptVersion, PromptVersionCreate,
+    PromptPage, PromptVersionPage,
     PromptExecuteRequest, PromptExecution, APEOptimizeRequest, APEOptimizeResponse,
     BenchmarkRequest, BenchmarkResponse, DiagnoseRequest, DiagnoseResponse,
-    BreakdownRequest, BreakdownResponse
+    BreakdownRequest, BreakdownResponse, BatchJobCreate, BatchJob, BatchJobResultPage, JobAccepted
 )
 
 router = APIRouter(
@@ -33,19 +35,43 @@ async def create_new_prompt(
 
 @router.get("/", response_model=List[Prompt])
 async def get_all_prompts_for_user(
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    start_after: Optional[str] = Query(None, description="ID of the last prompt from the previous page."),
+    stream: bool = Query(False, description="Stream the prompts as NDJSON instead of a JSON array."),
     current_user: Dict = get_current_user_dependency
 ):
-    """(SECURE) Retrieve all prompts owned by the authenticated user."""
+    """(SECURE) Retrieve prompts owned by the authenticated user, newest first."""
     user_id = current_user["uid"]
-    return await firestore_service.list_prompts_for_user(user_id)
+    try:
+        if stream:
+            items = await firestore_service.stream_prompts_for_user(user_id, limit=limit, start_after=start_after)
+            return ndjson_response(items, Prompt)
+        return await firestore_service.list_prompts_for_user(user_id, limit=limit, start_after=start_after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/page", response_model=PromptPage)
+async def get_prompts_page_for_user(
+    page_size: int = Query(firestore_service.DEFAULT_PAGE_SIZE, ge=1, le=firestore_service.MAX_PAGE_SIZE),
+    page_token: Optional[str] = None,
+    current_user: Dict = get_current_user_dependency
+):
+    """(SECURE) Retrieve one page of the authenticated user's prompts with an opaque next-page token."""
+    try:
+        items, next_token = await firestore_service.list_prompts_page(current_user["uid"], page_size, page_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PromptPage(items=items, next_page_token=next_token)
 
 @router.get("/{prompt_id}", response_model=Prompt)
 async def get_single_prompt(
     prompt_id: str,
+    request: Request,
     _ = prompt_owner_or_admin_dependency
 ):
     """(SECURE) Retrieve a single prompt by ID. Requires ownership."""
-    prompt = await firestore_service.get_prompt_by_id(prompt_id)
+    snapshot = security_service.get_request_snapshot(request, "prompts", prompt_id)
+    prompt = await firestore_service.get_prompt_by_id(prompt_id, snapshot=snapshot)
     if not prompt:
         raise HTTPException(status_code=404, detail="Prompt not found")
     return prompt
@@ -54,10 +80,12 @@ async def get_single_prompt(
 async def update_single_prompt(
     prompt_id: str,
     prompt_update: PromptUpdate,
+    request: Request,
     _ = prompt_owner_or_admin_dependency
 ):
     """(SECURE) Update a prompt's metadata. Requires ownership."""
-    updated_prompt = await firestore_service.update_prompt_by_id(prompt_id, prompt_update)
+    snapshot = security_service.get_request_snapshot(request, "prompts", prompt_id)
+    updated_prompt = await firestore_service.update_prompt_by_id(prompt_id, prompt_update, snapshot=snapshot)
     if not updated_prompt:
         raise HTTPException(status_code=404, detail="Prompt not found")
     return updated_prompt
@@ -65,20 +93,39 @@ async def update_single_prompt(
 @router.delete("/{prompt_id}", status_code=204)
 async def delete_single_prompt(
     prompt_id: str,
+    request: Request,
     _ = prompt_owner_or_admin_dependency
 ):
     """(SECURE) Delete a prompt by ID. Requires ownership."""
-    await firestore_service.delete_prompt_by_id(prompt_id)
+    snapshot = security_service.get_request_snapshot(request, "prompts", prompt_id)
+    await firestore_service.delete_prompt_by_id(prompt_id, snapshot=snapshot)
     return Response(status_code=204)
 
 @router.get("/{prompt_id}/versions", response_model=List[PromptVersion], tags=["Versioning"])
 async def get_prompt_versions(
     prompt_id: str,
+    stream: bool = Query(False, description="Stream versions as NDJSON instead of a JSON array."),
     _ = prompt_owner_or_admin_dependency
 ):
     """(SECURE) List all versions of a specific prompt. Requires ownership."""
+    if stream:
+        return ndjson_response(firestore_service.stream_prompt_versions(prompt_id), PromptVersion)
     return await firestore_service.list_prompt_versions(prompt_id)
 
+@router.get("/{prompt_id}/versions/page", response_model=PromptVersionPage, tags=["Versioning"])
+async def get_prompt_versions_page(
+    prompt_id: str,
+    page_size: int = Query(firestore_service.DEFAULT_PAGE_SIZE, ge=1, le=firestore_service.MAX_PAGE_SIZE),
+    page_token: Optional[str] = None,
+    _ = prompt_owner_or_admin_dependency
+):
+    """(SECURE) List one page of a prompt's versions, oldest first. Requires ownership."""
+    try:
+        items, next_token = await firestore_service.list_prompt_versions_page(prompt_id, page_size, page_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PromptVersionPage(items=items, next_page_token=next_token)
+
 
 # V-- THIS IS THE CORRECTED FUNCTION --V
 @router.post("/{prompt_id}/versions", response_model=PromptVersion, status_code=201, tags=["Versioning"])
@@ -110,22 +157,86 @@ async def create_new_version_for_prompt(
 async def execute_prompt_with_llm(request: PromptExecuteRequest):
     return await llm_service.execute_platform_prompt(request=request)
 
-@router.post("/optimize", response_model=APEOptimizeResponse, tags=["APE"])
-async def optimize_prompt_with_ape(request: APEOptimizeRequest):
+@router.post("/execute/stream", tags=["Execution"])
+async def stream_prompt_with_llm(request: PromptExecuteRequest):
+    """Streams the completion as Server-Sent Events: `token` deltas, then a final `done` summary."""
+    return sse_response(llm_service.stream_platform_prompt(request=request))
+
+@router.post("/optimize", response_model=APEOptimizeResponse, tags=["APE"], responses={202: {"model": JobAccepted}})
+async def optimize_prompt_with_ape(
+    request: APEOptimizeRequest,
+    mode: Literal["sync", "async"] = Query("sync", description=job_queue.MODE_DESCRIPTION)
+):
+    if mode == "async":
+        return job_queue.accepted_response(await job_queue.enqueue("optimize", request))
     result_dict = await llm_service.generate_optimized_prompt(request)
     return APEOptimizeResponse(**result_dict)
 
 @router.post("/benchmark", response_model=BenchmarkResponse, tags=["Benchmark"])
-async def benchmark_prompt_performance(request: BenchmarkRequest):
+async def benchmark_prompt_performance(
+    request: BenchmarkRequest,
+    http_request: Request,
+    stream: bool = Query(False, description="Stream each model's result as it completes (NDJSON, or SSE with Accept: text/event-stream).")
+):
+    if stream:
+        return event_stream_response(http_request, llm_service.stream_benchmark_prompt(request))
     results = await llm_service.benchmark_prompt(request)
     return BenchmarkResponse(results=results)
 
-@router.post("/diagnose", response_model=DiagnoseResponse, tags=["Analysis"])
-async def diagnose_prompt_quality(request: DiagnoseRequest):
+@router.post("/diagnose", response_model=DiagnoseResponse, tags=["Analysis"], responses={202: {"model": JobAccepted}})
+async def diagnose_prompt_quality(
+    request: DiagnoseRequest,
+    mode: Literal["sync", "async"] = Query("sync", description=job_queue.MODE_DESCRIPTION)
+):
+    if mode == "async":
+        return job_queue.accepted_response(await job_queue.enqueue("diagnose", request))
     diagnosis_result = await llm_service.diagnose_prompt(request)
     return DiagnoseResponse(**diagnosis_result)
 
-@router.post("/breakdown", response_model=BreakdownResponse, tags=["Analysis"])
-async def breakdown_prompt_structure(request: BreakdownRequest):
+@router.post("/breakdown", response_model=BreakdownResponse, tags=["Analysis"], responses={202: {"model": JobAccepted}})
+async def breakdown_prompt_structure(
+    request: BreakdownRequest,
+    mode: Literal["sync", "async"] = Query("sync", description=job_queue.MODE_DESCRIPTION)
+):
+    if mode == "async":
+        return job_queue.accepted_response(await job_queue.enqueue("breakdown", request))
     breakdown_result = await llm_service.breakdown_prompt(request)
-    return BreakdownResponse(**breakdown_result)
\ No newline at end of file
+    return BreakdownResponse(**breakdown_result)
+
+# === Batch Jobs (Secure) ===
+
+@router.post("/batch", response_model=BatchJob, status_code=202, tags=["Batch"])
+async def create_batch_job(
+    request: BatchJobCreate,
+    current_user: Dict = get_current_user_dependency
+):
+    """(SECURE) Queues an offline evaluation of many (model, prompt) items. Poll the job for progress."""
+    items = [item.model_dump() for item in request.items]
+    return await batch_service.create_batch_job(current_user["uid"], items)
+
+@router.get("/batch/{job_id}", response_model=BatchJob, tags=["Batch"])
+async def get_batch_job(
+    job_id: str,
+    current_user: Dict = get_current_user_dependency
+):
+    """(SECURE) Status and progress counters of one of the caller's batch jobs."""
+    job = await firestore_service.get_batch_job(job_id, current_user["uid"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found.")
+    return job
+
+@router.get("/batch/{job_id}/results", response_model=BatchJobResultPage, tags=["Batch"])
+async def get_batch_job_results(
+    job_id: str,
+    page_size: int = Query(firestore_service.DEFAULT_PAGE_SIZE, ge=1, le=firestore_service.MAX_PAGE_SIZE),
+    page_token: Optional[str] = None,
+    current_user: Dict = get_current_user_dependency
+):
+    """(SECURE) One page of a batch job's results in submission order; unfinished items are `pending`."""
+    if await firestore_service.get_batch_job(job_id, current_user["uid"]) is None:
+        raise HTTPException(status_code=404, detail="Batch job not found.")
+    try:
+        items, next_token = await firestore_service.list_batch_results_page(job_id, page_size, page_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return BatchJobResultPage(items=items, next_page_token=next_token)
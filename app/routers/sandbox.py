@@ -1,7 +1,8 @@
 # app/routers/sandbox.py
-from fastapi import APIRouter, Depends, status # Add status
-from typing import Dict, Any
-from app.services import llm_service, security_service
+from fastapi import APIRouter, Depends, Query, Request, status # Add status
+from typing import Dict, Any, Literal
+from app.core.streaming import event_stream_response
+from app.services import job_queue, llm_service, security_service
 from app.schemas.prompt import (
     PromptComposeRequest,
     PromptComposeResponse,
@@ -10,7 +11,8 @@ from app.schemas.prompt import (
     RecommendResponse,
     SandboxRequest,
     SandboxResponse,
-    PromptTemplate # Import the correct response model
+    PromptTemplate, # Import the correct response model
+    JobAccepted
 )
 
 router = APIRouter(
@@ -23,25 +25,39 @@ async def compose_prompt_from_template(request: PromptComposeRequest):
     return await llm_service.compose_prompt(request)
 
 # FIX: Correct the response_model, status_code, and the service function call.
-@router.post("/generate-template", response_model=PromptTemplate, status_code=status.HTTP_201_CREATED)
+@router.post("/generate-template", response_model=PromptTemplate, status_code=status.HTTP_201_CREATED, responses={202: {"model": JobAccepted}})
 async def generate_template_from_prompt(
     request: TemplateGenerateRequest,
     # Add the user dependency, as creating a template requires an owner.
-    current_user: Dict[str, Any] = Depends(security_service.get_current_user)
+    current_user: Dict[str, Any] = Depends(security_service.get_current_user),
+    mode: Literal["sync", "async"] = Query("sync", description=job_queue.MODE_DESCRIPTION)
 ):
     """(SECURE) Generates and stores a new template using an LLM."""
+    if mode == "async":
+        return job_queue.accepted_response(await job_queue.enqueue("generate_template", request, current_user))
     # Call the correct function name from the llm_service.
     created_template = await llm_service.generate_and_store_template(request, current_user)
     return created_template
 
-@router.post("/recommend-templates", response_model=RecommendResponse)
-async def recommend_templates_for_prompt(request: RecommendRequest):
+@router.post("/recommend-templates", response_model=RecommendResponse, responses={202: {"model": JobAccepted}})
+async def recommend_templates_for_prompt(
+    request: RecommendRequest,
+    mode: Literal["sync", "async"] = Query("sync", description=job_queue.MODE_DESCRIPTION)
+):
     """(PUBLIC) Recommends the top 3 templates for a given prompt."""
+    if mode == "async":
+        return job_queue.accepted_response(await job_queue.enqueue("recommend_templates", request))
     recommendations = await llm_service.recommend_templates(request)
     return RecommendResponse(recommendations=recommendations)
 
 @router.post("/run", response_model=SandboxResponse)
-async def run_sandbox_comparison(request: SandboxRequest):
+async def run_sandbox_comparison(
+    request: SandboxRequest,
+    http_request: Request,
+    stream: bool = Query(False, description="Stream each prompt's result as it completes (NDJSON, or SSE with Accept: text/event-stream).")
+):
     """(PUBLIC) Runs a side-by-side comparison of multiple prompts."""
+    if stream:
+        return event_stream_response(http_request, llm_service.stream_sandbox_test(request))
     results = await llm_service.run_sandbox_test(request)
     return SandboxResponse(results=results)
\ No newline at end of file
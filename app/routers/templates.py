@@ -1,8 +1,9 @@
 # app/routers/templates.py
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Dict
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from typing import List, Dict, Optional
+from app.core.streaming import ndjson_response
 from app.services import firestore_service, security_service
-from app.schemas.prompt import PromptTemplate, PromptTemplateCreate, PromptTemplateUpdate
+from app.schemas.prompt import PromptTemplate, PromptTemplateCreate, PromptTemplateUpdate, PromptTemplatePage
 
 router = APIRouter(
     tags=["Templates"],
@@ -24,12 +25,31 @@ async def create_new_template(
 # --- FIX 1: Secure the LIST endpoint ---
 @router.get("/", response_model=List[PromptTemplate])
 async def get_all_templates(
+    stream: bool = Query(False, description="Stream templates as NDJSON instead of a JSON array."),
     current_user: Dict = Depends(security_service.get_current_user)
 ):
     """(SECURE) Retrieves all prompt templates for the current user."""
+    if stream:
+        return ndjson_response(firestore_service.stream_templates(user_id=current_user["uid"]), PromptTemplate)
     # Pass the user_id to the now-secure service function
     templates = await firestore_service.list_templates(user_id=current_user["uid"])
     return templates
+
+@router.get("/page", response_model=PromptTemplatePage)
+async def get_templates_page(
+    page_size: int = Query(firestore_service.DEFAULT_PAGE_SIZE, ge=1, le=firestore_service.MAX_PAGE_SIZE),
+    page_token: Optional[str] = None,
+    tag: Optional[str] = None,
+    current_user: Dict = Depends(security_service.get_current_user)
+):
+    """(SECURE) Retrieves one page of the current user's templates with an opaque next-page token."""
+    try:
+        items, next_token = await firestore_service.list_templates_page(
+            current_user["uid"], tag=tag, page_size=page_size, page_token=page_token
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PromptTemplatePage(items=items, next_page_token=next_token)
 # --- END FIX 1 ---
 
 # --- FIX 2: Secure the GET SINGLE endpoint ---
@@ -68,6 +88,7 @@ async def get_single_template_trailing_slash(template_id: str):
 async def update_single_template(
     template_id: str,
     template_update: PromptTemplateUpdate,
+    request: Request,
     _ = Depends(template_owner_or_admin_dependency) # This check is working per your tests
 ):
     """(SECURE) Updates a single prompt template. Requires ownership or admin role."""
@@ -77,7 +98,8 @@ async def update_single_template(
     except AttributeError:
         update_data = template_update.dict(exclude_unset=True) # Fallback for Pydantic v1
         
-    updated_template = await firestore_service.update_template_by_id(template_id, update_data)
+    snapshot = security_service.get_request_snapshot(request, "prompt_templates", template_id)
+    updated_template = await firestore_service.update_template_by_id(template_id, update_data, snapshot=snapshot)
     if not updated_template:
         raise HTTPException(status_code=404, detail="Template not found")
     return updated_template
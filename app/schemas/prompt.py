@@ -77,6 +77,18 @@ class PromptExecuteRequest(BaseModel):
 
 PromptExecuteResponse = PromptExecution
 
+class PromptExecutionStreamSummary(BaseModel):
+    """Payload of the final `done` event of a streamed execution."""
+    id: str
+    prompt_version_id: str
+    model: str
+    executed_at: datetime
+    input_token_count: int
+    output_token_count: int
+    cost: float
+    time_to_first_token_ms: int
+    latency_ms: int
+
 # --- Managed Execution Schemas ---
 class ManagedExecutionRequest(BaseModel):
     user_id: str = Field(..., example="some_firebase_user_id")
@@ -181,7 +193,7 @@ class PromptComposeResponse(BaseModel):
 # --- Sandbox & Benchmark Schemas ---
 class BenchmarkRequest(BaseModel):
     prompt_text: str = Field(..., example="Write a short story about a robot who discovers music.")
-    models: List[str] = Field(..., example=["gemini-2.5-flash-lite", "gpt-4o-mini"])
+    models: List[str] = Field(..., max_length=20, example=["gemini-2.5-flash-lite", "gpt-4o-mini"])
 
 class BenchmarkResult(BaseModel):
     model_name: str
@@ -193,12 +205,17 @@ class BenchmarkResult(BaseModel):
 class BenchmarkResponse(BaseModel):
     results: List[BenchmarkResult]
 
+class BenchmarkStreamError(BaseModel):
+    """Streamed in place of a BenchmarkResult when one model fails."""
+    model_name: str
+    error: str
+
 class SandboxPromptInput(BaseModel):
     id: str = Field(..., description="A unique identifier for this prompt, e.g., 'prompt_v1'.")
     text: str
 
 class SandboxRequest(BaseModel):
-    prompts: List[SandboxPromptInput]
+    prompts: List[SandboxPromptInput] = Field(..., max_length=50)
     input_text: str
     model: str = Field(..., example="gemini-2.5-flash-lite")
 
@@ -209,9 +226,54 @@ class SandboxResult(BaseModel):
     input_token_count: Optional[int] = None
     output_token_count: Optional[int] = None
 
+class SandboxStreamError(BaseModel):
+    """Streamed in place of a SandboxResult when one prompt fails."""
+    prompt_id: str
+    error: str
+
+class StreamCompleted(BaseModel):
+    """Final event of a streamed benchmark or sandbox run."""
+    completed: int
+    failed: int
+
 class SandboxResponse(BaseModel):
     results: List[SandboxResult]
 
+# --- Batch Job Schemas ---
+class BatchJobItem(BaseModel):
+    model: str = Field(..., example="gpt-4o-mini")
+    prompt_text: str = Field(..., example="Explain quantum computing in simple terms.")
+    custom_id: Optional[str] = Field(None, max_length=64, description="Caller's own ID, echoed back in the results.")
+
+class BatchJobCreate(BaseModel):
+    items: List[BatchJobItem] = Field(..., min_length=1, max_length=10000)
+
+class BatchJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class BatchJob(BaseModel):
+    id: str
+    status: BatchJobStatus
+    total: int
+    completed: int = 0
+    failed: int = 0
+    created_at: datetime
+    updated_at: datetime
+    error: Optional[str] = None
+
+class BatchJobResult(BaseModel):
+    index: int
+    custom_id: Optional[str] = None
+    model: str
+    status: str = Field(..., description="pending, succeeded or failed")
+    generated_text: Optional[str] = None
+    input_token_count: Optional[int] = None
+    output_token_count: Optional[int] = None
+    error: Optional[str] = None
+
 class RecommendRequest(BaseModel):
     task_description: str = Field(..., example="I need to write a professional email to a client.")
 
@@ -222,6 +284,30 @@ class RecommendedTemplate(BaseModel):
 class RecommendResponse(BaseModel):
     recommendations: List[RecommendedTemplate]
 
+# --- Background Job Schemas ---
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class JobAccepted(BaseModel):
+    """Returned with 202 by endpoints called with `mode=async`."""
+    job_id: str
+    status: JobStatus
+    status_url: str
+    events_url: str
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    status: JobStatus
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Any] = Field(None, description="The endpoint's normal response body, once succeeded.")
+    error: Optional[Dict[str, Any]] = Field(None, description="`status_code` and `detail`, once failed.")
+
 # --- Metrics & Analytics Schemas ---
 class CostCalculationRequest(BaseModel):
     model_name: str = Field(..., example="gemini-2.5-flash-lite")
@@ -248,6 +334,7 @@ class RecentActivity(BaseModel):
     version: int
     commit_message: str
     created_at: datetime
+    activity_type: str = "version"
     model_config = ConfigDict(
         populate_by_name=True,
         json_encoders={datetime: lambda v: v.isoformat()}
@@ -256,4 +343,24 @@ class RecentActivity(BaseModel):
 class RatingCreate(BaseModel):
     prompt_id: str
     version_number: int
-    rating: int = Field(..., ge=1, le=5)
\ No newline at end of file
+    rating: int = Field(..., ge=1, le=5)
+# --- Pagination Schemas ---
+class PromptPage(BaseModel):
+    items: List[Prompt]
+    next_page_token: Optional[str] = None
+
+class PromptVersionPage(BaseModel):
+    items: List[PromptVersion]
+    next_page_token: Optional[str] = None
+
+class PromptTemplatePage(BaseModel):
+    items: List[PromptTemplate]
+    next_page_token: Optional[str] = None
+
+class PromptSummaryPage(BaseModel):
+    items: List[PromptSummary]
+    next_page_token: Optional[str] = None
+
+class BatchJobResultPage(BaseModel):
+    items: List[BatchJobResult]
+    next_page_token: Optional[str] = None
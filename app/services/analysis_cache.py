@@ -0,0 +1,73 @@
+# app/services/analysis_cache.py
+import os
+import copy
+import json
+import hashlib
+import unicodedata
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict
+
+from pydantic import BaseModel
+
+from app.core import singleflight
+from app.core.cache import TTLCache
+
+# --- Configuration ---
+# Meta-prompt analyses (diagnose, breakdown, optimize) are cached in process by a hash of
+# the endpoint, its meta-prompt version, the model and the normalized request. Bumping an
+# endpoint's version in llm_service.META_PROMPT_VERSIONS retires its old entries. Failed
+# analyses are never cached, and identical concurrent requests share one provider call.
+ANALYSIS_CACHE_TTL_SECONDS = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "86400"))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+
+_cache = TTLCache(maxsize=ANALYSIS_CACHE_MAX_ENTRIES, ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS)
+stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+def normalize_text(text: str) -> str:
+    """Unicode NFC, LF line endings, no trailing whitespace on lines or around the text. Line structure is kept."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip()
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+def cache_key(endpoint: str, version: int, model_name: str, request: BaseModel) -> str:
+    material = json.dumps(
+        {"endpoint": endpoint, "version": version, "model": model_name, "input": _normalize(request.model_dump(mode="json"))},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+async def cached(
+    endpoint: str,
+    version: int,
+    model_name: str,
+    request: BaseModel,
+    compute: Callable[[], Awaitable[dict]]
+) -> dict:
+    """Returns the cached analysis for this request, or runs `compute()` once and caches it. Errors propagate uncached."""
+    key = cache_key(endpoint, version, model_name, request)
+    result = _cache.get(key)
+    if result is not None:
+        stats[endpoint]["hits"] += 1
+    else:
+        stats[endpoint]["misses"] += 1
+        result = await singleflight.run(f"analysis:{key}", compute)
+        _cache.set(key, result)
+    # Callers get their own copy, so nothing they do can change the cached entry.
+    return copy.deepcopy(result)
+
+def get_stats() -> Dict[str, Any]:
+    """Hits, misses and hit rate per endpoint on this replica (for the metrics endpoint)."""
+    endpoints = {}
+    for endpoint, counts in stats.items():
+        total = counts["hits"] + counts["misses"]
+        endpoints[endpoint] = {**counts, "hit_rate": round(counts["hits"] / total, 4) if total else 0.0}
+    return {"entries": len(_cache), "max_entries": ANALYSIS_CACHE_MAX_ENTRIES,
+            "ttl_seconds": ANALYSIS_CACHE_TTL_SECONDS, "endpoints": endpoints}
@@ -0,0 +1,289 @@
+# app/services/batch_service.py
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import google.generativeai as genai
+
+from app.services import firestore_service, llm_resilience, llm_scheduler, llm_service
+
+# --- Configuration ---
+# Offline evaluation jobs. OpenAI items are grouped per model into Batch API submissions
+# (discounted, 24h completion window); providers without a batch endpoint wired up here
+# (Gemini) fall back to ordinary calls through the scheduler at a bounded concurrency.
+# The provider batch ID is stored on each submitted item, and a worker holds a renewed
+# lease on the job while it runs; after a restart, unfinished jobs are picked up again and
+# wait for their existing batches instead of submitting (and paying for) them twice. A
+# worker whose lease was taken over (or could not be renewed before it expired) stops
+# before its next submission, poll or result write.
+BATCH_MAX_REQUESTS_PER_SUBMISSION = int(os.getenv("BATCH_MAX_REQUESTS_PER_SUBMISSION", "50000"))
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "30"))
+BATCH_FALLBACK_CONCURRENCY = int(os.getenv("BATCH_FALLBACK_CONCURRENCY", "8"))
+# Fallback results are written to Firestore in groups of this size.
+BATCH_RESULT_FLUSH_SIZE = 100
+OPENAI_BATCH_TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+BATCH_LEASE_SECONDS = float(os.getenv("BATCH_LEASE_SECONDS", "300"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_background_tasks: set = set()
+_running_jobs: set = set()
+# job_id -> time.monotonic() until which this worker's lease is known to be valid.
+_lease_deadlines: Dict[str, float] = {}
+
+class LeaseLost(Exception):
+    """This worker no longer holds the job lease; another worker may be running the job."""
+
+def _check_lease(job_id: str):
+    if time.monotonic() >= _lease_deadlines.get(job_id, 0):
+        raise LeaseLost(f"Batch job {job_id}: job lease lost.")
+
+def _succeeded(text: str, input_tokens: int, output_tokens: int) -> Dict[str, Any]:
+    return {"status": "succeeded", "generated_text": text, "input_token_count": input_tokens,
+            "output_token_count": output_tokens, "error": None}
+
+def _failed(error: str) -> Dict[str, Any]:
+    return {"status": "failed", "error": error}
+
+# --- OpenAI Batch API ---
+def _openai_batch_line(item: Dict[str, Any]) -> str:
+    return json.dumps({
+        "custom_id": item["id"],
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {"model": item["model"], "messages": [{"role": "user", "content": item["prompt_text"]}]},
+    })
+
+def _parse_openai_batch_output(content: str) -> Dict[str, Dict[str, Any]]:
+    """Maps each line of a batch output or error file to {custom_id: result}."""
+    results = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response, error = record.get("response") or {}, record.get("error")
+        body = response.get("body") or {}
+        if error or response.get("status_code") != 200:
+            message = (error or body.get("error") or {}).get("message") or f"HTTP {response.get('status_code')}"
+            results[record["custom_id"]] = _failed(message)
+            continue
+        usage = body.get("usage") or {}
+        results[record["custom_id"]] = _succeeded(
+            body["choices"][0]["message"]["content"], usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        )
+    return results
+
+async def _submit_openai_batch(client, job_id: str, model_name: str, items: List[Dict[str, Any]]) -> str:
+    _check_lease(job_id)
+    input_file = await client.files.create(
+        file=(f"{job_id}.jsonl", "\n".join(_openai_batch_line(item) for item in items).encode()), purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window="24h",
+        metadata={"job_id": job_id, "model": model_name}
+    )
+    await firestore_service.set_batch_items_submission(job_id, [item["id"] for item in items], batch.id)
+    logging.info(f"Batch job {job_id}: submitted {len(items)} {model_name} items as OpenAI batch {batch.id}.")
+    return batch.id
+
+async def _wait_for_openai_batch(client, job_id: str, model_name: str, batch_id: str):
+    """Polls until the batch reaches a terminal state. Transient poll errors are retried, never fatal."""
+    while True:
+        _check_lease(job_id)
+        try:
+            # Its own breaker scope, so a flaky poll does not trip interactive platform calls.
+            batch = await llm_resilience.call(model_name, lambda: client.batches.retrieve(batch_id), scope="batch")
+            if batch.status in OPENAI_BATCH_TERMINAL_STATES:
+                return batch
+        except llm_resilience.ProviderUnavailable as e:
+            logging.warning(f"Polling OpenAI batch {batch_id} failed, will retry: {e}")
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+
+async def _run_openai_batch(
+    job_id: str,
+    model_name: str,
+    items: List[Dict[str, Any]],
+    batch_id: Optional[str] = None
+) -> Dict[str, Dict[str, Any]]:
+    """Submits one OpenAI batch (or attaches to `batch_id` if it was already submitted), waits for it and returns {item_id: result}."""
+    client = llm_service.platform_openai_client
+    if client is None:
+        return {item["id"]: _failed("OpenAI client is not configured.") for item in items}
+    if batch_id is None:
+        batch_id = await _submit_openai_batch(client, job_id, model_name, items)
+    else:
+        logging.info(f"Batch job {job_id}: resuming {len(items)} {model_name} items in OpenAI batch {batch_id}.")
+    batch = await _wait_for_openai_batch(client, job_id, model_name, batch_id)
+
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            content = await llm_resilience.call(model_name, lambda: client.files.content(file_id), scope="batch")
+            results.update(_parse_openai_batch_output(content.text))
+    missing = f"OpenAI batch {batch.id} ended with status '{batch.status}' without a result for this item."
+    return {item["id"]: results.get(item["id"], _failed(missing)) for item in items}
+
+# --- Fallback: individual calls ---
+async def _call_one(item: Dict[str, Any]) -> Dict[str, Any]:
+    model_name, prompt_text = item["model"], item["prompt_text"]
+    try:
+        async with llm_scheduler.slot(model_name, prompt_text) as slot:
+            if model_name.startswith("gemini"):
+                client = genai.GenerativeModel(model_name)
+                text, input_tokens, output_tokens = await llm_resilience.call(
+                    model_name, lambda: llm_service._call_gemini_with_client(client, prompt_text))
+            else:
+                text, input_tokens, output_tokens = await llm_resilience.call(
+                    model_name, lambda: llm_service._call_openai_with_client(llm_service.platform_openai_client, model_name, prompt_text))
+            slot.record_usage(input_tokens, output_tokens)
+        return _succeeded(text, input_tokens, output_tokens)
+    except Exception as e:
+        return _failed(str(e))
+
+async def _run_concurrently(job_id: str, items: List[Dict[str, Any]]):
+    """Runs items as individual calls, saving results in groups as they complete."""
+    semaphore = asyncio.Semaphore(BATCH_FALLBACK_CONCURRENCY)
+    pending: Dict[str, Dict[str, Any]] = {}
+
+    async def run(item):
+        async with semaphore:
+            _check_lease(job_id)
+            return item["id"], await _call_one(item)
+
+    calls = [asyncio.create_task(run(item)) for item in items]
+    try:
+        for next_result in asyncio.as_completed(calls):
+            item_id, result = await next_result
+            pending[item_id] = result
+            if len(pending) >= BATCH_RESULT_FLUSH_SIZE:
+                _check_lease(job_id)
+                await firestore_service.save_batch_results(job_id, pending)
+                pending = {}
+        if pending:
+            _check_lease(job_id)
+            await firestore_service.save_batch_results(job_id, pending)
+    finally:
+        for call in calls:
+            call.cancel()
+
+async def _run_submission(job_id: str, model_name: str, items: List[Dict[str, Any]], batch_id: Optional[str] = None):
+    try:
+        results = await _run_openai_batch(job_id, model_name, items, batch_id)
+    except LeaseLost:
+        raise
+    except Exception as e:
+        logging.error(f"Batch job {job_id}: OpenAI batch submission for {model_name} failed: {e}")
+        results = {item["id"]: _failed(f"Batch submission failed: {e}") for item in items}
+    _check_lease(job_id)
+    await firestore_service.save_batch_results(job_id, results)
+
+# --- Worker ---
+async def _renew_lease(job_id: str, work: asyncio.Task):
+    """Keeps the lease's deadline current; cancels `work` once the lease is gone."""
+    while True:
+        await asyncio.sleep(BATCH_LEASE_SECONDS / 3)
+        renewed_at = time.monotonic()
+        try:
+            if await firestore_service.claim_batch_job(job_id, WORKER_ID, BATCH_LEASE_SECONDS):
+                _lease_deadlines[job_id] = renewed_at + BATCH_LEASE_SECONDS
+                continue
+            logging.warning(f"Batch job {job_id}: lost the job lease to another worker; stopping.")
+            _lease_deadlines[job_id] = 0
+        except Exception as e:
+            logging.warning(f"Batch job {job_id}: could not renew the job lease: {e}")
+            if renewed_at < _lease_deadlines.get(job_id, 0):
+                continue
+            logging.warning(f"Batch job {job_id}: the job lease expired before it could be renewed; stopping.")
+        work.cancel()
+        return
+
+async def run_batch_job(job_id: str):
+    """
+    Processes every pending item of a job. Safe to re-run: items that already have a result
+    are skipped, and items already submitted to an OpenAI batch wait for that batch.
+    Does nothing if the job is finished or another worker holds its lease, and stops
+    without touching the job if the lease is lost part-way through.
+    """
+    claimed_at = time.monotonic()
+    if not await firestore_service.claim_batch_job(job_id, WORKER_ID, BATCH_LEASE_SECONDS):
+        return
+    _lease_deadlines[job_id] = claimed_at + BATCH_LEASE_SECONDS
+    work = asyncio.create_task(_process_batch_job(job_id))
+    lease = asyncio.create_task(_renew_lease(job_id, work))
+    try:
+        await work
+    except (LeaseLost, asyncio.CancelledError) as e:
+        if lease.done() or isinstance(e, LeaseLost):
+            # The job belongs to whichever worker holds the lease now; leave its status alone.
+            logging.warning(f"Batch job {job_id}: stopped after losing the job lease.")
+            return
+        work.cancel()
+        raise
+    except Exception as e:
+        logging.error(f"Batch job {job_id} failed: {e}")
+        await firestore_service.update_batch_job(job_id, status="failed", error=str(e))
+        return
+    finally:
+        lease.cancel()
+        _lease_deadlines.pop(job_id, None)
+    await firestore_service.update_batch_job(job_id, status="completed")
+
+async def _process_batch_job(job_id: str):
+    await firestore_service.update_batch_job(job_id, status="running")
+    items = await firestore_service.list_pending_batch_items(job_id)
+    submitted: Dict[tuple, List[Dict[str, Any]]] = {}
+    by_model: Dict[str, List[Dict[str, Any]]] = {}
+    fallback = []
+    for item in items:
+        if llm_scheduler.provider_for_model(item["model"]) != "openai":
+            fallback.append(item)
+        elif item.get("openai_batch_id"):
+            submitted.setdefault((item["model"], item["openai_batch_id"]), []).append(item)
+        else:
+            by_model.setdefault(item["model"], []).append(item)
+
+    work = [_run_concurrently(job_id, fallback)] if fallback else []
+    for (model_name, batch_id), batch_items in submitted.items():
+        work.append(_run_submission(job_id, model_name, batch_items, batch_id))
+    for model_name, model_items in by_model.items():
+        for start in range(0, len(model_items), BATCH_MAX_REQUESTS_PER_SUBMISSION):
+            work.append(_run_submission(job_id, model_name, model_items[start:start + BATCH_MAX_REQUESTS_PER_SUBMISSION]))
+    tasks = [asyncio.create_task(part) for part in work]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # A LeaseLost in one part stops the others instead of leaving them running.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _start(job_id: str):
+    if job_id in _running_jobs:
+        return
+    _running_jobs.add(job_id)
+    task = asyncio.create_task(run_batch_job(job_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(lambda _: _running_jobs.discard(job_id))
+
+async def create_batch_job(user_id: str, items: List[Dict[str, Any]]) -> dict:
+    """Stores the job and starts processing it in the background on this replica."""
+    job = await firestore_service.create_batch_job(user_id, items)
+    _start(job["id"])
+    return job
+
+async def run_job_resumer():
+    """
+    Every BATCH_LEASE_SECONDS, starts unfinished jobs not running on this replica. Runs on
+    every replica; the job lease lets exactly one of them pick up a job whose worker died.
+    """
+    while True:
+        try:
+            for job_id in await firestore_service.list_unfinished_batch_job_ids():
+                _start(job_id)
+        except Exception as e:
+            logging.error(f"Could not list unfinished batch jobs: {e}")
+        await asyncio.sleep(BATCH_LEASE_SECONDS)
@@ -1,12 +1,18 @@
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from google.cloud.firestore_v1.async_client import AsyncClient
 from google.cloud.firestore_v1.async_transaction import AsyncTransaction
 from google.cloud.firestore_v1.base_query import FieldFilter
 from google.cloud import firestore
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator, Callable, Tuple
 import asyncio
+import base64
+import json
+import os
+import random
 
+from app.core import redis_client
+from app.core.cache import TTLCache
 from app.core.db import db
 from app.schemas.prompt import (
     PromptCreate,
@@ -17,13 +23,60 @@ from app.schemas.prompt import (
     PromptComposeRequest,
     Prompt
 )
-from app.services.security_service import encrypt_key, decrypt_key
+from app.services.security_service import encrypt_key, decrypt_key, invalidate_owner
 
 # --- Constants ---
 PROMPTS_COLLECTION = "prompts"
 PROMPT_TEMPLATES_COLLECTION = "prompt_templates"
 USERS_COLLECTION = "users"
 RATINGS_COLLECTION = "ratings"
+RATING_VOTES_SUBCOLLECTION = "rating_votes"
+RATING_SHARDS_SUBCOLLECTION = "rating_shards"
+ACTIVITY_SUBCOLLECTION = "activity"
+CREDENTIALS_SUBCOLLECTION = "credentials"
+BATCH_JOBS_COLLECTION = "batch_jobs"
+BATCH_ITEMS_SUBCOLLECTION = "items"
+
+# --- Activity Feed Settings ---
+# Each user has a denormalized feed at users/{uid}/activity, written in the same batch or
+# transaction as the primary write. Entries carry an `expires_at` field for the Firestore
+# TTL policy (see firestore.indexes.json) and feeds are trimmed to ACTIVITY_FEED_MAX_ITEMS.
+ACTIVITY_FEED_MAX_ITEMS = 200
+ACTIVITY_TTL_DAYS = 90
+
+# --- Rating Counter Sharding ---
+# With RATING_SHARD_COUNT > 0, ratings increment one of N shard documents under
+# prompts/{id}/rating_shards instead of rewriting the prompt document, which avoids the
+# per-document write limit on hot prompts. A background compactor periodically folds the
+# shards back onto the prompt so list endpoints and PromptSummary readers stay unchanged.
+RATING_SHARD_COUNT = int(os.getenv("RATING_SHARD_COUNT", "0"))
+RATING_COMPACT_INTERVAL_SECONDS = float(os.getenv("RATING_COMPACT_INTERVAL_SECONDS", "30"))
+
+# --- Decrypted API Key Cache ---
+# Managed executions need the caller's provider key before any LLM work; caching the
+# decrypted key skips a Firestore read and a Fernet decrypt per call. Keys are held as
+# bytearrays and overwritten with zeros when they leave the cache. save_user_api_key
+# invalidates locally and publishes the change on API_KEY_INVALIDATION_CHANNEL (Redis) for
+# the other replicas. Keys are only cached while this replica is subscribed to that
+# channel, so a lost Redis connection cannot leave a rotated key cached for the full TTL.
+API_KEY_CACHE_TTL_SECONDS = float(os.getenv("API_KEY_CACHE_TTL_SECONDS", "300"))
+API_KEY_CACHE_MAX_ENTRIES = int(os.getenv("API_KEY_CACHE_MAX_ENTRIES", "1000"))
+API_KEY_INVALIDATION_CHANNEL = "promptforge:api_key_invalidations"
+# The resubscribe delay doubles up to the max while Redis stays unreachable.
+API_KEY_RESUBSCRIBE_SECONDS = 5
+API_KEY_RESUBSCRIBE_MAX_SECONDS = 60
+
+def _zero_key(key: Tuple[str, str], secret: bytearray):
+    secret[:] = bytes(len(secret))
+
+api_key_cache = TTLCache(maxsize=API_KEY_CACHE_MAX_ENTRIES, ttl_seconds=API_KEY_CACHE_TTL_SECONDS, on_evict=_zero_key)
+# The newest `updated_at` announced per key. A read that started before a save elsewhere can
+# finish after its invalidation arrived; comparing against this keeps it out of the cache.
+_api_key_versions = TTLCache(maxsize=API_KEY_CACHE_MAX_ENTRIES, ttl_seconds=API_KEY_CACHE_TTL_SECONDS)
+_api_key_invalidations_live = False
+
+# Keeps references to fire-and-forget maintenance tasks so they are not garbage collected.
+_background_tasks: set = set()
 
 # --- Helper Functions ---
 def _get_user_info(user: Dict[str, Any]) -> Dict[str, Any]:
@@ -43,6 +96,119 @@ def _serialize_datetimes(data: Dict[str, Any]) -> Dict[str, Any]:
             data[key] = value.isoformat()
     return data
 
+# --- Activity Feed Helpers ---
+def _activity_ref(user_id: str, entry_id: str):
+    """Returns the reference of a feed entry in users/{uid}/activity."""
+    return db.collection(USERS_COLLECTION).document(user_id).collection(ACTIVITY_SUBCOLLECTION).document(entry_id)
+
+def _activity_entry(
+    activity_type: str,
+    prompt_id: str,
+    prompt_name: str,
+    version_number: int,
+    commit_message: Optional[str],
+    created_at: datetime
+) -> Dict[str, Any]:
+    """Builds a feed entry document."""
+    return {
+        "activity_type": activity_type,
+        "prompt_id": prompt_id,
+        "prompt_name": prompt_name,
+        "version_number": version_number,
+        "commit_message": commit_message,
+        "created_at": created_at,
+        "expires_at": created_at + timedelta(days=ACTIVITY_TTL_DAYS)
+    }
+
+def _version_activity_id(prompt_id: str, version_number: int) -> str:
+    return f"{prompt_id}_v{version_number}"
+
+def _rating_activity_id(prompt_id: str, version_number: int) -> str:
+    return f"{prompt_id}_v{version_number}_rating"
+
+async def _trim_activity_feed(user_id: str):
+    """Deletes the oldest feed entries beyond ACTIVITY_FEED_MAX_ITEMS (best effort)."""
+    try:
+        feed_ref = db.collection(USERS_COLLECTION).document(user_id).collection(ACTIVITY_SUBCOLLECTION)
+        count_result = await feed_ref.count().get()
+        total = count_result[0][0].value
+        overflow = total - ACTIVITY_FEED_MAX_ITEMS
+        if overflow <= 0:
+            return
+        oldest = feed_ref.order_by("created_at", direction=firestore.Query.ASCENDING).limit(min(overflow, 500))
+        batch = db.batch()
+        async for doc in oldest.stream():
+            batch.delete(doc.reference)
+        await batch.commit()
+    except Exception as e:
+        logging.warning(f"--- WARNING: Could not trim activity feed for {user_id}: {e}")
+
+def _schedule_feed_trim(user_id: str):
+    """Trims the user's feed in the background so the write path does not wait on it."""
+    task = asyncio.create_task(_trim_activity_feed(user_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _owner_feed_entries_for_prompt(prompt_id: str, owner_uid: str) -> list:
+    """Returns the snapshots of all feed entries in the owner's feed that reference prompt_id."""
+    feed_ref = db.collection(USERS_COLLECTION).document(owner_uid).collection(ACTIVITY_SUBCOLLECTION)
+    query = feed_ref.where(filter=FieldFilter("prompt_id", "==", prompt_id))
+    return [doc async for doc in query.stream()]
+
+# --- Cursor Pagination Helpers ---
+# Page tokens are opaque to clients: a URL-safe base64 blob wrapping the ID of the last
+# document read. Pages are fetched with `start_after(<snapshot>)`, so each page costs
+# page_size + 2 reads (one extra row to detect the end, one for the cursor snapshot).
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def _encode_page_token(doc_id: str) -> str:
+    """Wraps a document ID into an opaque page token."""
+    return base64.urlsafe_b64encode(json.dumps({"after": doc_id}).encode()).decode().rstrip("=")
+
+def _decode_page_token(page_token: str) -> str:
+    """Unwraps a page token produced by `_encode_page_token`. Raises ValueError if malformed."""
+    try:
+        padded = page_token + "=" * (-len(page_token) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))["after"]
+    except Exception:
+        raise ValueError("Invalid page token.")
+
+async def _fetch_page(
+    query,
+    collection_ref,
+    page_size: int,
+    page_token: Optional[str],
+    to_item: Callable[[Any], Optional[dict]],
+    cursor_check: Optional[Callable[[dict], bool]] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Reads one page of `query` and returns (items, next_page_token).
+    `to_item` maps a snapshot to a response dict, or None to drop it.
+    `cursor_check` validates the cursor document (e.g. ownership) before it is used.
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    if page_token:
+        cursor_doc = await collection_ref.document(_decode_page_token(page_token)).get()
+        if not cursor_doc.exists or (cursor_check and not cursor_check(cursor_doc.to_dict())):
+            raise ValueError("Invalid page token.")
+        query = query.start_after(cursor_doc)
+
+    docs = [doc async for doc in query.limit(page_size + 1).stream()]
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+
+    items = []
+    for doc in docs:
+        try:
+            item = to_item(doc)
+            if item is not None:
+                items.append(item)
+        except Exception as e:
+            logging.warning(f"--- WARNING: Skipping malformed document {doc.id} in page: {e}")
+    next_token = _encode_page_token(docs[-1].id) if has_more and docs else None
+    return items, next_token
+
 # --- Prompt and Template Functions ---
 async def create_prompt(prompt_data: PromptCreate, user: Dict) -> dict:
     """Creates a new prompt and its initial version in a single batch."""
@@ -60,7 +226,8 @@ async def create_prompt(prompt_data: PromptCreate, user: Dict) -> dict:
         "user_id": user["uid"],
         "deleted_at": None,
         "average_rating": 0,
-        "rating_count": 0
+        "rating_count": 0,
+        "rating_sum": 0
     }
     batch.set(prompt_ref, prompt_doc_data)
 
@@ -74,44 +241,102 @@ async def create_prompt(prompt_data: PromptCreate, user: Dict) -> dict:
     }
     batch.set(version_ref, version_doc_data)
 
+    batch.set(
+        _activity_ref(user["uid"], _version_activity_id(prompt_ref.id, 1)),
+        _activity_entry("version", prompt_ref.id, prompt_data.name, 1, None, creation_time)
+    )
+
     await batch.commit()
+    _schedule_feed_trim(user["uid"])
     
     response_data = prompt_doc_data.copy()
     response_data.pop("deleted_at")
     
     return _serialize_datetimes({"id": prompt_ref.id, **response_data})
 
-# V-- THIS IS THE FINAL FIX --V
-# The Firestore query filter for user_id has proven unreliable in the container environment.
-# To guarantee data isolation, the query now fetches all non-deleted documents, and a
-# mandatory, in-memory security check is performed to filter for the correct user.
-# This pattern must be applied to ALL functions that fetch user-specific data.
-async def list_prompts_for_user(user_id: str) -> list[dict]:
-    """Fetches all non-deleted prompts for a specific user with a mandatory security filter."""
-    prompts_list = []
-    # Query for all non-deleted prompts, deliberately not filtering by user_id at the DB level.
-    query = db.collection(PROMPTS_COLLECTION).where(
-        filter=FieldFilter("deleted_at", "==", None)
+# --- Owner-Indexed Prompt Listing ---
+# The query filters on user_id at the DB level (composite index: user_id, deleted_at,
+# created_at DESC — see firestore.indexes.json), so read cost scales with the caller's
+# own prompts rather than the whole collection. The in-memory ownership check is kept
+# as a second safety layer in case the query filter is ever misconfigured.
+def _owned_prompts_query(user_id: str):
+    """Builds the owner-scoped, newest-first query over non-deleted prompts."""
+    return (
+        db.collection(PROMPTS_COLLECTION)
+        .where(filter=FieldFilter("user_id", "==", user_id))
+        .where(filter=FieldFilter("deleted_at", "==", None))
+        .order_by("created_at", direction=firestore.Query.DESCENDING)
     )
-    
-    stream = query.stream()
-    async for doc in stream:
+
+def _owned_prompt_item(doc, user_id: str) -> dict | None:
+    """Maps a prompt snapshot to a response dict, or None if it is not owned by user_id."""
+    prompt_data = doc.to_dict()
+    # SECURITY CHECK: Second layer behind the DB-level user_id filter.
+    if prompt_data.get("user_id") != user_id:
+        logging.error(f"--- SECURITY: Owner query returned foreign prompt {doc.id}; dropping it.")
+        return None
+    prompt_data["id"] = doc.id
+    # Ensure default values for frontend compatibility
+    if "average_rating" not in prompt_data:
+        prompt_data["average_rating"] = 0.0
+    if "rating_count" not in prompt_data:
+        prompt_data["rating_count"] = 0
+    return _serialize_datetimes(prompt_data)
+
+async def _owned_prompt_items(query, user_id: str) -> AsyncIterator[dict]:
+    async for doc in query.stream():
         try:
-            prompt_data = doc.to_dict()
-            # CRITICAL SECURITY CHECK: This in-memory filter is the sole guarantor of data scoping.
-            if prompt_data.get("user_id") == user_id: # Trailing 'IA' removed
-                prompt_data["id"] = doc.id
-                # Ensure default values for frontend compatibility
-                if "average_rating" not in prompt_data:
-                    prompt_data["average_rating"] = 0.0
-                if "rating_count" not in prompt_data:
-                    prompt_data["rating_count"] = 0
-                prompts_list.append(_serialize_datetimes(prompt_data))
+            item = _owned_prompt_item(doc, user_id)
+            if item is not None:
+                yield item
         except Exception as e:
             logging.warning(f"--- WARNING: Skipping malformed document {doc.id} in 'prompts': {e}")
-            
-    return prompts_list
-# ^-- END OF FIX --^
+
+async def stream_prompts_for_user(
+    user_id: str,
+    limit: Optional[int] = None,
+    start_after: Optional[str] = None
+) -> AsyncIterator[dict]:
+    """
+    Returns an iterator over non-deleted prompts for a specific user, newest first, as
+    Firestore streams them. Pass `limit` and the ID of the last prompt from the previous
+    page as `start_after` for cursor-based pagination. An invalid cursor raises ValueError
+    here, before the stream starts.
+    """
+    query = _owned_prompts_query(user_id)
+
+    if start_after:
+        cursor_doc = await db.collection(PROMPTS_COLLECTION).document(start_after).get()
+        # The cursor must be one of the caller's own prompts.
+        if not cursor_doc.exists or cursor_doc.to_dict().get("user_id") != user_id:
+            raise ValueError(f"Invalid pagination cursor: {start_after}")
+        query = query.start_after(cursor_doc)
+    if limit:
+        query = query.limit(limit)
+    return _owned_prompt_items(query, user_id)
+
+async def list_prompts_for_user(
+    user_id: str,
+    limit: Optional[int] = None,
+    start_after: Optional[str] = None
+) -> list[dict]:
+    """Fetches non-deleted prompts for a specific user, newest first (see `stream_prompts_for_user`)."""
+    return [prompt async for prompt in await stream_prompts_for_user(user_id, limit, start_after)]
+
+async def list_prompts_page(
+    user_id: str,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    page_token: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """Fetches one page of a user's prompts. Returns (prompts, next_page_token)."""
+    return await _fetch_page(
+        _owned_prompts_query(user_id),
+        db.collection(PROMPTS_COLLECTION),
+        page_size,
+        page_token,
+        to_item=lambda doc: _owned_prompt_item(doc, user_id),
+        cursor_check=lambda data: data.get("user_id") == user_id
+    )
 
 async def list_starred_prompts_for_user(user_id: str, min_rating: float = 4.0) -> list[dict]:
     """Fetches highly-rated prompts for a user with a mandatory security filter."""
@@ -134,43 +359,74 @@ async def list_starred_prompts_for_user(user_id: str, min_rating: float = 4.0) -
             logging.warning(f"--- WARNING: Skipping malformed document {doc.id} in 'starred prompts': {e}")
     return prompts_list
 
-async def get_prompt_by_id(prompt_id: str) -> dict | None:
-    """Fetches a single prompt by its ID."""
+async def _prompt_response(doc_ref, prompt_data: Dict[str, Any]) -> dict | None:
+    """Shapes a prompt document for responses; returns None for logically deleted prompts."""
+    # Ensure we don't return logically deleted prompts
+    if prompt_data.get("deleted_at") is not None:
+        return None
+    if RATING_SHARD_COUNT > 0:
+        prompt_data.update(await get_rating_totals(doc_ref, prompt_data))
+    prompt_data["id"] = doc_ref.id
+    return _serialize_datetimes(prompt_data)
+
+async def get_prompt_by_id(prompt_id: str, snapshot=None) -> dict | None:
+    """
+    Fetches a single prompt by its ID.
+    Pass `snapshot` when the caller (e.g. the ownership dependency) already read the document.
+    """
     doc_ref = db.collection(PROMPTS_COLLECTION).document(prompt_id)
-    doc = await doc_ref.get() # Extraneous 's' removed
+    doc = snapshot if snapshot is not None else await doc_ref.get() # Extraneous 's' removed
     if doc.exists:
-        prompt_data = doc.to_dict()
-        # Ensure we don't return logically deleted prompts
-        if prompt_data.get("deleted_at") is not None:
-            return None
-        prompt_data["id"] = doc.id
-        return _serialize_datetimes(prompt_data)
+        return await _prompt_response(doc_ref, doc.to_dict())
     return None
 
-async def update_prompt_by_id(prompt_id: str, prompt_data: PromptUpdate) -> dict | None:
-    """Updates a prompt's metadata."""
+async def update_prompt_by_id(prompt_id: str, prompt_data: PromptUpdate, snapshot=None) -> dict | None:
+    """
+    Updates a prompt's metadata. The response is built from the pre-update snapshot plus
+    the applied fields, so no read-back is needed.
+    """
     doc_ref = db.collection(PROMPTS_COLLECTION).document(prompt_id)
-    if not (await doc_ref.get()).exists:
+    prompt_doc = snapshot if snapshot is not None else await doc_ref.get()
+    if not prompt_doc.exists:
         return None
+    current_data = prompt_doc.to_dict()
     update_data = prompt_data.model_dump(exclude_unset=True)
     if not update_data: # Extraneous 'G' removed
-        return await get_prompt_by_id(prompt_id)
-    await doc_ref.update(update_data)
-    return await get_prompt_by_id(prompt_id)
+        return await _prompt_response(doc_ref, current_data)
+    owner_uid = current_data.get("user_id")
+    if "name" in update_data and owner_uid:
+        # Keep the denormalized prompt name in the owner's activity feed in sync.
+        batch = db.batch()
+        batch.update(doc_ref, update_data)
+        for entry in await _owner_feed_entries_for_prompt(prompt_id, owner_uid):
+            batch.update(entry.reference, {"prompt_name": update_data["name"]})
+        await batch.commit()
+    else:
+        await doc_ref.update(update_data)
+    return await _prompt_response(doc_ref, {**current_data, **update_data})
 
-async def delete_prompt_by_id(prompt_id: str):
-    """Logically deletes a prompt by setting the 'deleted_at' timestamp."""
+async def delete_prompt_by_id(prompt_id: str, snapshot=None):
+    """Logically deletes a prompt by setting the 'deleted_at' timestamp and removing its feed entries."""
     prompt_ref = db.collection(PROMPTS_COLLECTION).document(prompt_id)
-    await prompt_ref.update({"deleted_at": datetime.now(timezone.utc)})
+    prompt_doc = snapshot if snapshot is not None else await prompt_ref.get()
+    owner_uid = prompt_doc.to_dict().get("user_id") if prompt_doc.exists else None
+    batch = db.batch()
+    batch.update(prompt_ref, {"deleted_at": datetime.now(timezone.utc)})
+    if owner_uid:
+        for entry in await _owner_feed_entries_for_prompt(prompt_id, owner_uid):
+            batch.delete(entry.reference)
+    await batch.commit()
+    invalidate_owner(PROMPTS_COLLECTION, prompt_id)
 
 @firestore.async_transactional
-async def create_new_prompt_version(transaction: AsyncTransaction, prompt_id: str, version_data: PromptVersionCreate, user: Dict) -> dict:
-    """Creates a new version for a prompt within a transaction."""
+async def _create_new_prompt_version(transaction: AsyncTransaction, prompt_id: str, version_data: PromptVersionCreate, user: Dict) -> Tuple[dict, bool]:
+    """Transaction body of create_new_prompt_version; also returns whether a feed entry was written."""
     prompt_ref = db.collection(PROMPTS_COLLECTION).document(prompt_id)
     prompt_snapshot = await prompt_ref.get(transaction=transaction)
     if not prompt_snapshot.exists:
         raise FileNotFoundError(f"Prompt with ID {prompt_id} not found.")
-    current_version = prompt_snapshot.to_dict().get("latest_version", 0)
+    prompt_data = prompt_snapshot.to_dict()
+    current_version = prompt_data.get("latest_version", 0)
     new_version_number = current_version + 1
     version_ref = prompt_ref.collection("versions").document(str(new_version_number))
     new_version_data = {
@@ -180,18 +436,57 @@ async def create_new_prompt_version(transaction: AsyncTransaction, prompt_id: st
     } # Extraneous 'Section' removed
     transaction.set(version_ref, new_version_data)
     transaction.update(prompt_ref, {"latest_version": new_version_number})
-    return _serialize_datetimes({"id": version_ref.id, **new_version_data})
+
+    # Feeds only show activity on the user's own prompts.
+    wrote_feed = prompt_data.get("user_id") == user.get("uid")
+    if wrote_feed:
+        transaction.set(
+            _activity_ref(user["uid"], _version_activity_id(prompt_id, new_version_number)),
+            _activity_entry(
+                "version", prompt_id, prompt_data.get("name", "N/A"), new_version_number,
+                version_data.commit_message, new_version_data["created_at"]
+            )
+        )
+    return _serialize_datetimes({"id": version_ref.id, **new_version_data}), wrote_feed
+
+async def create_new_prompt_version(transaction: AsyncTransaction, prompt_id: str, version_data: PromptVersionCreate, user: Dict) -> dict:
+    """Creates a new version for a prompt within a transaction."""
+    new_version, wrote_feed = await _create_new_prompt_version(transaction, prompt_id, version_data, user)
+    # Trim only once the transaction has committed; its body may run several times or not commit at all.
+    if wrote_feed:
+        _schedule_feed_trim(user["uid"])
+    return new_version
+
+def _version_item(doc) -> dict:
+    """Maps a version snapshot to a response dict."""
+    version_data = doc.to_dict()
+    version_data["id"] = doc.id
+    return _serialize_datetimes(version_data)
+
+async def stream_prompt_versions(prompt_id: str) -> AsyncIterator[dict]:
+    """Yields all versions for a given prompt as Firestore streams them."""
+    versions_ref = db.collection(PROMPTS_COLLECTION).document(prompt_id).collection("versions")
+    async for doc in versions_ref.stream():
+        yield _version_item(doc)
 
 async def list_prompt_versions(prompt_id: str) -> list[dict]:
     """Lists all versions for a given prompt."""
-    versions_list = []
+    return [version async for version in stream_prompt_versions(prompt_id)]
+
+async def list_prompt_versions_page(
+    prompt_id: str,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    page_token: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """Fetches one page of a prompt's versions, oldest first. Returns (versions, next_page_token)."""
     versions_ref = db.collection(PROMPTS_COLLECTION).document(prompt_id).collection("versions")
-    stream = versions_ref.stream() # Extraneous 's' removed
-    async for doc in stream:
-        version_data = doc.to_dict()
-        version_data["id"] = doc.id
-        versions_list.append(_serialize_datetimes(version_data))
-    return versions_list
+    return await _fetch_page(
+        versions_ref.order_by("version_number"),
+        versions_ref,
+        page_size,
+        page_token,
+        to_item=_version_item
+    )
 
 async def create_template(template_data: PromptTemplateCreate, user: Dict) -> dict:
     """Creates a new prompt template."""
@@ -207,44 +502,74 @@ async def create_template(template_data: PromptTemplateCreate, user: Dict) -> di
 
 # --- FIX 1: SECURE list_templates ---
 # This function now requires a user_id and filters results in-memory.
-async def list_templates(user_id: str, tag: Optional[str] = None) -> list[dict]:
-    """(SECURE) Lists all prompt templates for a specific user, with mandatory security filter."""
-    templates_list = []
-    
+def _owned_template_item(doc, user_id: str) -> dict | None:
+    """Maps a template snapshot to a response dict, or None if it is not owned by user_id."""
+    template_data = doc.to_dict()
+    # CRITICAL SECURITY CHECK: In-memory filter for user ownership.
+    if template_data.get("user_id") != user_id:
+        return None
+    template_data["id"] = doc.id
+    return _serialize_datetimes(template_data)
+
+async def stream_templates(user_id: str, tag: Optional[str] = None) -> AsyncIterator[dict]:
+    """(SECURE) Yields a user's prompt templates as Firestore streams them."""
     # Base query on the collection
     query = db.collection(PROMPT_TEMPLATES_COLLECTION)
-    
+
     # Apply optional tag filter at the DB level if provided
     if tag:
         query = query.where(filter=FieldFilter("tags", "array_contains", tag))
-    
-    stream = query.stream()
-    async for doc in stream:
+
+    async for doc in query.stream():
         try:
-            template_data = doc.to_dict()
-            # CRITICAL SECURITY CHECK: In-memory filter for user ownership.
-            if template_data.get("user_id") == user_id:
-                template_data["id"] = doc.id
-                templates_list.append(_serialize_datetimes(template_data))
+            item = _owned_template_item(doc, user_id)
+            if item is not None:
+                yield item
         except Exception as e:
             logging.warning(f"--- WARNING: Skipping malformed document {doc.id} in 'prompt_templates': {e}")
-            
-    return templates_list
+
+async def list_templates(user_id: str, tag: Optional[str] = None) -> list[dict]:
+    """(SECURE) Lists all prompt templates for a specific user, with mandatory security filter."""
+    return [template async for template in stream_templates(user_id, tag)]
+
+async def list_templates_page(
+    user_id: str,
+    tag: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    page_token: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    (SECURE) Fetches one page of a user's templates, newest first.
+    Filters on user_id at the DB level and re-checks ownership in memory.
+    """
+    query = db.collection(PROMPT_TEMPLATES_COLLECTION).where(filter=FieldFilter("user_id", "==", user_id))
+    if tag:
+        query = query.where(filter=FieldFilter("tags", "array_contains", tag))
+    query = query.order_by("created_at", direction=firestore.Query.DESCENDING)
+    return await _fetch_page(
+        query,
+        db.collection(PROMPT_TEMPLATES_COLLECTION),
+        page_size,
+        page_token,
+        to_item=lambda doc: _owned_template_item(doc, user_id),
+        cursor_check=lambda data: data.get("user_id") == user_id
+    )
 # --- END FIX 1 ---
 
-async def list_templates_by_tags(tags: List[str]) -> list[dict]:
-    """Lists templates that have any of the specified tags."""
-    templates_list = []
+async def stream_templates_by_tags(tags: List[str]) -> AsyncIterator[dict]:
+    """Yields templates that have any of the specified tags as Firestore streams them."""
     query = db.collection(PROMPT_TEMPLATES_COLLECTION)
     if tags:
         query = query.where(filter=FieldFilter("tags", "array_contains_any", tags))
-    
-    stream = query.stream()
-    async for doc in stream:
+
+    async for doc in query.stream():
         template_data = doc.to_dict()
         template_data["id"] = doc.id
-        templates_list.append(_serialize_datetimes(template_data)) # Extraneous 'g' and extra indentation removed
-    return templates_list
+        yield _serialize_datetimes(template_data)
+
+async def list_templates_by_tags(tags: List[str]) -> list[dict]:
+    """Lists templates that have any of the specified tags."""
+    return [template async for template in stream_templates_by_tags(tags)]
 
 # --- FIX 2: SECURE get_template_by_id ---
 # This function now requires a user_id and returns None if the user does not own the template.
@@ -266,138 +591,628 @@ async def get_template_by_id(template_id: str, user_id: str) -> dict | None:
     return _serialize_datetimes(template_data)
 # --- END FIX 2 ---
 
-async def update_template_by_id(template_id: str, update_data: dict) -> dict | None:
+async def update_template_by_id(template_id: str, update_data: dict, snapshot=None) -> dict | None:
     """
     Updates a template document.
     Note: This function does NOT perform security checks.
     It relies on the router's dependency (`TemplateOwnerOrAdmin`) to ensure
-    only authorized users can call it.
+    only authorized users can call it. Pass `snapshot` when the dependency already
+    read the document; the response is built from it plus the applied fields.
     """
     doc_ref = db.collection(PROMPT_TEMPLATES_COLLECTION).document(template_id)
-    doc = await doc_ref.get()
+    doc = snapshot if snapshot is not None else await doc_ref.get()
     if not doc.exists:
         return None
-    
+    current_data = doc.to_dict()
+
     if "version" in update_data:
         # Increment version if it's part of the update, otherwise set to 1
-        current_version = doc.to_dict().get("version", 0)
+        current_version = current_data.get("version", 0)
         update_data["version"] = current_version + 1
-    
+
     if update_data:
         await doc_ref.update(update_data)
-    
-    # Fetch the updated document to return it
-    updated_doc = await doc_ref.get()
-    if not updated_doc.exists:
-        return None # Should not happen, but good to be safe
-    
-    final_data = updated_doc.to_dict()
-    final_data["id"] = updated_doc.id
+
+    final_data = {**current_data, **update_data}
+    final_data["id"] = doc.id
     return _serialize_datetimes(final_data)
 
 
 async def delete_template_by_id(template_id: str):
     """Deletes a template document."""
     await db.collection(PROMPT_TEMPLATES_COLLECTION).document(template_id).delete()
+    invalidate_owner(PROMPT_TEMPLATES_COLLECTION, template_id)
+
+def _credentials_ref(user_id: str, provider: str):
+    return db.collection(USERS_COLLECTION).document(user_id).collection(CREDENTIALS_SUBCOLLECTION).document(provider)
+
+def _invalidate_api_key(key: Tuple[str, str], updated_at: datetime):
+    latest = _api_key_versions.get(key)
+    if latest is None or updated_at > latest:
+        _api_key_versions.set(key, updated_at)
+    api_key_cache.pop(key)
 
 async def save_user_api_key(user_id: str, provider: str, api_key: str):
     """Encrypts and saves a user's API key for a specific provider.""" # Extraneous 'A' removed
     encrypted_key = encrypt_key(api_key)
-    key_ref = db.collection(USERS_COLLECTION).document(user_id).collection("credentials").document(provider)
-    await key_ref.set({"key": encrypted_key, "updated_at": datetime.now(timezone.utc)})
+    updated_at = datetime.now(timezone.utc)
+    await _credentials_ref(user_id, provider).set({"key": encrypted_key, "updated_at": updated_at})
+    _invalidate_api_key((user_id, provider), updated_at)
+    if redis_client.redis_client is None:
+        return
+    message = json.dumps({"user_id": user_id, "provider": provider, "updated_at": updated_at.isoformat()})
+    try:
+        await redis_client.redis_client.publish(API_KEY_INVALIDATION_CHANNEL, message)
+    except Exception as e:
+        # Other replicas drop their cached copy when their subscription reconnects.
+        logging.error(f"Could not publish API key invalidation for {user_id}/{provider}: {e}")
 
 async def get_decrypted_user_api_key(user_id: str, provider: str) -> str | None:
-    """Retrieves and decrypts a user's API key.""" # Extraneous 'A' removed
-    key_ref = db.collection(USERS_COLLECTION).document(user_id).collection("credentials").document(provider)
-    key_doc = await key_ref.get()
+    """Retrieves and decrypts a user's API key, served from api_key_cache when possible."""
+    # Cache mutations only happen on the event loop, so an entry cannot be zeroed
+    # between this lookup and the decode.
+    cached = api_key_cache.get((user_id, provider))
+    if cached is not None:
+        return cached.decode()
+    key_doc = await _credentials_ref(user_id, provider).get()
     if not key_doc.exists: return None
-    encrypted_key = key_doc.to_dict().get("key")
+    key_data = key_doc.to_dict()
+    encrypted_key = key_data.get("key")
     if not encrypted_key: return None # Extraneous 'g' removed
-    return decrypt_key(encrypted_key)
+    api_key = decrypt_key(encrypted_key)
+    updated_at = key_data.get("updated_at")
+    latest = _api_key_versions.get((user_id, provider))
+    if _api_key_invalidations_live and (latest is None or (updated_at is not None and updated_at >= latest)):
+        api_key_cache.set((user_id, provider), bytearray(api_key.encode()))
+    return api_key
 
-async def get_all_prompt_metrics() -> List[Dict[str, Any]]:
-    """Fetches metadata for all non-deleted prompts (for admin/analytics)."""
+async def run_api_key_invalidation_subscriber():
+    """
+    Applies API key invalidations published by save_user_api_key on any replica. Runs for
+    the app's lifetime; keys are cached only while the subscription is up, and the cache is
+    cleared whenever it drops (messages sent in the meantime are lost).
+    """
+    global _api_key_invalidations_live
+    if redis_client.redis_client is None:
+        logging.warning("Redis is not configured; decrypted API keys will not be cached.")
+        return
+    retry_seconds = 0
+    while True:
+        pubsub = redis_client.redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(API_KEY_INVALIDATION_CHANNEL)
+            _api_key_invalidations_live = True
+            retry_seconds = 0
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                data = json.loads(message["data"])
+                _invalidate_api_key((data["user_id"], data["provider"]), datetime.fromisoformat(data["updated_at"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not retry_seconds:
+                logging.warning(f"API key invalidation subscription lost, retrying with backoff: {e}")
+        finally:
+            _api_key_invalidations_live = False
+            api_key_cache.clear()
+            await pubsub.aclose()
+        retry_seconds = min(retry_seconds * 2 or API_KEY_RESUBSCRIBE_SECONDS, API_KEY_RESUBSCRIBE_MAX_SECONDS)
+        await asyncio.sleep(retry_seconds)
+
+def _metrics_item(doc) -> dict:
+    """Maps a prompt snapshot to a metrics dict."""
+    prompt_data = doc.to_dict()
+    prompt_data["id"] = doc.id
+    return prompt_data
+
+async def stream_all_prompt_metrics() -> AsyncIterator[Dict[str, Any]]:
+    """Yields metadata for all non-deleted prompts as Firestore streams them."""
     query = db.collection(PROMPTS_COLLECTION).where(filter=FieldFilter("deleted_at", "==", None))
-    prompts_list = []
     async for doc in query.stream():
-        prompt_data = doc.to_dict()
-        prompt_data["id"] = doc.id
-        prompts_list.append(prompt_data) # Extraneous 'g' removed
-    return prompts_list
+        yield _metrics_item(doc)
+
+async def get_all_prompt_metrics() -> List[Dict[str, Any]]:
+    """Fetches metadata for all non-deleted prompts (for admin/analytics)."""
+    return [prompt async for prompt in stream_all_prompt_metrics()]
+
+async def get_prompt_metrics_page(
+    page_size: int = DEFAULT_PAGE_SIZE,
+    page_token: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Fetches one page of prompt metrics in document-ID order. Returns (prompts, next_page_token)."""
+    query = (
+        db.collection(PROMPTS_COLLECTION)
+        .where(filter=FieldFilter("deleted_at", "==", None))
+        .order_by("__name__")
+    )
+    return await _fetch_page(
+        query,
+        db.collection(PROMPTS_COLLECTION),
+        page_size,
+        page_token,
+        to_item=_metrics_item
+    )
+
+def _feed_activity_item(doc) -> Dict[str, Any]:
+    """Maps a feed entry snapshot to the RecentActivity response shape."""
+    entry = doc.to_dict()
+    return _serialize_datetimes({
+        "id": doc.id,
+        "promptId": entry.get("prompt_id"),
+        "promptName": entry.get("prompt_name") or "N/A",
+        "version": entry.get("version_number"),
+        "commit_message": entry.get("commit_message") or "N/A",
+        "created_at": entry.get("created_at"),
+        "activity_type": entry.get("activity_type", "version")
+    })
 
 async def get_recent_activity_for_user(user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
-    """Fetches a user's most recent activity with a mandatory security filter."""
-    # This query is across a collection group, so the security check is even more critical.
+    """
+    Fetches a user's most recent activity from their users/{uid}/activity feed.
+    This is a single indexed range read; users whose feed has not been backfilled
+    yet fall back to rebuilding it from their prompt versions.
+    """
+    feed_ref = db.collection(USERS_COLLECTION).document(user_id).collection(ACTIVITY_SUBCOLLECTION)
+    # Over-read slightly so entries past their TTL (deletion can lag) do not shorten the page.
+    query = feed_ref.order_by("created_at", direction=firestore.Query.DESCENDING).limit(limit * 2)
+    now = datetime.now(timezone.utc)
+    activity_list = []
+    async for doc in query.stream():
+        expires_at = doc.to_dict().get("expires_at")
+        if expires_at is not None and expires_at <= now:
+            continue
+        activity_list.append(_feed_activity_item(doc))
+        if len(activity_list) >= limit:
+            break
+
+    if not activity_list:
+        return await _recent_activity_from_versions(user_id, limit)
+    return activity_list
+
+# Versions by the user on prompts they no longer own (or that were deleted) are dropped
+# after the parent lookup, so the query over-fetches a little to still fill `limit`.
+ACTIVITY_OVERFETCH_FACTOR = 2
+
+async def _recent_activity_from_versions(user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Rebuilds a user's recent activity from the versions collection group, with a
+    mandatory security filter. Costs two round trips: one indexed collection-group
+    query for the user's own versions (author_uid, created_at DESC) and one batched
+    `get_all` for the deduplicated parent prompts.
+    """
     query = (
         db.collection_group('versions')
+        .where(filter=FieldFilter("author_uid", "==", user_id))
         .order_by("created_at", direction=firestore.Query.DESCENDING)
-        .limit(limit * 5)  # Fetch more documents to increase chance of finding user's items.
+        .limit(limit * ACTIVITY_OVERFETCH_FACTOR)
     )
+    version_docs = [doc async for doc in query.stream()]
+    if not version_docs:
+        return []
+
+    # Deduplicate parents so each prompt is read once, then fetch them in a single RPC.
+    parent_refs = {}
+    for doc in version_docs:
+        prompt_ref = doc.reference.parent.parent
+        parent_refs.setdefault(prompt_ref.path, prompt_ref)
+    parents = {}
+    async for prompt_doc in db.get_all(list(parent_refs.values())):
+        if prompt_doc.exists:
+            parents[prompt_doc.reference.path] = prompt_doc.to_dict()
+
     activity_list = []
-    async for doc in query.stream():
+    for doc in version_docs:
         version_data = doc.to_dict()
         prompt_ref = doc.reference.parent.parent
-        prompt_doc = await prompt_ref.get() # Extraneous 'Gallery' removed
-        
-        # CRITICAL SECURITY CHECK: Verify ownership on the parent prompt document.
-        if prompt_doc.exists and prompt_doc.to_dict().get("user_id") == user_id:
-            # Also ensure the user is the author of the version itself.
-            if version_data.get("author_uid") == user_id and prompt_doc.to_dict().get("deleted_at") is None: # Extraneous 'Remember' removed
-                prompt_name = prompt_doc.to_dict().get('name', 'N/A')
-                activity_item = {
-                    "id": doc.id,
-                    "promptId": prompt_ref.id, # Extraneous 'Gallery' removed
-                    "promptName": prompt_name,
-                    "version": version_data.get('version_number'),
-                    "commit_message": version_data.get('commit_message', 'N/A'),
-                    "created_at": version_data.get('created_at')
-                }
-                activity_list.append(_serialize_datetimes(activity_item))
-    
-    # Stop once we have gathered enough items for the user. # Extraneous 's' removed
-    if len(activity_list) >= limit:
-        # Note: break here is incorrect in async for loop. It should be outside the loop or handled differently
-        # However, since the goal is to stop gathering, the loop naturally stops when the stream is exhausted.
-        # Removing the 'break' entirely since the 'limit' should be applied to the query, but since it's a 
-        # collection group query that requires in-memory filtering, the logic below is the correct way to handle the limit *after* filtering.
-        pass
-        
-    return activity_list[:limit] # Explicitly slice to enforce the final limit
+        prompt_data = parents.get(prompt_ref.path)
+
+        # CRITICAL SECURITY CHECK: Verify ownership on the parent prompt document,
+        # and that the user authored the version itself.
+        if not prompt_data or prompt_data.get("user_id") != user_id:
+            continue
+        if version_data.get("author_uid") != user_id or prompt_data.get("deleted_at") is not None:
+            continue
+
+        activity_item = {
+            "id": doc.id,
+            "promptId": prompt_ref.id,
+            "promptName": prompt_data.get('name', 'N/A'),
+            "version": version_data.get('version_number'),
+            "commit_message": version_data.get('commit_message', 'N/A'),
+            "created_at": version_data.get('created_at')
+        }
+        activity_list.append(_serialize_datetimes(activity_item))
+        if len(activity_list) >= limit:
+            break
+
+    return activity_list
+
+async def backfill_activity_feeds(dry_run: bool = False) -> Dict[str, int]:
+    """
+    Builds users/{uid}/activity feeds for existing prompts: one entry per version the
+    owner authored and one per rating the owner left on their own prompt. Entry IDs are
+    deterministic, so re-running the backfill overwrites instead of duplicating.
+    """
+    stats = {"prompts": 0, "entries": 0}
+    owners = set()
+    query = db.collection(PROMPTS_COLLECTION).where(filter=FieldFilter("deleted_at", "==", None))
+    async for prompt_doc in query.stream():
+        prompt_data = prompt_doc.to_dict()
+        owner_uid = prompt_data.get("user_id")
+        if not owner_uid:
+            continue
+        prompt_name = prompt_data.get("name", "N/A")
+        writes = []
+
+        async for version_doc in prompt_doc.reference.collection("versions").stream():
+            version_data = version_doc.to_dict()
+            if version_data.get("author_uid") != owner_uid or not version_data.get("created_at"):
+                continue
+            version_number = version_data.get("version_number")
+            writes.append((
+                _activity_ref(owner_uid, _version_activity_id(prompt_doc.id, version_number)),
+                _activity_entry(
+                    "version", prompt_doc.id, prompt_name, version_number,
+                    version_data.get("commit_message"), version_data["created_at"]
+                )
+            ))
+
+        ratings_query = (
+            db.collection(RATINGS_COLLECTION)
+            .where(filter=FieldFilter("prompt_id", "==", prompt_doc.id))
+            .where(filter=FieldFilter("user_id", "==", owner_uid))
+        )
+        async for rating_doc in ratings_query.stream():
+            rating_data = rating_doc.to_dict()
+            if not rating_data.get("created_at"):
+                continue
+            version_number = rating_data.get("version_number")
+            writes.append((
+                _activity_ref(owner_uid, _rating_activity_id(prompt_doc.id, version_number)),
+                _activity_entry(
+                    "rating", prompt_doc.id, prompt_name, version_number,
+                    f"Rated {rating_data.get('rating')}/5", rating_data["created_at"]
+                )
+            ))
+
+        if not dry_run:
+            # Firestore batches are capped at 500 writes.
+            for start in range(0, len(writes), 500):
+                batch = db.batch()
+                for ref, entry in writes[start:start + 500]:
+                    batch.set(ref, entry)
+                await batch.commit()
+        stats["prompts"] += 1
+        stats["entries"] += len(writes)
+        owners.add(owner_uid)
+
+    if not dry_run:
+        for owner_uid in owners:
+            await _trim_activity_feed(owner_uid)
+    return stats
+
+def _rating_base(prompt_data: Dict[str, Any]) -> Tuple[int, int]:
+    """Returns the (rating_sum, rating_count) stored on a prompt document."""
+    rating_count = prompt_data.get("rating_count", 0) or 0
+    rating_sum = prompt_data.get("rating_sum")
+    # Prompts not yet migrated by migrate_rating_aggregates.py have no rating_sum.
+    if rating_sum is None:
+        rating_sum = round((prompt_data.get("average_rating") or 0) * rating_count)
+    return rating_sum, rating_count
 
 @firestore.async_transactional
-async def create_or_update_rating(
-    transaction: AsyncTransaction, # Extraneous 'Note:' removed
+async def _create_or_update_rating(
+    transaction: AsyncTransaction,
     prompt_id: str,
     version_number: int,
     rating: int,
     user_id: str
-):
-    """Creates or updates a user's rating for a prompt and recalculates the average."""
+) -> bool:
+    """Transaction body of create_or_update_rating; returns whether a feed entry was written."""
     prompt_ref = db.collection(PROMPTS_COLLECTION).document(prompt_id)
-    
+    vote_ref = prompt_ref.collection(RATING_VOTES_SUBCOLLECTION).document(user_id)
+
     prompt_snapshot = await prompt_ref.get(transaction=transaction)
     if not prompt_snapshot.exists:
         raise FileNotFoundError(f"Prompt with ID {prompt_id} not found.")
+    vote_snapshot = await vote_ref.get(transaction=transaction)
 
-    all_ratings_query = db.collection(RATINGS_COLLECTION).where(filter=FieldFilter("prompt_id", "==", prompt_id)) # Extraneous 'True' removed
-    all_ratings_docs = await all_ratings_query.get(transaction=transaction)
-    
-    ratings_by_user = {doc.to_dict().get("user_id"): doc.to_dict().get("rating", 0) for doc in all_ratings_docs}
-    ratings_by_user[user_id] = rating
-
-    total_rating = sum(ratings_by_user.values())
-    new_rating_count = len(ratings_by_user)
-    new_avg_rating = total_rating / new_rating_count if new_rating_count > 0 else 0
+    prompt_data = prompt_snapshot.to_dict()
+    previous_rating = vote_snapshot.to_dict().get("rating") if vote_snapshot.exists else None
+    sum_delta = rating - (previous_rating or 0)
+    count_delta = 1 if previous_rating is None else 0
 
     rating_id = f"{prompt_id}_v{version_number}_{user_id}" # Extraneous 'Remember' removed
     rating_ref = db.collection(RATINGS_COLLECTION).document(rating_id)
+    rated_at = datetime.now(timezone.utc)
     transaction.set(rating_ref, {
         "prompt_id": prompt_id, "version_number": version_number,
         "user_id": user_id, "rating": rating, # Extraneous 'Remember' removed
-        "created_at": datetime.now(timezone.utc)
+        "created_at": rated_at
     })
+    transaction.set(vote_ref, {"rating": rating, "version_number": version_number, "updated_at": rated_at})
+
+    if RATING_SHARD_COUNT > 0:
+        # Blind increment on a random shard: no write to the (hot) prompt document.
+        shard_ref = prompt_ref.collection(RATING_SHARDS_SUBCOLLECTION).document(str(random.randrange(RATING_SHARD_COUNT)))
+        transaction.set(shard_ref, {
+            "rating_sum": firestore.Increment(sum_delta),
+            "rating_count": firestore.Increment(count_delta),
+            "dirty": True
+        }, merge=True)
+    else:
+        rating_sum, rating_count = _rating_base(prompt_data)
+        rating_sum += sum_delta
+        rating_count += count_delta
+        transaction.update(prompt_ref, {
+            "rating_sum": rating_sum,
+            "rating_count": rating_count,
+            "average_rating": rating_sum / rating_count if rating_count > 0 else 0
+        })
+
+    # Feeds only show activity on the user's own prompts.
+    wrote_feed = prompt_data.get("user_id") == user_id
+    if wrote_feed:
+        transaction.set(
+            _activity_ref(user_id, _rating_activity_id(prompt_id, version_number)),
+            _activity_entry(
+                "rating", prompt_id, prompt_data.get("name", "N/A"), version_number,
+                f"Rated {rating}/5", rated_at
+            )
+        )
+    return wrote_feed
+
+async def create_or_update_rating(
+    transaction: AsyncTransaction, # Extraneous 'Note:' removed
+    prompt_id: str,
+    version_number: int,
+    rating: int,
+    user_id: str
+):
+    """
+    Creates or updates a user's rating for a prompt and updates the aggregate incrementally.
+    The prompt stores `rating_sum` and `rating_count`; the caller's current vote lives at
+    prompts/{id}/rating_votes/{uid}, so each rating reads exactly two documents no matter
+    how many ratings the prompt already has. Each user counts once per prompt, with their
+    latest rating. In sharded mode (RATING_SHARD_COUNT > 0) the delta is added to a random
+    shard instead of the prompt document.
+    """
+    # Trim only once the transaction has committed; its body may run several times or not commit at all.
+    if await _create_or_update_rating(transaction, prompt_id, version_number, rating, user_id):
+        _schedule_feed_trim(user_id)
+
+async def migrate_rating_aggregates(dry_run: bool = False) -> Dict[str, int]:
+    """
+    One-off migration for incremental rating aggregation. For every prompt, computes
+    each user's latest rating from the ratings collection, writes it to
+    prompts/{id}/rating_votes/{uid}, and stores the resulting rating_sum, rating_count
+    and average_rating on the prompt. Safe to re-run.
+    """
+    stats = {"prompts": 0, "votes": 0}
+    async for prompt_doc in db.collection(PROMPTS_COLLECTION).stream():
+        latest_by_user: Dict[str, Dict[str, Any]] = {}
+        ratings_query = db.collection(RATINGS_COLLECTION).where(filter=FieldFilter("prompt_id", "==", prompt_doc.id))
+        async for rating_doc in ratings_query.stream():
+            rating_data = rating_doc.to_dict()
+            uid = rating_data.get("user_id")
+            if not uid:
+                continue
+            current = latest_by_user.get(uid)
+            rated_at = rating_data.get("created_at")
+            if current is None or (rated_at and current.get("created_at") and rated_at > current["created_at"]):
+                latest_by_user[uid] = rating_data
+
+        rating_sum = sum(vote.get("rating", 0) for vote in latest_by_user.values())
+        rating_count = len(latest_by_user)
+        writes = [
+            (prompt_doc.reference.collection(RATING_VOTES_SUBCOLLECTION).document(uid), {
+                "rating": vote.get("rating", 0),
+                "version_number": vote.get("version_number"),
+                "updated_at": vote.get("created_at") or datetime.now(timezone.utc)
+            })
+            for uid, vote in latest_by_user.items()
+        ]
+
+        if not dry_run:
+            # Firestore batches are capped at 500 writes; the prompt update rides in the last one.
+            for start in range(0, max(len(writes), 1), 499):
+                batch = db.batch()
+                for ref, vote in writes[start:start + 499]:
+                    batch.set(ref, vote)
+                if start + 499 >= len(writes):
+                    batch.update(prompt_doc.reference, {
+                        "rating_sum": rating_sum,
+                        "rating_count": rating_count,
+                        "average_rating": rating_sum / rating_count if rating_count else 0
+                    })
+                await batch.commit()
+        stats["prompts"] += 1
+        stats["votes"] += rating_count
+    return stats
+
+# --- Rating Shard Reads & Compaction ---
+async def get_rating_totals(prompt_ref, prompt_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns rating_sum, rating_count and average_rating including not-yet-compacted shards."""
+    rating_sum, rating_count = _rating_base(prompt_data)
+    async for shard_doc in prompt_ref.collection(RATING_SHARDS_SUBCOLLECTION).stream():
+        shard = shard_doc.to_dict()
+        rating_sum += shard.get("rating_sum", 0)
+        rating_count += shard.get("rating_count", 0)
+    return {
+        "rating_sum": rating_sum,
+        "rating_count": rating_count,
+        "average_rating": rating_sum / rating_count if rating_count > 0 else 0
+    }
+
+@firestore.async_transactional
+async def _fold_rating_shards(transaction: AsyncTransaction, prompt_ref):
+    """Moves the shard totals of one prompt onto the prompt document and zeroes the shards."""
+    prompt_snapshot = await prompt_ref.get(transaction=transaction)
+    if not prompt_snapshot.exists:
+        return
+    shards_ref = prompt_ref.collection(RATING_SHARDS_SUBCOLLECTION)
+    shard_docs = [doc async for doc in shards_ref.stream(transaction=transaction)]
+
+    rating_sum, rating_count = _rating_base(prompt_snapshot.to_dict())
+    for shard_doc in shard_docs:
+        shard = shard_doc.to_dict()
+        rating_sum += shard.get("rating_sum", 0)
+        rating_count += shard.get("rating_count", 0)
 
     transaction.update(prompt_ref, {
-        "rating_count": new_rating_count,
-        "average_rating": new_avg_rating
-    })
\ No newline at end of file
+        "rating_sum": rating_sum,
+        "rating_count": rating_count,
+        "average_rating": rating_sum / rating_count if rating_count > 0 else 0
+    })
+    for shard_doc in shard_docs:
+        transaction.set(shard_doc.reference, {"rating_sum": 0, "rating_count": 0, "dirty": False})
+
+async def compact_rating_shards() -> int:
+    """Folds every dirty rating shard back onto its prompt. Returns the number of prompts compacted."""
+    query = db.collection_group(RATING_SHARDS_SUBCOLLECTION).where(filter=FieldFilter("dirty", "==", True))
+    prompt_refs = {}
+    async for shard_doc in query.stream():
+        prompt_ref = shard_doc.reference.parent.parent
+        prompt_refs.setdefault(prompt_ref.path, prompt_ref)
+
+    for prompt_ref in prompt_refs.values():
+        try:
+            await _fold_rating_shards(db.transaction(), prompt_ref)
+        except Exception as e:
+            logging.warning(f"--- WARNING: Could not compact rating shards for {prompt_ref.id}: {e}")
+    return len(prompt_refs)
+
+async def run_rating_shard_compactor(interval_seconds: float = RATING_COMPACT_INTERVAL_SECONDS):
+    """Background loop that compacts rating shards every `interval_seconds`."""
+    while True:
+        try:
+            compacted = await compact_rating_shards()
+            if compacted:
+                logging.info(f"Compacted rating shards for {compacted} prompt(s).")
+        except Exception as e:
+            logging.error(f"Rating shard compaction failed: {e}")
+        await asyncio.sleep(interval_seconds)
+
+# --- Batch Jobs ---
+# A job is batch_jobs/{job_id} (owner, status, counters) with one document per input item
+# under items/, keyed by its zero-padded index so document-ID order is submission order.
+# Workers fill results into the item documents and bump the job's counters in the same batch.
+def _batch_items_ref(job_id: str):
+    return db.collection(BATCH_JOBS_COLLECTION).document(job_id).collection(BATCH_ITEMS_SUBCOLLECTION)
+
+def _batch_item_id(index: int) -> str:
+    return f"{index:06d}"
+
+async def _commit_in_chunks(writes: List[Tuple[str, Any, Dict[str, Any]]]):
+    """Applies (op, ref, data) writes in concurrent batches of at most 500 (the Firestore limit)."""
+    async def commit(chunk):
+        batch = db.batch()
+        for op, ref, data in chunk:
+            getattr(batch, op)(ref, data)
+        await batch.commit()
+    await asyncio.gather(*(commit(writes[start:start + 500]) for start in range(0, len(writes), 500)))
+
+async def create_batch_job(user_id: str, items: List[Dict[str, Any]]) -> dict:
+    """Stores a new queued job and its items. The job document is written last, so it never points at missing items."""
+    job_ref = db.collection(BATCH_JOBS_COLLECTION).document()
+    items_ref = job_ref.collection(BATCH_ITEMS_SUBCOLLECTION)
+    await _commit_in_chunks([
+        ("set", items_ref.document(_batch_item_id(index)), {**item, "index": index, "status": "pending"})
+        for index, item in enumerate(items)
+    ])
+    now = datetime.now(timezone.utc)
+    job = {"user_id": user_id, "status": "queued", "total": len(items), "completed": 0, "failed": 0,
+           "created_at": now, "updated_at": now, "error": None}
+    await job_ref.set(job)
+    return {"id": job_ref.id, **job}
+
+async def get_batch_job(job_id: str, user_id: Optional[str] = None) -> dict | None:
+    """Returns the job, or None if it does not exist or (when `user_id` is given) belongs to someone else."""
+    doc = await db.collection(BATCH_JOBS_COLLECTION).document(job_id).get()
+    if not doc.exists:
+        return None
+    job = doc.to_dict()
+    if user_id is not None and job.get("user_id") != user_id:
+        return None
+    return {"id": doc.id, **job}
+
+async def update_batch_job(job_id: str, **fields):
+    await db.collection(BATCH_JOBS_COLLECTION).document(job_id).update(
+        {**fields, "updated_at": datetime.now(timezone.utc)}
+    )
+
+@firestore.async_transactional
+async def _claim_batch_job(transaction: AsyncTransaction, job_ref, owner: str, lease_seconds: float) -> bool:
+    snapshot = await job_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return False
+    job, now = snapshot.to_dict(), datetime.now(timezone.utc)
+    if job.get("status") in ("completed", "failed"):
+        return False
+    lease_expires_at = job.get("lease_expires_at")
+    if job.get("lease_owner") not in (None, owner) and lease_expires_at and lease_expires_at > now:
+        return False
+    transaction.update(job_ref, {"lease_owner": owner, "lease_expires_at": now + timedelta(seconds=lease_seconds)})
+    return True
+
+async def claim_batch_job(job_id: str, owner: str, lease_seconds: float) -> bool:
+    """
+    Takes (or renews) the right to work on an unfinished job for `lease_seconds`. Returns False
+    if the job is finished or another worker holds an unexpired lease, so a job is only
+    resumed by one replica after a restart.
+    """
+    job_ref = db.collection(BATCH_JOBS_COLLECTION).document(job_id)
+    return await _claim_batch_job(db.transaction(), job_ref, owner, lease_seconds)
+
+async def list_unfinished_batch_job_ids() -> List[str]:
+    """IDs of jobs still queued or running (candidates for resuming after a restart)."""
+    query = db.collection(BATCH_JOBS_COLLECTION).where(filter=FieldFilter("status", "in", ["queued", "running"]))
+    return [doc.id async for doc in query.select([]).stream()]
+
+async def set_batch_items_submission(job_id: str, item_ids: List[str], openai_batch_id: str):
+    """Records the provider batch the items were submitted in, so a resumed job waits for it instead of paying twice."""
+    items_ref = _batch_items_ref(job_id)
+    await _commit_in_chunks([
+        ("update", items_ref.document(item_id), {"openai_batch_id": openai_batch_id}) for item_id in item_ids
+    ])
+
+async def list_pending_batch_items(job_id: str) -> List[Dict[str, Any]]:
+    """Items without a result yet (all of them for a fresh job, the remainder for a resumed one)."""
+    query = _batch_items_ref(job_id).where(filter=FieldFilter("status", "==", "pending"))
+    return [{"id": doc.id, **doc.to_dict()} async for doc in query.stream()]
+
+async def save_batch_results(job_id: str, results: Dict[str, Dict[str, Any]]):
+    """
+    Writes {item_id: result} onto the item documents. Each result has `status` "succeeded" or
+    "failed"; the job's completed/failed counters are incremented in the same batches.
+    """
+    items_ref = _batch_items_ref(job_id)
+    job_ref = db.collection(BATCH_JOBS_COLLECTION).document(job_id)
+    entries = list(results.items())
+    writes = []
+    # 499 items plus the counter update fill one Firestore batch.
+    for start in range(0, len(entries), 499):
+        chunk = entries[start:start + 499]
+        writes.extend(("update", items_ref.document(item_id), result) for item_id, result in chunk)
+        failed = sum(1 for _, result in chunk if result["status"] == "failed")
+        writes.append(("update", job_ref, {
+            "completed": firestore.Increment(len(chunk) - failed),
+            "failed": firestore.Increment(failed),
+            "updated_at": datetime.now(timezone.utc),
+        }))
+    await _commit_in_chunks(writes)
+
+def _batch_result_item(doc) -> dict:
+    item = doc.to_dict()
+    item.pop("prompt_text", None)
+    return item
+
+async def list_batch_results_page(
+    job_id: str,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    page_token: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """Fetches one page of a job's results in submission order. Returns (results, next_page_token)."""
+    items_ref = _batch_items_ref(job_id)
+    return await _fetch_page(items_ref.order_by("__name__"), items_ref, page_size, page_token, to_item=_batch_result_item)
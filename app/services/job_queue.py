@@ -0,0 +1,231 @@
+# app/services/job_queue.py
+import os
+import json
+import time
+import asyncio
+import logging
+from uuid import uuid4
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.core import redis_client
+from app.core.streaming import sse_event
+from app.services import llm_service
+from app.schemas.prompt import (
+    APEOptimizeRequest, APEOptimizeResponse, DiagnoseRequest, DiagnoseResponse,
+    BreakdownRequest, BreakdownResponse, TemplateGenerateRequest, RecommendRequest, RecommendResponse, Job
+)
+
+# --- Configuration ---
+# Slow meta-prompt endpoints accept `mode=async`: the request is stored in Redis and pushed
+# onto a list that worker tasks pop from (BRPOP), so API workers return 202 immediately.
+# Workers run in dedicated processes started with `python run_job_worker.py`; API replicas
+# only enqueue unless JOB_WORKER_CONCURRENCY opts them into running workers in-process too.
+# Delivery is at most once: a job popped by a worker that then dies stays `running` until
+# its record expires.
+JOB_QUEUE_KEY = "jobs:queue"
+JOB_KEY_PREFIX = "job:"
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "0"))
+JOB_MAX_QUEUE_LENGTH = int(os.getenv("JOB_MAX_QUEUE_LENGTH", "1000"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+# How often the events stream re-reads a job, and how long a worker blocks on an empty queue.
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+JOB_POP_TIMEOUT_SECONDS = 5
+# Upper bound for the doubling retry delay while Redis is down.
+REDIS_RETRY_MAX_SECONDS = 60
+# On shutdown, workers stop popping and jobs already running get this long to finish.
+JOB_WORKER_DRAIN_SECONDS = float(os.getenv("JOB_WORKER_DRAIN_SECONDS", "20"))
+TERMINAL_STATES = {"succeeded", "failed"}
+JOBS_URL_PREFIX = "/api/v1/jobs"
+MODE_DESCRIPTION = "`async` queues the work and returns 202 with a job to poll (or subscribe to) instead of waiting."
+
+# --- Job kinds ---
+async def _optimize(request: APEOptimizeRequest, user: Optional[dict]) -> BaseModel:
+    return APEOptimizeResponse(**await llm_service.generate_optimized_prompt(request))
+
+async def _diagnose(request: DiagnoseRequest, user: Optional[dict]) -> BaseModel:
+    return DiagnoseResponse(**await llm_service.diagnose_prompt(request))
+
+async def _breakdown(request: BreakdownRequest, user: Optional[dict]) -> BaseModel:
+    return BreakdownResponse(**await llm_service.breakdown_prompt(request))
+
+async def _generate_template(request: TemplateGenerateRequest, user: Optional[dict]) -> dict:
+    return await llm_service.generate_and_store_template(request, user)
+
+async def _recommend_templates(request: RecommendRequest, user: Optional[dict]) -> BaseModel:
+    return RecommendResponse(recommendations=await llm_service.recommend_templates(request))
+
+# kind -> (request schema, handler). Handlers return what the synchronous endpoint returns.
+JOB_KINDS: Dict[str, Tuple[Type[BaseModel], Callable[[Any, Optional[dict]], Awaitable[Any]]]] = {
+    "optimize": (APEOptimizeRequest, _optimize),
+    "diagnose": (DiagnoseRequest, _diagnose),
+    "breakdown": (BreakdownRequest, _breakdown),
+    "generate_template": (TemplateGenerateRequest, _generate_template),
+    "recommend_templates": (RecommendRequest, _recommend_templates),
+}
+
+# --- Storage ---
+def _job_key(job_id: str) -> str:
+    return f"{JOB_KEY_PREFIX}{job_id}"
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _redis():
+    if redis_client.redis_client is None:
+        raise HTTPException(status_code=503, detail="Background jobs are unavailable (no Redis connection).")
+    return redis_client.redis_client
+
+async def _load(job_id: str) -> Optional[dict]:
+    raw = await _redis().get(_job_key(job_id))
+    return json.loads(raw) if raw else None
+
+async def _save(job: dict):
+    await _redis().set(_job_key(job["id"]), json.dumps(job), ex=JOB_TTL_SECONDS)
+
+def _public(job: dict) -> dict:
+    return {k: v for k, v in job.items() if k not in ("request", "user")}
+
+# --- API side ---
+async def enqueue(kind: str, request: BaseModel, user: Optional[dict] = None) -> dict:
+    """Stores and queues a job. Raises 503 if Redis is unavailable or the queue is full."""
+    redis = _redis()
+    try:
+        if await redis.llen(JOB_QUEUE_KEY) >= JOB_MAX_QUEUE_LENGTH:
+            raise HTTPException(status_code=503, detail="Too many queued jobs. Try again shortly.")
+        job = {
+            "id": uuid4().hex, "kind": kind, "status": "queued", "created_at": _now(),
+            "started_at": None, "finished_at": None, "result": None, "error": None,
+            "owner": user["uid"] if user else None,
+            "request": request.model_dump(mode="json"),
+            "user": {k: user.get(k) for k in ("uid", "name", "email")} if user else None,
+        }
+        await _save(job)
+        await redis.lpush(JOB_QUEUE_KEY, job["id"])
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Could not enqueue {kind} job: {e}")
+        raise HTTPException(status_code=503, detail="Background jobs are unavailable.")
+    return _public(job)
+
+def accepted_response(job: dict) -> JSONResponse:
+    """The 202 response for an endpoint called with `mode=async`."""
+    status_url = f"{JOBS_URL_PREFIX}/{job['id']}"
+    body = {"job_id": job["id"], "status": job["status"], "status_url": status_url, "events_url": f"{status_url}/events"}
+    return JSONResponse(status_code=202, content=body, headers={"Location": status_url})
+
+async def get_job(job_id: str, user: Optional[dict] = None) -> Optional[dict]:
+    """The job without its stored request, or None if unknown/expired or owned by another user."""
+    job = await _load(job_id)
+    if job is None or (job["owner"] and (user is None or user["uid"] != job["owner"])):
+        return None
+    return _public(job)
+
+async def job_events(job_id: str, user: Optional[dict] = None) -> AsyncIterator[str]:
+    """SSE frames: a `status` event whenever the status changes, then `done` with the finished job."""
+    last_status = None
+    while True:
+        job = await get_job(job_id, user)
+        if job is None:
+            yield sse_event("error", {"detail": "Job not found or expired."})
+            return
+        if job["status"] in TERMINAL_STATES:
+            yield sse_event("done", Job(**job))
+            return
+        if job["status"] != last_status:
+            last_status = job["status"]
+            yield sse_event("status", {"id": job_id, "status": last_status})
+        await asyncio.sleep(JOB_POLL_SECONDS)
+
+# --- Worker side ---
+# Worker tasks currently inside run_job, and those stop_workers has asked to exit.
+_busy_workers: set = set()
+_stopping_workers: set = set()
+
+async def run_job(job_id: str):
+    """Runs one popped job and stores its result or error."""
+    job = await _load(job_id)
+    if job is None:
+        logging.warning(f"Job {job_id} expired before a worker picked it up.")
+        return
+    schema, handler = JOB_KINDS[job["kind"]]
+    job.update(status="running", started_at=_now())
+    await _save(job)
+    start = time.perf_counter()
+    try:
+        result = await handler(schema(**job["request"]), job["user"])
+        job.update(status="succeeded", result=result.model_dump(mode="json") if isinstance(result, BaseModel) else result)
+    except HTTPException as e:
+        job.update(status="failed", error={"status_code": e.status_code, "detail": e.detail})
+    except asyncio.CancelledError:
+        # Shutdown outlasted the drain period; record it rather than leave the job `running`.
+        job.update(status="failed", error={"status_code": 503, "detail": "Worker shut down before the job finished."}, finished_at=_now())
+        await _save(job)
+        raise
+    except Exception as e:
+        logging.error(f"Job {job_id} ({job['kind']}) failed: {e}")
+        job.update(status="failed", error={"status_code": 500, "detail": str(e)})
+    job["finished_at"] = _now()
+    await _save(job)
+    logging.info(f"Job {job_id} ({job['kind']}) {job['status']} in {(time.perf_counter() - start) * 1000:.0f} ms.")
+
+async def run_worker(worker_id: int = 0):
+    """
+    Pops and runs jobs until cancelled. Redis errors back off exponentially (warning once per
+    outage) instead of ending the loop.
+    """
+    retry_seconds = 0
+    while asyncio.current_task() not in _stopping_workers:
+        try:
+            popped = await _redis().brpop(JOB_QUEUE_KEY, timeout=JOB_POP_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not retry_seconds:
+                logging.warning(f"Job worker {worker_id}: queue unavailable ({e}); backing off.")
+            retry_seconds = min(retry_seconds * 2 or JOB_POP_TIMEOUT_SECONDS, REDIS_RETRY_MAX_SECONDS)
+            await asyncio.sleep(retry_seconds)
+            continue
+        if retry_seconds:
+            logging.info(f"Job worker {worker_id}: queue reachable again.")
+            retry_seconds = 0
+        if popped:
+            _busy_workers.add(asyncio.current_task())
+            try:
+                await run_job(popped[1])
+            except Exception as e:
+                logging.error(f"Job worker {worker_id}: could not run job {popped[1]}: {e}")
+            finally:
+                _busy_workers.discard(asyncio.current_task())
+
+def start_workers(concurrency: int = JOB_WORKER_CONCURRENCY) -> list:
+    """
+    Starts `concurrency` worker tasks on the running loop (none without Redis). Callers
+    check `redis_client.ping()` first so workers are not started against a dead server.
+    """
+    if redis_client.redis_client is None or concurrency <= 0:
+        return []
+    return [asyncio.create_task(run_worker(i)) for i in range(concurrency)]
+
+async def stop_workers(workers: list, drain_seconds: float = JOB_WORKER_DRAIN_SECONDS):
+    """
+    Stops `workers`: idle ones are cancelled at once, busy ones get `drain_seconds` to finish
+    their current job before they are cancelled too. Returns once every worker has exited.
+    """
+    _stopping_workers.update(workers)
+    busy = [task for task in workers if task in _busy_workers]
+    for task in workers:
+        if task not in _busy_workers:
+            task.cancel()
+    if busy:
+        logging.info(f"Waiting up to {drain_seconds:g}s for {len(busy)} running job(s) to finish.")
+        _, unfinished = await asyncio.wait(busy, timeout=drain_seconds)
+        for task in unfinished:
+            task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    _stopping_workers.difference_update(workers)
@@ -0,0 +1,101 @@
+# app/services/llm_client_pool.py
+import os
+import asyncio
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import Any, ContextManager, Dict, Hashable, Iterator
+
+import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from openai import AsyncOpenAI
+
+from app.core.cache import TTLCache
+
+# --- Configuration ---
+# Callers hold a lease on a pooled client for the whole call or stream. A client evicted from
+# the pool (TTL or LRU) is closed once its last lease is released, never underneath a call.
+LLM_CLIENT_POOL_SIZE = int(os.getenv("LLM_CLIENT_POOL_SIZE", "256"))
+LLM_CLIENT_MAX_AGE_SECONDS = int(os.getenv("LLM_CLIENT_MAX_AGE_SECONDS", "3600"))
+
+_background_tasks = set()
+_leases: Dict[Any, int] = {}  # pooled client -> calls in flight
+_retired = set()  # evicted clients still leased
+
+async def _close(client: Any):
+    try:
+        if isinstance(client, AsyncOpenAI):
+            await client.close()
+        else:
+            await client.transport.close()
+    except Exception as e:
+        logging.warning(f"Failed to close pooled LLM client: {e}")
+
+def _close_soon(client: Any):
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # No loop (e.g. interpreter shutdown); the connections die with the process.
+    task = loop.create_task(_close(client))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def _on_evict(key: Hashable, client: Any):
+    if _leases.get(client):
+        _retired.add(client)
+    else:
+        _close_soon(client)
+
+# Keyed by (provider, sha256(api_key)) so raw keys never become dict keys or log lines.
+client_pool = TTLCache(maxsize=LLM_CLIENT_POOL_SIZE, ttl_seconds=LLM_CLIENT_MAX_AGE_SECONDS, on_evict=_on_evict)
+
+def _pool_key(provider: str, api_key: str) -> tuple[str, str]:
+    return provider, hashlib.sha256(api_key.encode()).hexdigest()
+
+def get_openai_client(api_key: str) -> AsyncOpenAI:
+    """Returns a pooled AsyncOpenAI client for this key, reusing its keep-alive connections."""
+    key = _pool_key("openai", api_key)
+    client = client_pool.get(key)
+    if client is None:
+        client = AsyncOpenAI(api_key=api_key, max_retries=0)  # Retries are handled by llm_resilience.
+        client_pool.set(key, client)
+    return client
+
+def get_gemini_model(api_key: str, model_name: str) -> genai.GenerativeModel:
+    """
+    Returns a GenerativeModel bound to a pooled per-key async client.
+    The key travels on the client's own credentials; genai.configure (process-global) is never called.
+    The SDK has no public hook for a per-model client, so this sets GenerativeModel._async_client;
+    google-generativeai is pinned and test_llm_client_pool.py fails if an upgrade breaks it.
+    """
+    key = _pool_key("google", api_key)
+    client = client_pool.get(key)
+    if client is None:
+        client = glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+        client_pool.set(key, client)
+    model = genai.GenerativeModel(model_name)
+    model._async_client = client
+    return model
+
+@contextmanager
+def _leased(client: Any, value: Any) -> Iterator[Any]:
+    _leases[client] = _leases.get(client, 0) + 1
+    try:
+        yield value
+    finally:
+        _leases[client] -= 1
+        if not _leases[client]:
+            del _leases[client]
+            if client in _retired:
+                _retired.discard(client)
+                _close_soon(client)
+
+def lease_openai_client(api_key: str) -> ContextManager[AsyncOpenAI]:
+    """`with lease_openai_client(key) as client:` keeps the pooled client open for the block."""
+    client = get_openai_client(api_key)
+    return _leased(client, client)
+
+def lease_gemini_model(api_key: str, model_name: str) -> ContextManager[genai.GenerativeModel]:
+    """`with lease_gemini_model(key, model) as model:` keeps the model's pooled client open for the block."""
+    model = get_gemini_model(api_key, model_name)
+    return _leased(model._async_client, model)
@@ -0,0 +1,153 @@
+# app/services/llm_hedging.py
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.services import llm_scheduler
+from app.services.llm_scheduler import TokenBucket
+
+# --- Configuration ---
+# Opt-in hedging for platform-key calls: if a call is still running after the model's
+# recent HEDGE_PERCENTILE latency, one duplicate is sent and whichever answers first wins
+# (the other is cancelled). Duplicates cost real tokens, so at most
+# LLM_HEDGE_BUDGET_PER_MINUTE are sent across all models, and each one needs its own
+# scheduler slot: if the model or provider has no free capacity right now, no hedge is sent.
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_BUDGET_PER_MINUTE = int(os.getenv("LLM_HEDGE_BUDGET_PER_MINUTE", "60"))
+# No hedging until a model has this many samples; the threshold never drops below the floor.
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "50"))
+LATENCY_WINDOW = 500
+
+class _ModelLatency:
+    """Rolling window of recent call latencies for one model, plus hedge counters."""
+    def __init__(self):
+        self.samples_ms = deque(maxlen=LATENCY_WINDOW)
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.over_budget = 0
+        self.no_capacity = 0
+
+    def percentile(self, fraction: float) -> float:
+        ordered = sorted(self.samples_ms)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def hedge_delay_seconds(self) -> float | None:
+        if len(self.samples_ms) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY_MS, self.percentile(HEDGE_PERCENTILE)) / 1000
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.samples_ms:
+            return {"samples": 0, "hedged": self.hedged, "hedge_wins": self.hedge_wins,
+                    "over_budget": self.over_budget, "no_capacity": self.no_capacity}
+        return {
+            "samples": len(self.samples_ms),
+            "p50_ms": round(self.percentile(0.5), 1),
+            "p95_ms": round(self.percentile(0.95), 1),
+            "p99_ms": round(self.percentile(0.99), 1),
+            "hedge_after_ms": round(max(HEDGE_MIN_DELAY_MS, self.percentile(HEDGE_PERCENTILE)), 1),
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "over_budget": self.over_budget,
+            "no_capacity": self.no_capacity,
+        }
+
+_latencies: Dict[str, _ModelLatency] = {}
+_budget = TokenBucket(LLM_HEDGE_BUDGET_PER_MINUTE)
+
+def _latency(model_name: str) -> _ModelLatency:
+    latency = _latencies.get(model_name)
+    if latency is None:
+        latency = _latencies[model_name] = _ModelLatency()
+    return latency
+
+async def _timed(latency: _ModelLatency, fn: Callable[[], Awaitable[Any]]) -> Any:
+    start = time.perf_counter()
+    try:
+        result = await fn()
+    except asyncio.CancelledError:
+        # A cancelled loser was at least this slow; dropping it would bias the window low.
+        latency.samples_ms.append((time.perf_counter() - start) * 1000)
+        raise
+    latency.samples_ms.append((time.perf_counter() - start) * 1000)
+    return result
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _hedge_attempt(latency: _ModelLatency, fn: Callable[[], Awaitable[Any]], slot: llm_scheduler.Slot,
+                         usage_of: Optional[Callable[[Any], tuple[int, int]]]) -> Any:
+    try:
+        result = await _timed(latency, fn)
+        if usage_of:
+            slot.record_usage(*usage_of(result))
+        return result
+    finally:
+        slot.release()
+
+# --- Public API ---
+async def run(
+    model_name: str,
+    fn: Callable[[], Awaitable[Any]],
+    prompt_text: str = "",
+    usage_of: Optional[Callable[[Any], tuple[int, int]]] = None
+) -> Any:
+    """
+    Awaits `fn()`, sending one duplicate `fn()` if the first is slower than the model's hedge
+    threshold. Only for idempotent calls on platform keys; user keys are never hedged.
+    The caller holds the scheduler slot for the first call; the duplicate takes a second
+    slot without waiting and charges `usage_of(result)` (input, output tokens) to it. If the
+    duplicate wins, the caller charges the same usage again for the cancelled first call.
+    """
+    latency = _latency(model_name)
+    delay = latency.hedge_delay_seconds() if LLM_HEDGING_ENABLED else None
+    if delay is None:
+        return await _timed(latency, fn)
+
+    primary = asyncio.create_task(_timed(latency, fn))
+    attempts = [primary]
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if done:
+            return primary.result()
+        if not _budget.try_acquire():
+            latency.over_budget += 1
+            return await primary
+        hedge_slot = await llm_scheduler.try_acquire_slot(model_name, prompt_text)
+        if hedge_slot is None:
+            _budget.debit(-1)  # Nothing was sent; give the budget back.
+            latency.no_capacity += 1
+            return await primary
+        latency.hedged += 1
+        hedge = asyncio.create_task(_hedge_attempt(latency, fn, hedge_slot, usage_of))
+        attempts.append(hedge)
+        pending = set(attempts)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if task.exception() is None), None)
+            if winner is not None:
+                if winner is hedge:
+                    latency.hedge_wins += 1
+                return winner.result()
+            # A failed attempt only counts if the other one fails too.
+            if not pending:
+                return done.pop().result()
+            logging.info(f"Hedged attempt for {model_name} failed, waiting for the other one.")
+    finally:
+        await _cancel([task for task in attempts if not task.done()])
+
+def get_stats() -> Dict[str, Any]:
+    """Rolling latency percentiles and hedge counts per model (for the metrics endpoint)."""
+    return {
+        "enabled": LLM_HEDGING_ENABLED,
+        "budget_per_minute": LLM_HEDGE_BUDGET_PER_MINUTE,
+        "budget_remaining": int(_budget.tokens),
+        "models": {name: latency.stats() for name, latency in _latencies.items()},
+    }
@@ -0,0 +1,229 @@
+# app/services/llm_resilience.py
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import openai
+from google.api_core import exceptions as google_exceptions
+
+from app.core.cache import TTLCache
+from app.services.llm_scheduler import provider_for_model
+
+# --- Configuration ---
+# Each provider call gets a deadline and, for transient failures (timeouts, connection
+# errors, 429, 5xx), retries with full-jitter exponential backoff. A circuit breaker per
+# provider and credential scope fails fast after repeated transient failures and lets a
+# single trial call through once `reset_timeout_seconds` has passed. Defaults can be
+# overridden per provider or model with LLM_RESILIENCE_JSON, e.g.
+#   {"gemini-2.5-flash-lite": {"timeout_seconds": 20}, "openai": {"failure_threshold": 10}}
+DEFAULT_POLICY = {
+    "timeout_seconds": 60.0,
+    "max_attempts": 3,
+    "backoff_base_seconds": 0.5,
+    "backoff_max_seconds": 8.0,
+    "failure_threshold": 5,
+    "reset_timeout_seconds": 30.0,
+}
+
+def _load_policy_overrides() -> Dict[str, Dict[str, Any]]:
+    raw = os.getenv("LLM_RESILIENCE_JSON")
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        logging.error(f"Ignoring invalid LLM_RESILIENCE_JSON: {e}")
+        return {}
+
+POLICY_OVERRIDES = _load_policy_overrides()
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_GOOGLE_ERRORS = (
+    google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError, google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable, google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+)
+
+class ProviderUnavailable(Exception):
+    """The provider is failing: its circuit is open, or retries were exhausted on transient errors."""
+    def __init__(self, message: str, retry_after_seconds: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+def policy_for(model_name: str) -> Dict[str, Any]:
+    provider = provider_for_model(model_name)
+    return {**DEFAULT_POLICY, **POLICY_OVERRIDES.get(provider, {}), **POLICY_OVERRIDES.get(model_name, {})}
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, RETRYABLE_GOOGLE_ERRORS)
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """The provider's Retry-After hint in seconds, if it sent one."""
+    response = getattr(error, "response", None)
+    value = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+# --- Circuit breaker ---
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive transient failures -> half_open after `reset_timeout`."""
+    def __init__(self, failure_threshold: int, reset_timeout_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.rejected = 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout_seconds - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if self.retry_after() > 0:
+                self.rejected += 1
+                return False
+            self.state, self.trial_in_flight = "half_open", False
+        if self.state == "half_open":
+            if self.trial_in_flight:
+                self.rejected += 1
+                return False
+            self.trial_in_flight = True
+        return True
+
+    def release_trial(self):
+        """The call was abandoned (cancelled or closed) with no verdict; let the next call be the trial."""
+        self.trial_in_flight = False
+
+    def record_success(self):
+        self.state, self.failures, self.trial_in_flight = "closed", 0, False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logging.warning(f"Circuit opened after {self.failures} consecutive provider failures.")
+            self.state, self.opened_at, self.trial_in_flight = "open", time.monotonic(), False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected,
+                "retry_after_seconds": round(self.retry_after(), 1) if self.state == "open" else 0.0}
+
+# Managed executions get a breaker per user, so the map is bounded; an evicted breaker just starts closed.
+_breakers = TTLCache(maxsize=10000, ttl_seconds=3600)
+
+def _breaker(model_name: str, scope: str) -> CircuitBreaker:
+    key = f"{provider_for_model(model_name)}:{scope}"
+    breaker = _breakers.get(key)
+    if breaker is None:
+        policy = policy_for(model_name)
+        breaker = CircuitBreaker(policy["failure_threshold"], policy["reset_timeout_seconds"])
+        _breakers.set(key, breaker)
+    return breaker
+
+def _backoff_seconds(policy: Dict[str, Any], attempt: int, error: BaseException) -> float:
+    hint = _retry_after(error)
+    if hint is not None and hint <= policy["backoff_max_seconds"]:
+        return hint
+    return random.uniform(0, min(policy["backoff_max_seconds"], policy["backoff_base_seconds"] * 2 ** attempt))
+
+def _unavailable(model_name: str, breaker: CircuitBreaker, error: Optional[BaseException] = None) -> ProviderUnavailable:
+    provider = provider_for_model(model_name)
+    if error is None:
+        return ProviderUnavailable(f"Provider '{provider}' is temporarily unavailable.", breaker.retry_after())
+    detail = "timed out" if isinstance(error, TimeoutError) else str(error)
+    return ProviderUnavailable(f"Provider '{provider}' failed for {model_name}: {detail}", breaker.retry_after() or None)
+
+# --- Public API ---
+async def call(model_name: str, fn: Callable[[], Awaitable[Any]], scope: str = "platform") -> Any:
+    """
+    Runs `fn()` with the model's deadline, retry and circuit-breaker policy. `scope` separates
+    breakers per credential (e.g. a user's own key hitting its quota must not trip the platform's).
+    Non-retryable errors (bad request, auth) propagate unchanged.
+    """
+    policy, breaker = policy_for(model_name), _breaker(model_name, scope)
+    for attempt in range(policy["max_attempts"]):
+        if not breaker.allow():
+            raise _unavailable(model_name, breaker)
+        holds_trial = breaker.state == "half_open"
+        try:
+            async with asyncio.timeout(policy["timeout_seconds"]):
+                result = await fn()
+        except Exception as e:
+            if not is_retryable(e):
+                breaker.record_success()  # The provider answered; the request itself was at fault.
+                raise
+            breaker.record_failure()
+            logging.warning(f"Transient failure from {model_name} (attempt {attempt + 1}/{policy['max_attempts']}): {e!r}")
+            if attempt + 1 == policy["max_attempts"] or breaker.state == "open":
+                raise _unavailable(model_name, breaker, e) from e
+            await asyncio.sleep(_backoff_seconds(policy, attempt, e))
+            continue
+        except BaseException:
+            # Cancelled (client gone, worker shutting down): no verdict, but free the half-open slot.
+            if holds_trial:
+                breaker.release_trial()
+            raise
+        breaker.record_success()
+        return result
+
+async def stream(model_name: str, factory: Callable[[], AsyncIterator[str]], scope: str = "platform") -> AsyncIterator[str]:
+    """
+    Streaming counterpart of call(). Retries only happen before the first chunk (nothing has
+    reached the client yet); `timeout_seconds` bounds the wait for each chunk.
+    """
+    policy, breaker = policy_for(model_name), _breaker(model_name, scope)
+    for attempt in range(policy["max_attempts"]):
+        if not breaker.allow():
+            raise _unavailable(model_name, breaker)
+        holds_trial = breaker.state == "half_open"
+        chunks = factory()
+        started = False
+        try:
+            while True:
+                try:
+                    async with asyncio.timeout(policy["timeout_seconds"]):
+                        chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    break
+                if not started:
+                    started = True
+                    breaker.record_success()
+                yield chunk
+        except Exception as e:
+            if started:
+                raise
+            if not is_retryable(e):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            logging.warning(f"Transient failure opening {model_name} stream (attempt {attempt + 1}/{policy['max_attempts']}): {e!r}")
+            if attempt + 1 == policy["max_attempts"] or breaker.state == "open":
+                raise _unavailable(model_name, breaker, e) from e
+            await asyncio.sleep(_backoff_seconds(policy, attempt, e))
+            continue
+        except BaseException:
+            if holds_trial and not started:
+                breaker.release_trial()
+            raise
+        finally:
+            await chunks.aclose()
+        if not started:
+            breaker.record_success()
+        return
+
+def get_stats() -> Dict[str, Any]:
+    """Circuit state per provider and credential scope (for the metrics endpoint)."""
+    return {key: breaker.stats() for key, breaker in _breakers.items()}
@@ -0,0 +1,262 @@
+# app/services/llm_scheduler.py
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+# --- Configuration ---
+# Every outbound LLM call takes a slot from this scheduler: a per-model and a per-provider
+# concurrency semaphore, then request (RPM) and token (TPM) buckets for both. Limits
+# default to the values below and can be overridden with LLM_LIMITS_JSON, e.g.
+#   {"openai": {"concurrency": 16, "rpm": 500}, "gpt-4o-mini": {"tpm": 200000}}
+# Keys are provider names ("google", "openai") or model names; omitted fields keep defaults.
+DEFAULT_PROVIDER_LIMITS = {
+    "google": {"concurrency": 32, "rpm": 1000, "tpm": 1_000_000},
+    "openai": {"concurrency": 32, "rpm": 500, "tpm": 200_000},
+}
+DEFAULT_MODEL_LIMITS = {"concurrency": 16, "rpm": None, "tpm": None}
+# Requests waiting for a slot beyond these bounds are rejected instead of piling up.
+LLM_MAX_QUEUE_DEPTH = int(os.getenv("LLM_MAX_QUEUE_DEPTH", "200"))
+LLM_MAX_QUEUE_WAIT_SECONDS = float(os.getenv("LLM_MAX_QUEUE_WAIT_SECONDS", "30"))
+# Output length is unknown up front; this is charged to the TPM bucket and corrected afterwards.
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "256"))
+WAIT_SAMPLE_SIZE = 1000
+
+def _load_limit_overrides() -> Dict[str, Dict[str, Any]]:
+    raw = os.getenv("LLM_LIMITS_JSON")
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        logging.error(f"Ignoring invalid LLM_LIMITS_JSON: {e}")
+        return {}
+
+LIMIT_OVERRIDES = _load_limit_overrides()
+
+class SchedulerOverloaded(Exception):
+    """Raised when a call cannot get a slot (queue full or waited too long)."""
+
+def provider_for_model(model_name: str) -> str:
+    return "google" if model_name.startswith("gemini") else "openai"
+
+# --- Rate limiting primitives ---
+class TokenBucket:
+    """Refills `per_minute` units per minute, up to one minute's worth. Waiters are served FIFO."""
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate_per_second = per_minute / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate_per_second)
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        """Takes `amount` units if they are available right now, without waiting."""
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def debit(self, amount: float):
+        """Charges usage discovered after the fact (may go negative, delaying later callers)."""
+        self._refill()
+        self.tokens -= amount
+
+class _Limiter:
+    """Concurrency and rate limits plus metrics for one provider or model."""
+    def __init__(self, name: str, limits: Dict[str, Any]):
+        self.name = name
+        self.semaphore = asyncio.Semaphore(limits["concurrency"])
+        self.requests = TokenBucket(limits["rpm"]) if limits.get("rpm") else None
+        self.tokens = TokenBucket(limits["tpm"]) if limits.get("tpm") else None
+        self.limits = limits
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_ms = deque(maxlen=WAIT_SAMPLE_SIZE)
+
+    async def acquire(self, estimated_tokens: int):
+        await self.semaphore.acquire()
+        try:
+            if self.requests:
+                await self.requests.acquire(1)
+            if self.tokens:
+                await self.tokens.acquire(estimated_tokens)
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    async def try_acquire(self, estimated_tokens: int) -> bool:
+        """Takes a slot only if one is free right now; never queues behind other callers."""
+        buckets = [bucket for bucket in (self.requests, self.tokens) if bucket]
+        if self.semaphore.locked() or any(bucket._lock.locked() for bucket in buckets):
+            return False  # Others are already waiting here.
+        await self.semaphore.acquire()  # Does not suspend: the semaphore is not locked.
+        if self.requests and not self.requests.try_acquire(1):
+            self.semaphore.release()
+            return False
+        if self.tokens and not self.tokens.try_acquire(min(estimated_tokens, self.tokens.capacity)):
+            if self.requests:
+                self.requests.debit(-1)
+            self.semaphore.release()
+            return False
+        return True
+
+    def refund(self, estimated_tokens: int):
+        """Undoes a successful try_acquire() that ended up unused."""
+        if self.requests:
+            self.requests.debit(-1)
+        if self.tokens:
+            self.tokens.debit(-min(estimated_tokens, self.tokens.capacity))
+        self.semaphore.release()
+
+    def release(self):
+        self.semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.wait_ms)
+        return {
+            "limits": self.limits,
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_ms_avg": round(sum(waits) / len(waits), 2) if waits else 0.0,
+            "wait_ms_p95": round(waits[int(len(waits) * 0.95) - 1], 2) if waits else 0.0,
+            "wait_ms_max": round(waits[-1], 2) if waits else 0.0,
+        }
+
+# --- Registry ---
+# asyncio primitives bind to the loop that first waits on them, so the limiters are rebuilt
+# if the running loop changes (only relevant to scripts and tests that call asyncio.run twice).
+_limiters: Dict[str, _Limiter] = {}
+_limiters_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _limits_for(name: str, defaults: Dict[str, Any]) -> Dict[str, Any]:
+    return {**defaults, **LIMIT_OVERRIDES.get(name, {})}
+
+def _limiter(name: str, is_provider: bool) -> _Limiter:
+    global _limiters_loop
+    loop = asyncio.get_running_loop()
+    if loop is not _limiters_loop:
+        _limiters.clear()
+        _limiters_loop = loop
+    limiter = _limiters.get(name)
+    if limiter is None:
+        defaults = DEFAULT_PROVIDER_LIMITS.get(name, DEFAULT_MODEL_LIMITS) if is_provider else DEFAULT_MODEL_LIMITS
+        limiter = _limiters[name] = _Limiter(name, _limits_for(name, defaults))
+    return limiter
+
+class Slot:
+    """Handed to the caller while it holds a slot; report real usage to correct the TPM charge."""
+    def __init__(self, limiters: list, estimated_tokens: int):
+        self._limiters = limiters
+        self._estimated_tokens = estimated_tokens
+        self._released = False
+
+    def record_usage(self, input_tokens: int, output_tokens: int):
+        extra = (input_tokens or 0) + (output_tokens or 0) - self._estimated_tokens
+        if extra > 0:
+            for limiter in self._limiters:
+                if limiter.tokens:
+                    limiter.tokens.debit(extra)
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        for limiter in self._limiters:
+            limiter.in_flight -= 1
+            limiter.completed += 1
+            limiter.release()
+
+@asynccontextmanager
+async def slot(model_name: str, prompt_text: str = "") -> AsyncIterator[Slot]:
+    """
+    Holds a model + provider slot for the duration of the block (including a whole stream).
+    Raises SchedulerOverloaded when the provider queue is full or the wait exceeds the limit.
+    """
+    provider = provider_for_model(model_name)
+    provider_limiter, model_limiter = _limiter(provider, True), _limiter(model_name, False)
+    estimated_tokens = max(1, len(prompt_text) // 4) + EXPECTED_OUTPUT_TOKENS
+    if provider_limiter.queued >= LLM_MAX_QUEUE_DEPTH:
+        provider_limiter.rejected += 1
+        raise SchedulerOverloaded(f"Too many queued requests for provider '{provider}'. Try again shortly.")
+
+    acquired = []
+    queued_at = time.perf_counter()
+    provider_limiter.queued += 1
+    model_limiter.queued += 1
+    try:
+        async with asyncio.timeout(LLM_MAX_QUEUE_WAIT_SECONDS):
+            # Model first, so a request blocked on its model does not hold a provider-wide slot.
+            for limiter in (model_limiter, provider_limiter):
+                await limiter.acquire(estimated_tokens)
+                acquired.append(limiter)
+    except TimeoutError:
+        for limiter in acquired:
+            limiter.release()
+        provider_limiter.rejected += 1
+        raise SchedulerOverloaded(f"Timed out waiting for a '{model_name}' slot. Try again shortly.")
+    except BaseException:
+        for limiter in acquired:
+            limiter.release()
+        raise
+    finally:
+        provider_limiter.queued -= 1
+        model_limiter.queued -= 1
+
+    wait_ms = (time.perf_counter() - queued_at) * 1000
+    for limiter in acquired:
+        limiter.wait_ms.append(wait_ms)
+        limiter.in_flight += 1
+    held = Slot(acquired, estimated_tokens)
+    try:
+        yield held
+    finally:
+        held.release()
+
+async def try_acquire_slot(model_name: str, prompt_text: str = "") -> Optional[Slot]:
+    """
+    Takes a model + provider slot only if one is free right now, without queueing (for
+    optional extra calls such as hedges). Returns None otherwise; the caller must release() it.
+    """
+    provider = provider_for_model(model_name)
+    estimated_tokens = max(1, len(prompt_text) // 4) + EXPECTED_OUTPUT_TOKENS
+    acquired = []
+    for limiter in (_limiter(model_name, False), _limiter(provider, True)):
+        if not await limiter.try_acquire(estimated_tokens):
+            for taken in acquired:
+                taken.refund(estimated_tokens)
+            return None
+        acquired.append(limiter)
+    for limiter in acquired:
+        limiter.in_flight += 1
+    return Slot(acquired, estimated_tokens)
+
+def get_stats() -> Dict[str, Any]:
+    """Queue depth, in-flight calls and wait times per provider and model (for the metrics endpoint)."""
+    providers = {name: l.stats() for name, l in _limiters.items() if name in DEFAULT_PROVIDER_LIMITS}
+    models = {name: l.stats() for name, l in _limiters.items() if name not in DEFAULT_PROVIDER_LIMITS}
+    return {"providers": providers, "models": models, "max_queue_depth": LLM_MAX_QUEUE_DEPTH}
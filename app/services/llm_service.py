@@ -7,28 +7,32 @@ import hashlib
 import logging
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator, Awaitable, Callable, Iterable, Tuple
 
 import google.generativeai as genai
 from openai import AsyncOpenAI
 from fastapi import HTTPException
 from uuid import uuid4
 
-from app.services import cost_service, firestore_service
+from app.services import analysis_cache, cost_service, firestore_service, llm_client_pool, llm_hedging, llm_resilience, llm_scheduler, response_cache
 from app.schemas.prompt import (
     BenchmarkRequest, BenchmarkResult, APEOptimizeRequest,
     DiagnoseRequest, BreakdownRequest, TemplateGenerateRequest,
     PromptTemplateCreate, RecommendRequest, SandboxRequest,
     SandboxResult, SandboxPromptInput, PromptExecuteResponse, PromptExecuteRequest,
-    PromptComposeRequest, PromptComposeResponse
+    PromptComposeRequest, PromptComposeResponse, PromptExecutionStreamSummary,
+    BenchmarkStreamError, SandboxStreamError, StreamCompleted
 )
 from app.core.db import db
+from app.core import singleflight
+from app.core.streaming import sse_event
 
 # --- Constants & Configuration ---
 # FIX: Use the explicit cheapest Gemini model ID as confirmed by documentation.
 DEFAULT_GEMINI_MODEL = 'gemini-2.5-flash-lite'
-API_CACHE_COLLECTION = "api_cache"
-CACHE_DURATION_MINUTES = 60
+# Bump an entry whenever its meta-prompt text or post-processing changes, so cached
+# analyses produced by the old version are no longer served (see analysis_cache).
+META_PROMPT_VERSIONS = {"optimize": 1, "diagnose": 1, "breakdown": 1}
 
 # --- Configuration ---
 load_dotenv()
@@ -42,19 +46,27 @@ except Exception as e:
     logging.error(f"Could not configure Google AI: {e}")
     platform_gemini_client = None
 try:
-    platform_openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    # Retries are handled by llm_resilience, so the SDK's own retry loop is disabled.
+    platform_openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
 except Exception as e:
     logging.error(f"Could not configure OpenAI: {e}")
     platform_openai_client = None
 
 # --- Core LLM Call Functions ---
+def _estimate_tokens(text: str) -> int:
+    """Rough local token estimate (~4 characters per token) used when a provider omits usage data."""
+    if not text:
+        return 0
+    return max(1, round(len(text) / 4))
+
 async def _call_gemini_with_client(client: genai.GenerativeModel, prompt_text: str) -> tuple[str, int, int]:
-    input_token_count_response = await client.count_tokens_async(prompt_text)
-    input_tokens = input_token_count_response.total_tokens
+    # One round trip: token counts come from the generation response's usage metadata
+    # instead of separate count_tokens calls before and after.
     response = await client.generate_content_async(prompt_text)
     generated_text = response.text
-    output_token_count_response = await client.count_tokens_async(generated_text)
-    output_tokens = output_token_count_response.total_tokens
+    usage = getattr(response, "usage_metadata", None)
+    input_tokens = getattr(usage, "prompt_token_count", 0) or _estimate_tokens(prompt_text)
+    output_tokens = getattr(usage, "candidates_token_count", 0) or _estimate_tokens(generated_text)
     return generated_text, input_tokens, output_tokens
 
 async def _call_openai_with_client(client: AsyncOpenAI, model_name: str, prompt_text: str) -> tuple[str, int, int]:
@@ -67,6 +79,83 @@ async def _call_openai_with_client(client: AsyncOpenAI, model_name: str, prompt_
     output_tokens = response.usage.completion_tokens
     return generated_text, input_tokens, output_tokens
 
+def _token_usage(result: tuple[str, int, int]) -> tuple[int, int]:
+    """(input, output) tokens of a _call_*_with_client result, for charging hedged duplicates."""
+    return result[1], result[2]
+
+async def _scheduled_generate(model: genai.GenerativeModel, model_name: str, contents: str, **kwargs):
+    """generate_content_async through the LLM scheduler, for the JSON meta-prompt helpers below."""
+    async with llm_scheduler.slot(model_name, contents) as slot:
+        response = await llm_resilience.call(model_name, lambda: model.generate_content_async(contents, **kwargs))
+        usage = getattr(response, "usage_metadata", None)
+        slot.record_usage(getattr(usage, "prompt_token_count", 0), getattr(usage, "candidates_token_count", 0))
+        return response
+
+# --- Streaming LLM Call Functions ---
+# These yield text deltas as the provider produces them and fill `usage` with the
+# input/output token counts once the stream has finished.
+async def _stream_gemini_with_client(client: genai.GenerativeModel, prompt_text: str, usage: dict) -> AsyncIterator[str]:
+    response = await client.generate_content_async(prompt_text, stream=True)
+    parts, usage_metadata = [], None
+    async for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            text = ""  # A chunk with no parts (e.g. only a finish reason or usage data).
+        if text:
+            parts.append(text)
+            yield text
+        usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+    usage["input_tokens"] = getattr(usage_metadata, "prompt_token_count", 0) or _estimate_tokens(prompt_text)
+    usage["output_tokens"] = getattr(usage_metadata, "candidates_token_count", 0) or _estimate_tokens("".join(parts))
+
+async def _stream_openai_with_client(client: AsyncOpenAI, model_name: str, prompt_text: str, usage: dict) -> AsyncIterator[str]:
+    stream = await client.chat.completions.create(
+        model=model_name,
+        messages=[{"role": "user", "content": prompt_text}],
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    parts = []
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+        if chunk.usage:
+            usage["input_tokens"] = chunk.usage.prompt_tokens
+            usage["output_tokens"] = chunk.usage.completion_tokens
+    usage.setdefault("input_tokens", _estimate_tokens(prompt_text))
+    usage.setdefault("output_tokens", _estimate_tokens("".join(parts)))
+
+async def _execution_events(model_name: str, prompt_text: str, prompt_version_id: str, chunks: AsyncIterator[str], usage: dict, failure_label: str) -> AsyncIterator[str]:
+    """
+    Relays a provider stream as SSE: one `token` event per delta, then a `done` event with
+    token counts, cost and latency (time to first token and total). Failures after the
+    response has started are reported as an `error` event, since the status is already sent.
+    """
+    start_time = time.perf_counter()
+    first_token_time = None
+    try:
+        # The scheduler slot is held for the whole stream, not just until the first token.
+        async with llm_scheduler.slot(model_name, prompt_text) as slot:
+            async for text in chunks:
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                yield sse_event("token", {"text": text})
+            slot.record_usage(usage["input_tokens"], usage["output_tokens"])
+        end_time = time.perf_counter()
+        cost = await cost_service.calculate_cost_from_tokens(model_name, usage["input_tokens"], usage["output_tokens"])
+    except Exception as e:
+        logging.error(f"{failure_label} for model {model_name}: {e}")
+        yield sse_event("error", {"detail": f"{failure_label}: {str(e)}"})
+        return
+    yield sse_event("done", PromptExecutionStreamSummary(
+        id=str(uuid4()), prompt_version_id=prompt_version_id, model=model_name, executed_at=datetime.now(timezone.utc),
+        input_token_count=usage["input_tokens"], output_token_count=usage["output_tokens"], cost=cost,
+        time_to_first_token_ms=int(((first_token_time or end_time) - start_time) * 1000),
+        latency_ms=int((end_time - start_time) * 1000)
+    ))
+
 # --- FIX: Add the missing compose_prompt function ---
 async def compose_prompt(request: PromptComposeRequest) -> PromptComposeResponse:
     template_text = request.template_text
@@ -79,6 +168,10 @@ async def compose_prompt(request: PromptComposeRequest) -> PromptComposeResponse
 
 
 # --- Main Service Functions ---
+def _provider_unavailable_error(error: llm_resilience.ProviderUnavailable) -> HTTPException:
+    headers = {"Retry-After": str(max(1, round(error.retry_after_seconds)))} if error.retry_after_seconds else None
+    return HTTPException(status_code=503, detail=str(error), headers=headers)
+
 async def execute_managed_prompt(user_id: str, model_name: str, prompt_text: str) -> PromptExecuteResponse:
     provider = "google" if model_name.startswith("gemini") else "openai"
     decrypted_key = await firestore_service.get_decrypted_user_api_key(user_id, provider)
@@ -87,16 +180,23 @@ async def execute_managed_prompt(user_id: str, model_name: str, prompt_text: str
     generated_text, input_tokens, output_tokens = "An error occurred.", 0, 0
     start_time = time.perf_counter()
     try:
-        if provider == "google":
-            genai.configure(api_key=decrypted_key)
-            user_client = genai.GenerativeModel(model_name)
-            generated_text, input_tokens, output_tokens = await _call_gemini_with_client(user_client, prompt_text)
-        elif provider == "openai":
-            user_client = AsyncOpenAI(api_key=decrypted_key)
-            generated_text, input_tokens, output_tokens = await _call_openai_with_client(user_client, model_name, prompt_text)
+        async with llm_scheduler.slot(model_name, prompt_text) as slot:
+            if provider == "google":
+                with llm_client_pool.lease_gemini_model(decrypted_key, model_name) as user_client:
+                    generated_text, input_tokens, output_tokens = await llm_resilience.call(
+                        model_name, lambda: _call_gemini_with_client(user_client, prompt_text), scope=f"user:{user_id}")
+            elif provider == "openai":
+                with llm_client_pool.lease_openai_client(decrypted_key) as user_client:
+                    generated_text, input_tokens, output_tokens = await llm_resilience.call(
+                        model_name, lambda: _call_openai_with_client(user_client, model_name, prompt_text), scope=f"user:{user_id}")
+            slot.record_usage(input_tokens, output_tokens)
         end_time = time.perf_counter()
         latency_ms = (end_time - start_time) * 1000
         cost = await cost_service.calculate_cost_from_tokens(model_name, input_tokens, output_tokens)
+    except llm_scheduler.SchedulerOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except llm_resilience.ProviderUnavailable as e:
+        raise _provider_unavailable_error(e)
     except Exception as e:
         logging.error(f"Managed execution failed for user {user_id} with model {model_name}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to execute prompt with the provided key: {str(e)}")
@@ -111,16 +211,26 @@ async def execute_platform_prompt(request: PromptExecuteRequest) -> PromptExecut
     generated_text, input_tokens, output_tokens = "An error occurred.", 0, 0
     start_time = time.perf_counter()
     try:
-        if provider == "google":
-            if not platform_gemini_client: raise ValueError("Google AI client is not configured.")
-            client = genai.GenerativeModel(request.model)
-            generated_text, input_tokens, output_tokens = await _call_gemini_with_client(client, request.prompt_text)
-        elif provider == "openai":
-            if not platform_openai_client: raise ValueError("OpenAI client is not configured.")
-            generated_text, input_tokens, output_tokens = await _call_openai_with_client(platform_openai_client, request.model, request.prompt_text)
+        async with llm_scheduler.slot(request.model, request.prompt_text) as slot:
+            if provider == "google":
+                if not platform_gemini_client: raise ValueError("Google AI client is not configured.")
+                client = genai.GenerativeModel(request.model)
+                generated_text, input_tokens, output_tokens = await llm_resilience.call(
+                    request.model, lambda: llm_hedging.run(request.model, lambda: _call_gemini_with_client(client, request.prompt_text),
+                                                     request.prompt_text, _token_usage))
+            elif provider == "openai":
+                if not platform_openai_client: raise ValueError("OpenAI client is not configured.")
+                generated_text, input_tokens, output_tokens = await llm_resilience.call(
+                    request.model, lambda: llm_hedging.run(request.model, lambda: _call_openai_with_client(platform_openai_client, request.model, request.prompt_text),
+                                                     request.prompt_text, _token_usage))
+            slot.record_usage(input_tokens, output_tokens)
         end_time = time.perf_counter()
         latency_ms = (end_time - start_time) * 1000
         cost = await cost_service.calculate_cost_from_tokens(request.model, input_tokens, output_tokens)
+    except llm_scheduler.SchedulerOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except llm_resilience.ProviderUnavailable as e:
+        raise _provider_unavailable_error(e)
     except Exception as e:
         logging.error(f"Platform execution failed for model {request.model}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to execute prompt with platform key: {str(e)}")
@@ -130,41 +240,177 @@ async def execute_platform_prompt(request: PromptExecuteRequest) -> PromptExecut
         output_token_count=output_tokens, latency_ms=int(latency_ms), cost=cost, rating=None
     )
 
+async def stream_managed_prompt(user_id: str, model_name: str, prompt_text: str) -> AsyncIterator[str]:
+    """Streaming variant of execute_managed_prompt. A missing key is reported as an `error` event."""
+    provider = "google" if model_name.startswith("gemini") else "openai"
+    decrypted_key = await firestore_service.get_decrypted_user_api_key(user_id, provider)
+    if not decrypted_key:
+        yield sse_event("error", {"detail": f"API key for provider '{provider}' not found or invalid for this user."})
+        return
+    usage = {}
+    if provider == "google":
+        lease = llm_client_pool.lease_gemini_model(decrypted_key, model_name)
+        stream_with = lambda user_client: _stream_gemini_with_client(user_client, prompt_text, usage)
+    else:
+        lease = llm_client_pool.lease_openai_client(decrypted_key)
+        stream_with = lambda user_client: _stream_openai_with_client(user_client, model_name, prompt_text, usage)
+    # The lease keeps the pooled client open until the stream ends or the client disconnects.
+    with lease as user_client:
+        chunks = llm_resilience.stream(model_name, lambda: stream_with(user_client), scope=f"user:{user_id}")
+        async for frame in _execution_events(model_name, prompt_text, "managed-run", chunks, usage, "Failed to execute prompt with the provided key"):
+            yield frame
+
+async def stream_platform_prompt(request: PromptExecuteRequest) -> AsyncIterator[str]:
+    """Streaming variant of execute_platform_prompt. A missing platform client is reported as an `error` event."""
+    provider = "google" if request.model.startswith("gemini") else "openai"
+    if not (platform_gemini_client if provider == "google" else platform_openai_client):
+        label = "Google AI" if provider == "google" else "OpenAI"
+        yield sse_event("error", {"detail": f"Failed to execute prompt with platform key: {label} client is not configured."})
+        return
+    usage = {}
+    if provider == "google":
+        chunks = llm_resilience.stream(request.model, lambda: _stream_gemini_with_client(genai.GenerativeModel(request.model), request.prompt_text, usage))
+    else:
+        chunks = llm_resilience.stream(request.model, lambda: _stream_openai_with_client(platform_openai_client, request.model, request.prompt_text, usage))
+    async for frame in _execution_events(request.model, request.prompt_text, "platform-run", chunks, usage, "Failed to execute prompt with platform key"):
+        yield frame
+
+def _is_overloaded(outcome: Any) -> bool:
+    return isinstance(outcome, HTTPException) and outcome.status_code == 503
+
+async def _gather_shedding_per_item(awaitables: list, overloaded_result: Callable[[int, HTTPException], Any]) -> list:
+    """
+    asyncio.gather for multi-model requests: an item the scheduler sheds (503) is reported as
+    overloaded_result(index, error) instead of failing the items that did run. Only when every
+    item was shed does the request itself get the 503.
+    """
+    outcomes = await asyncio.gather(*awaitables, return_exceptions=True)
+    if outcomes and all(_is_overloaded(outcome) for outcome in outcomes):
+        raise outcomes[0]
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException) and not _is_overloaded(outcome):
+            raise outcome
+    return [overloaded_result(index, outcome) if _is_overloaded(outcome) else outcome for index, outcome in enumerate(outcomes)]
+
 async def benchmark_prompt(request: BenchmarkRequest) -> list[BenchmarkResult]:
     tasks = [execute_single_model_benchmark(model_name, request.prompt_text) for model_name in request.models]
-    results = await asyncio.gather(*tasks)
-    return results
+    return await _gather_shedding_per_item(tasks, lambda index, error: BenchmarkResult(
+        model_name=request.models[index], generated_text=f"Error calling {request.models[index]}: {error.detail}", latency_ms=0))
+
+async def _as_completed(labelled: Iterable[Tuple[str, Awaitable]]) -> AsyncIterator[Tuple[str, Any, Exception | None]]:
+    """
+    Yields (label, result, error) for each awaitable in completion order. One failure does not
+    stop the others; if the consumer stops early (client disconnected) the rest are cancelled.
+    """
+    async def run(label, awaitable):
+        try:
+            return label, await awaitable, None
+        except Exception as e:
+            return label, None, e
+
+    tasks = [asyncio.create_task(run(label, awaitable)) for label, awaitable in labelled]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def _error_message(error: Exception) -> str:
+    return str(error.detail) if isinstance(error, HTTPException) else str(error)
 
-async def execute_single_model_benchmark(model_name: str, prompt_text: str) -> BenchmarkResult:
+async def stream_benchmark_prompt(request: BenchmarkRequest) -> AsyncIterator[Tuple[str, Any]]:
+    """Streaming benchmark_prompt: ('result', BenchmarkResult) / ('error', BenchmarkStreamError) as each model finishes."""
+    failed = 0
+    async for model_name, result, error in _as_completed(
+        (model_name, execute_single_model_benchmark(model_name, request.prompt_text, raise_on_failure=True)) for model_name in request.models
+    ):
+        if error:
+            failed += 1
+            logging.error(f"Benchmark failed for {model_name}: {error}")
+            yield "error", BenchmarkStreamError(model_name=model_name, error=_error_message(error))
+        else:
+            yield "result", result
+    yield "done", StreamCompleted(completed=len(request.models) - failed, failed=failed)
+
+class ModelCallFailed(Exception):
+    """A benchmark call failed at the provider; `result` is the error BenchmarkResult reported in its place."""
+    def __init__(self, result: BenchmarkResult):
+        super().__init__(result.generated_text)
+        self.result = result
+
+async def execute_single_model_benchmark(model_name: str, prompt_text: str, raise_on_failure: bool = False) -> BenchmarkResult:
+    """
+    Returns the model's BenchmarkResult. A provider failure comes back as a result whose text
+    describes the error, or raises ModelCallFailed with `raise_on_failure` (streaming callers,
+    which report failures as separate events).
+    """
+    # Identical (model, prompt) calls in flight at the same time share one cache lookup,
+    # one provider call and one cache write.
     cache_key = hashlib.sha256(f"{model_name}:{prompt_text}".encode()).hexdigest()
-    cache_ref = db.collection(API_CACHE_COLLECTION).document(cache_key)
-    cached_doc = await cache_ref.get()
-    if cached_doc.exists:
-        cached_data = cached_doc.to_dict()
-        if "created_at" in cached_data:
-            cached_at = cached_data["created_at"]
-            if datetime.now(timezone.utc) - cached_at < timedelta(minutes=CACHE_DURATION_MINUTES):
-                logging.info(f"⚡️ Cache HIT for model {model_name}.")
-                return BenchmarkResult(**cached_data.get("result", {}))
+    try:
+        return await singleflight.run(cache_key, lambda: _execute_single_model_benchmark(cache_key, model_name, prompt_text))
+    except ModelCallFailed as e:
+        if raise_on_failure:
+            raise
+        return e.result
+
+async def _execute_single_model_benchmark(cache_key: str, model_name: str, prompt_text: str) -> BenchmarkResult:
+    cached_result, lock_token = await response_cache.get(cache_key), None
+    if cached_result is None:
+        cached_result, lock_token = await response_cache.wait_or_lock(cache_key)
+    if cached_result is not None:
+        logging.info(f"⚡️ Cache HIT for model {model_name}.")
+        return BenchmarkResult(**cached_result)
     logging.info(f"💸 Cache MISS for model {model_name}. Calling external API.")
     start_time = time.perf_counter()
     generated_text, input_token_count, output_token_count = "Error: Model not supported.", 0, 0
+    failed = False
     try:
-        if model_name.startswith("gemini"):
-            client = genai.GenerativeModel(model_name)
-            generated_text, input_token_count, output_token_count = await _call_gemini_with_client(client, prompt_text)
-        elif model_name.startswith("gpt"):
-            generated_text, input_token_count, output_token_count = await _call_openai_with_client(platform_openai_client, model_name, prompt_text)
+        async with llm_scheduler.slot(model_name, prompt_text) as slot:
+            if model_name.startswith("gemini"):
+                client = genai.GenerativeModel(model_name)
+                generated_text, input_token_count, output_token_count = await llm_resilience.call(
+                    model_name, lambda: llm_hedging.run(model_name, lambda: _call_gemini_with_client(client, prompt_text), prompt_text, _token_usage))
+            elif model_name.startswith("gpt"):
+                generated_text, input_token_count, output_token_count = await llm_resilience.call(
+                    model_name, lambda: llm_hedging.run(model_name, lambda: _call_openai_with_client(platform_openai_client, model_name, prompt_text),
+                                                   prompt_text, _token_usage))
+            slot.record_usage(input_token_count, output_token_count)
+    except llm_scheduler.SchedulerOverloaded as e:
+        # Not a model failure, so it must not be cached as a result.
+        if lock_token:
+            await response_cache.release_fill_lock(cache_key, lock_token)
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logging.error(f"API call failed for {model_name}: {e}")
-        generated_text = f"Error calling {model_name}: {str(e)}"
+        generated_text, failed = f"Error calling {model_name}: {str(e)}", True
     end_time = time.perf_counter()
     latency_ms = (end_time - start_time) * 1000
     result = BenchmarkResult(model_name=model_name, generated_text=generated_text, latency_ms=latency_ms, input_token_count=input_token_count, output_token_count=output_token_count)
-    await cache_ref.set({"created_at": datetime.now(timezone.utc), "result": result.model_dump()})
+    if failed:
+        # A transient provider error must not be served from cache for the next hour.
+        if lock_token:
+            await response_cache.release_fill_lock(cache_key, lock_token)
+        raise ModelCallFailed(result)
+    if lock_token:
+        try:
+            await response_cache.put_shared(cache_key, result.model_dump())
+        finally:
+            await response_cache.release_fill_lock(cache_key, lock_token)
+    else:
+        response_cache.put(cache_key, result.model_dump())
     return result
 
 async def generate_optimized_prompt(request: APEOptimizeRequest) -> dict:
+    try:
+        return await analysis_cache.cached("optimize", META_PROMPT_VERSIONS["optimize"], DEFAULT_GEMINI_MODEL, request,
+                                           lambda: _generate_optimized_prompt(request))
+    except Exception as e:
+        logging.error(f"Error optimizing prompt: {e}")
+        return {"optimized_prompt": "Error: Could not generate prompt.", "reasoning_summary": str(e)}
+
+async def _generate_optimized_prompt(request: APEOptimizeRequest) -> dict:
     model = genai.GenerativeModel(DEFAULT_GEMINI_MODEL)
     formatted_examples = "\n".join([f"INPUT: {ex.input}\nOUTPUT: {ex.output}\n" for ex in request.examples])
     meta_prompt = f"""
@@ -176,14 +422,14 @@ EXAMPLES:\n{formatted_examples}
 ---
 """
     generation_config = genai.types.GenerationConfig(response_mime_type="application/json")
-    try:
-        response = await model.generate_content_async(meta_prompt, generation_config=generation_config)
-        return json.loads(response.text)
-    except Exception as e:
-        logging.error(f"Error optimizing prompt: {e}")
-        return {"optimized_prompt": "Error: Could not generate prompt.", "reasoning_summary": str(e)}
+    response = await _scheduled_generate(model, DEFAULT_GEMINI_MODEL, meta_prompt, generation_config=generation_config)
+    return json.loads(response.text)
 
 async def diagnose_prompt(request: DiagnoseRequest) -> dict:
+    return await analysis_cache.cached("diagnose", META_PROMPT_VERSIONS["diagnose"], DEFAULT_GEMINI_MODEL, request,
+                                       lambda: _diagnose_prompt(request))
+
+async def _diagnose_prompt(request: DiagnoseRequest) -> dict:
     model = genai.GenerativeModel(DEFAULT_GEMINI_MODEL)
     meta_prompt = f"""
 Your primary task is to analyze the prompt and return a JSON object with boolean flags for these criteria:
@@ -203,7 +449,7 @@ Analyze this prompt:
 """
     generation_config = genai.types.GenerationConfig(response_mime_type="application/json")
     try:
-        response = await model.generate_content_async(meta_prompt, generation_config=generation_config)
+        response = await _scheduled_generate(model, DEFAULT_GEMINI_MODEL, meta_prompt, generation_config=generation_config)
         llm_result = json.loads(response.text)
         required_keys = ["has_clear_goal", "provides_examples", "specifies_constraints", "provides_context", "is_concise", "diagnosis", "suggested_prompt"]
         if not all(key in llm_result for key in required_keys): raise ValueError("LLM response missing required analysis keys.")
@@ -225,6 +471,14 @@ Analyze this prompt:
         raise HTTPException(status_code=500, detail=f"Failed to diagnose prompt: {str(e)}")
 
 async def breakdown_prompt(request: BreakdownRequest) -> dict:
+    try:
+        return await analysis_cache.cached("breakdown", META_PROMPT_VERSIONS["breakdown"], DEFAULT_GEMINI_MODEL, request,
+                                           lambda: _breakdown_prompt(request))
+    except Exception as e:
+        logging.error(f"Error breaking down prompt: {e}")
+        return {"components": [{"type": "error", "content": f"An error occurred: {str(e)}","explanation": "The server failed to process the breakdown request."}]}
+
+async def _breakdown_prompt(request: BreakdownRequest) -> dict:
     model = genai.GenerativeModel(DEFAULT_GEMINI_MODEL)
     meta_prompt = f"""
 Your primary goal is to analyze the user's prompt and respond with ONLY a single, valid JSON object.
@@ -239,12 +493,8 @@ Analyze and break down the following prompt:
 ---
 """
     generation_config = genai.types.GenerationConfig(response_mime_type="application/json")
-    try:
-        response = await model.generate_content_async(meta_prompt, generation_config=generation_config)
-        return json.loads(response.text)
-    except Exception as e:
-        logging.error(f"Error breaking down prompt: {e}")
-        return {"components": [{"type": "error", "content": f"An error occurred: {str(e)}","explanation": "The server failed to process the breakdown request."}]}
+    response = await _scheduled_generate(model, DEFAULT_GEMINI_MODEL, meta_prompt, generation_config=generation_config)
+    return json.loads(response.text)
 
 async def generate_and_store_template(request: TemplateGenerateRequest, user: dict[str, Any]) -> dict:
     model = genai.GenerativeModel(DEFAULT_GEMINI_MODEL)
@@ -256,7 +506,7 @@ USER'S REQUEST:\nSTYLE DESCRIPTION: "{request.style_description}"\nINITIAL TAGS:
 """
     generation_config = genai.types.GenerationConfig(response_mime_type="application/json")
     try:
-        response = await model.generate_content_async(meta_prompt, generation_config=generation_config)
+        response = await _scheduled_generate(model, DEFAULT_GEMINI_MODEL, meta_prompt, generation_config=generation_config)
         generated_data = json.loads(response.text)
         generated_tags = generated_data.get("tags", [])
         if request.tags:
@@ -278,7 +528,7 @@ User's Task: "{request.task_description}"
 """
     generation_config = genai.types.GenerationConfig(response_mime_type="application/json")
     try:
-        response = await model.generate_content_async(meta_prompt, generation_config=generation_config)
+        response = await _scheduled_generate(model, DEFAULT_GEMINI_MODEL, meta_prompt, generation_config=generation_config)
         suggested_tags = json.loads(response.text).get("suggested_tags", [])
         recommendations = []
         if suggested_tags:
@@ -290,12 +540,26 @@ User's Task: "{request.task_description}"
         logging.error(f"Error recommending templates: {e}")
         return []
 
-async def _execute_single_sandbox_run(prompt_input: SandboxPromptInput, common_input: str, model_name: str) -> SandboxResult:
+async def _execute_single_sandbox_run(prompt_input: SandboxPromptInput, common_input: str, model_name: str, raise_on_failure: bool = False) -> SandboxResult:
     full_prompt_text = f"{prompt_input.text}\n\n{common_input}" if common_input else prompt_input.text
-    benchmark_result = await execute_single_model_benchmark(model_name, full_prompt_text)
+    benchmark_result = await execute_single_model_benchmark(model_name, full_prompt_text, raise_on_failure)
     return SandboxResult(prompt_id=prompt_input.id, generated_text=benchmark_result.generated_text, latency_ms=benchmark_result.latency_ms, input_token_count=benchmark_result.input_token_count, output_token_count=benchmark_result.output_token_count)
 
 async def run_sandbox_test(request: SandboxRequest) -> list[SandboxResult]:
     tasks = [_execute_single_sandbox_run(prompt, request.input_text, request.model) for prompt in request.prompts]
-    results = await asyncio.gather(*tasks)
-    return results
\ No newline at end of file
+    return await _gather_shedding_per_item(tasks, lambda index, error: SandboxResult(
+        prompt_id=request.prompts[index].id, generated_text=f"Error calling {request.model}: {error.detail}", latency_ms=0))
+
+async def stream_sandbox_test(request: SandboxRequest) -> AsyncIterator[Tuple[str, Any]]:
+    """Streaming run_sandbox_test: ('result', SandboxResult) / ('error', SandboxStreamError) as each prompt finishes."""
+    failed = 0
+    async for prompt_id, result, error in _as_completed(
+        (prompt.id, _execute_single_sandbox_run(prompt, request.input_text, request.model, raise_on_failure=True)) for prompt in request.prompts
+    ):
+        if error:
+            failed += 1
+            logging.error(f"Sandbox run failed for prompt {prompt_id}: {error}")
+            yield "error", SandboxStreamError(prompt_id=prompt_id, error=_error_message(error))
+        else:
+            yield "result", result
+    yield "done", StreamCompleted(completed=len(request.prompts) - failed, failed=failed)
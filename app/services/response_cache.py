@@ -0,0 +1,192 @@
+# app/services/response_cache.py
+import os
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Optional
+
+from app.core.cache import TTLCache
+from app.core.db import db
+from app.core import redis_client, singleflight
+
+# --- Configuration ---
+# Lookups go L1 (in-process LRU) -> L2 (Redis, shared by replicas) -> L3 (Firestore
+# api_cache). A hit in a lower tier back-fills the tiers above it. Every tier expires an
+# entry CACHE_DURATION_MINUTES after it was first produced, so promotion never extends
+# its life. Writes below L1 happen in the background and never delay the response.
+API_CACHE_COLLECTION = "api_cache"
+CACHE_DURATION_MINUTES = int(os.getenv("CACHE_DURATION_MINUTES", "60"))
+RESPONSE_CACHE_L1_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_L1_MAX_ENTRIES", "2000"))
+REDIS_KEY_PREFIX = "llmcache:"
+# After a Redis error the L2 tier is skipped for this long instead of paying the
+# connect timeout on every lookup.
+REDIS_RETRY_AFTER_SECONDS = 30
+# Optional replica-wide coalescing: the first replica to miss takes a Redis lock for the
+# key and the others wait for its result to appear in L2 instead of calling the provider.
+SINGLEFLIGHT_REDIS_LOCK = os.getenv("SINGLEFLIGHT_REDIS_LOCK", "false").lower() == "true"
+FILL_LOCK_TTL_MS = int(os.getenv("FILL_LOCK_TTL_MS", "30000"))
+FILL_WAIT_POLL_SECONDS = 0.1
+FILL_LOCK_PREFIX = "llmcache-lock:"
+
+TIERS = ("l1_memory", "l2_redis", "l3_firestore")
+
+l1_cache = TTLCache(maxsize=RESPONSE_CACHE_L1_MAX_ENTRIES, ttl_seconds=CACHE_DURATION_MINUTES * 60)
+stats = {tier: {"hits": 0, "misses": 0} for tier in TIERS}
+_redis_retry_at = 0.0
+_background_tasks: set = set()
+
+def _ttl_remaining(created_at: datetime) -> float:
+    return (created_at + timedelta(minutes=CACHE_DURATION_MINUTES) - datetime.now(timezone.utc)).total_seconds()
+
+def _record(tier: str, hit: bool):
+    stats[tier]["hits" if hit else "misses"] += 1
+
+def _in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def _redis():
+    """Returns the Redis client, or None while it is unavailable."""
+    if redis_client.redis_client is None or time.monotonic() < _redis_retry_at:
+        return None
+    return redis_client.redis_client
+
+def _redis_failed(e: Exception):
+    global _redis_retry_at
+    _redis_retry_at = time.monotonic() + REDIS_RETRY_AFTER_SECONDS
+    logging.warning(f"Response cache L2 (Redis) unavailable, skipping for {REDIS_RETRY_AFTER_SECONDS}s: {e}")
+
+# --- Tier writers (run in the background) ---
+async def _write_l2(key: str, result: Dict[str, Any], created_at: datetime):
+    redis = _redis()
+    ttl = int(_ttl_remaining(created_at))
+    if redis is None or ttl <= 0:
+        return
+    try:
+        await redis.set(REDIS_KEY_PREFIX + key, json.dumps({"created_at": created_at.isoformat(), "result": result}), ex=ttl)
+    except Exception as e:
+        _redis_failed(e)
+
+async def _write_l3(key: str, result: Dict[str, Any], created_at: datetime):
+    try:
+        await db.collection(API_CACHE_COLLECTION).document(key).set({"created_at": created_at, "result": result})
+    except Exception as e:
+        logging.error(f"Response cache L3 (Firestore) write failed for {key}: {e}")
+
+# --- Public API ---
+async def get(key: str) -> Optional[Dict[str, Any]]:
+    """Returns the cached result dict for `key`, or None on a miss in every tier."""
+    entry = l1_cache.get(key)
+    _record("l1_memory", entry is not None)
+    if entry is not None:
+        return entry
+
+    redis = _redis()
+    if redis is not None:
+        try:
+            raw = await redis.get(REDIS_KEY_PREFIX + key)
+        except Exception as e:
+            _redis_failed(e)
+            raw = None
+        _record("l2_redis", raw is not None)
+        if raw is not None:
+            cached = json.loads(raw)
+            created_at = datetime.fromisoformat(cached["created_at"])
+            l1_cache.set(key, cached["result"], ttl_seconds=_ttl_remaining(created_at))
+            return cached["result"]
+
+    cached_doc = await db.collection(API_CACHE_COLLECTION).document(key).get()
+    cached_data = cached_doc.to_dict() if cached_doc.exists else None
+    if cached_data and "created_at" in cached_data and _ttl_remaining(cached_data["created_at"]) > 0:
+        _record("l3_firestore", True)
+        created_at = cached_data["created_at"]
+        l1_cache.set(key, cached_data["result"], ttl_seconds=_ttl_remaining(created_at))
+        _in_background(_write_l2(key, cached_data["result"], created_at))
+        return cached_data["result"]
+    _record("l3_firestore", False)
+    return None
+
+async def _read_l2(key: str) -> Optional[Dict[str, Any]]:
+    """Reads (and promotes into L1) an L2 entry without touching the hit/miss counters."""
+    redis = _redis()
+    if redis is None:
+        return None
+    try:
+        raw = await redis.get(REDIS_KEY_PREFIX + key)
+    except Exception as e:
+        _redis_failed(e)
+        return None
+    if raw is None:
+        return None
+    cached = json.loads(raw)
+    l1_cache.set(key, cached["result"], ttl_seconds=_ttl_remaining(datetime.fromisoformat(cached["created_at"])))
+    return cached["result"]
+
+async def wait_or_lock(key: str) -> tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    After a miss in every tier, coordinates with other replicas (SINGLEFLIGHT_REDIS_LOCK).
+    Returns (None, token) when this replica took the fill lock and should call the provider,
+    (result, None) when another replica filled the key while we waited, and (None, None)
+    when locking is off, Redis is unavailable, or the holder did not finish within the lock TTL.
+    """
+    redis = _redis()
+    if not SINGLEFLIGHT_REDIS_LOCK or redis is None:
+        return None, None
+    lock_key = FILL_LOCK_PREFIX + key
+    try:
+        token = await singleflight.acquire_redis_lock(redis, lock_key, FILL_LOCK_TTL_MS)
+        if token:
+            return None, token
+        deadline = time.monotonic() + FILL_LOCK_TTL_MS / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(FILL_WAIT_POLL_SECONDS)
+            result = await _read_l2(key)
+            if result is not None:
+                _record("l2_redis", True)
+                return result, None
+            if not await singleflight.redis_lock_held(redis, lock_key):
+                # The holder gave up or failed; one final read covers a just-finished write.
+                return await _read_l2(key), None
+    except Exception as e:
+        _redis_failed(e)
+    return None, None
+
+async def release_fill_lock(key: str, token: str):
+    redis = _redis()
+    if redis is None:
+        return
+    try:
+        await singleflight.release_redis_lock(redis, FILL_LOCK_PREFIX + key, token)
+    except Exception as e:
+        _redis_failed(e)
+
+async def put_shared(key: str, result: Dict[str, Any]):
+    """Like put(), but waits for the Redis write so replicas waiting on the fill lock see it."""
+    created_at = datetime.now(timezone.utc)
+    l1_cache.set(key, result)
+    await _write_l2(key, result, created_at)
+    _in_background(_write_l3(key, result, created_at))
+
+def put(key: str, result: Dict[str, Any]):
+    """Stores a freshly produced result: L1 immediately, Redis and Firestore in the background."""
+    created_at = datetime.now(timezone.utc)
+    l1_cache.set(key, result)
+    _in_background(_write_l2(key, result, created_at))
+    _in_background(_write_l3(key, result, created_at))
+
+def get_stats() -> Dict[str, Any]:
+    """Per-tier hit/miss counters plus the overall hit rate (for the metrics endpoint)."""
+    lookups = stats["l1_memory"]["hits"] + stats["l1_memory"]["misses"]
+    hits = sum(stats[tier]["hits"] for tier in TIERS)
+    return {
+        "tiers": {tier: dict(counts) for tier, counts in stats.items()},
+        "lookups": lookups,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "l1_entries": len(l1_cache),
+        "pending_writes": len(_background_tasks),
+        "inflight_calls": singleflight.inflight_count(),
+        "l2_available": _redis() is not None
+    }
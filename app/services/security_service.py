@@ -1,13 +1,19 @@
 # app/services/security_service.py
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from firebase_admin import auth
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
 import os
+import time
+import asyncio
+import hashlib
+import logging
 from cryptography.fernet import Fernet
 
 # Import the global db instance for consistency
 from app.core.db import db
+from app.core.cache import TTLCache
 
 # --- Encryption Functions (Unchanged) ---
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
@@ -23,13 +29,37 @@ def decrypt_key(encrypted_key: str) -> str:
     """Decrypts an API key using the application's secret key."""
     return fernet.decrypt(encrypted_key.encode()).decode()
 
-# --- Authentication Dependency (Unchanged) ---
+# --- Token Verification ---
+# firebase_admin's verify_id_token is synchronous (RSA signature check, plus an HTTP fetch
+# whenever Google's signing certificates expire from its cache), so it runs on a dedicated
+# thread pool instead of the event loop; a certificate refresh only delays the requests
+# verifying at that moment. Decoded claims are cached by token hash until the token's own
+# `exp`, so repeat requests with the same token skip verification entirely.
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+token_cache = TTLCache(maxsize=TOKEN_CACHE_MAX_ENTRIES, ttl_seconds=3600)
+_verification_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="token-verify")
+
+def _verify_token_sync(token: str) -> Dict[str, Any]:
+    return auth.verify_id_token(token)
+
+async def verify_token(token: str) -> Dict[str, Any]:
+    """Verifies a Firebase ID token off the event loop, using cached claims when available."""
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    claims = token_cache.get(cache_key)
+    if claims is None:
+        loop = asyncio.get_running_loop()
+        claims = await loop.run_in_executor(_verification_pool, _verify_token_sync, token)
+        token_cache.set(cache_key, claims, ttl_seconds=claims.get("exp", 0) - time.time())
+    # Hand out a copy so callers cannot mutate the cached claims.
+    return dict(claims)
+
+# --- Authentication Dependency ---
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
     """Dependency to get the current user from a Firebase JWT."""
     try:
-        return auth.verify_id_token(token)
+        return await verify_token(token)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -37,41 +67,86 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+async def get_optional_current_user(token: Optional[str] = Depends(optional_oauth2_scheme)) -> Optional[Dict[str, Any]]:
+    """Like get_current_user, but anonymous requests get None. An invalid token is still a 401."""
+    if not token:
+        return None
+    return await get_current_user(token)
+
+# --- Ownership Caches ---
+# 1. Request scope: the snapshot an ownership dependency reads is stored on request.state,
+#    so the route's service call can reuse it instead of fetching the same document again.
+# 2. Process scope: document id -> owner uid. Ownership never changes after creation, so hot
+#    documents skip the ownership read entirely. Entries are dropped on delete.
+OWNER_CACHE_TTL_SECONDS = float(os.getenv("OWNER_CACHE_TTL_SECONDS", "300"))
+owner_cache = TTLCache(maxsize=10_000, ttl_seconds=OWNER_CACHE_TTL_SECONDS)
+
+def get_request_snapshot(request: Request, collection: str, doc_id: str):
+    """Returns the snapshot an ownership dependency already read in this request, if any."""
+    snapshots = getattr(request.state, "document_snapshots", None)
+    return snapshots.get((collection, doc_id)) if snapshots else None
+
+def _remember_request_snapshot(request: Request, collection: str, doc_id: str, snapshot):
+    if not hasattr(request.state, "document_snapshots"):
+        request.state.document_snapshots = {}
+    request.state.document_snapshots[(collection, doc_id)] = snapshot
+
+def invalidate_owner(collection: str, doc_id: str):
+    """Drops a cached owner entry. Call whenever a document is deleted."""
+    owner_cache.pop((collection, doc_id))
+
+async def _resolve_owner(request: Request, collection: str, doc_id: str, owner_of) -> Optional[str]:
+    """
+    Returns the owner uid of a document, from the owner cache when possible.
+    Raises FileNotFoundError when the document does not exist.
+    """
+    cached_owner = owner_cache.get((collection, doc_id))
+    if cached_owner is not None:
+        return cached_owner
+    doc = await db.collection(collection).document(doc_id).get()
+    if not doc.exists:
+        raise FileNotFoundError(doc_id)
+    _remember_request_snapshot(request, collection, doc_id, doc)
+    owner_uid = owner_of(doc.to_dict())
+    if owner_uid:
+        owner_cache.set((collection, doc_id), owner_uid)
+    return owner_uid
+
 # --- Authorization Dependencies ---
 class PromptOwnerOrAdmin:
     """Dependency class to verify prompt ownership or admin status."""
-    async def __call__(self, prompt_id: str, current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
+    async def __call__(self, request: Request, prompt_id: str, current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
         if current_user.get("admin", False):
             return current_user
-        prompt_ref = db.collection("prompts").document(prompt_id)
-        prompt_doc = await prompt_ref.get()
-        if not prompt_doc.exists:
+        try:
+            # This correctly checks the nested 'owner.uid' field for Prompts
+            owner_uid = await _resolve_owner(
+                request, "prompts", prompt_id, lambda data: data.get("owner", {}).get("uid")
+            )
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="Prompt not found")
-        # This correctly checks the nested 'owner.uid' field for Prompts
-        owner_uid = prompt_doc.to_dict().get("owner", {}).get("uid")
         if owner_uid != current_user["uid"]:
             raise HTTPException(status_code=403, detail="Not authorized to access this resource")
         return current_user
 
 class TemplateOwnerOrAdmin:
     """Dependency class to verify template ownership or admin status."""
-    async def __call__(self, template_id: str, current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
+    async def __call__(self, request: Request, template_id: str, current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
         if current_user.get("admin", False):
             return current_user
-        
-        # This collection name is correct.
-        template_ref = db.collection("prompt_templates").document(template_id)
-        template_doc = await template_ref.get()
 
-        if not template_doc.exists:
+        try:
+            # --- FIX: CHECK THE CORRECT FIELD ---
+            # Templates use a top-level 'user_id' string field for ownership,
+            # unlike prompts which use 'owner.uid'.
+            owner_uid = await _resolve_owner(
+                request, "prompt_templates", template_id, lambda data: data.get("user_id")
+            )
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="Template not found")
-        
-        # --- FIX: CHECK THE CORRECT FIELD ---
-        # The bug was here. It was checking 'owner.uid' which is used for prompts.
-        # Templates use a top-level 'user_id' string field for ownership.
-        owner_uid = template_doc.to_dict().get("user_id") 
-        # --- END FIX ---
 
         if owner_uid != current_user["uid"]:
             raise HTTPException(status_code=403, detail="Not authorized to access this resource")
-        return current_user
\ No newline at end of file
+        return current_user
@@ -0,0 +1,23 @@
+# backfill_activity_feed.py
+# Builds the denormalized users/{uid}/activity feeds for prompts created before the
+# feed existed. Safe to re-run: feed entry IDs are deterministic.
+#
+# Usage:
+#   python backfill_activity_feed.py [--dry-run]
+import sys
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.services import firestore_service
+
+async def main():
+    dry_run = "--dry-run" in sys.argv
+    mode = "DRY RUN" if dry_run else "LIVE"
+    print(f"🚀 Backfilling activity feeds ({mode})...")
+    stats = await firestore_service.backfill_activity_feeds(dry_run=dry_run)
+    print(f"✅ Processed {stats['prompts']} prompts and {'would write' if dry_run else 'wrote'} {stats['entries']} feed entries.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
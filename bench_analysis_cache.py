@@ -0,0 +1,77 @@
+# bench_analysis_cache.py
+# Repeated diagnose/breakdown/optimize calls on the same prompt, as when a user iterates in
+# the UI or CI re-diagnoses unchanged prompts. The Gemini call is replaced by a fake with
+# a fixed provider latency; the first call per endpoint is a miss, the rest are cache hits
+# (including re-submissions that differ only in trailing whitespace / CRLF line endings).
+#
+# Usage:
+#   python bench_analysis_cache.py
+import os
+import json
+import time
+import asyncio
+import statistics
+
+from cryptography.fernet import Fernet
+
+# The real clients are constructed on import but never used.
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8080")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from app.schemas.prompt import APEExample, APEOptimizeRequest, BreakdownRequest, DiagnoseRequest
+from app.services import analysis_cache, llm_service
+
+PROVIDER_LATENCY_MS = 400
+REPEATS = 1000
+PROMPT = "You are a helpful assistant.\nSummarize the following article in three bullet points."
+
+REPLIES = {
+    "diagnose": {"has_clear_goal": True, "provides_examples": False, "specifies_constraints": True,
+                 "provides_context": False, "is_concise": True, "diagnosis": "Clear but lacks examples.",
+                 "suggested_prompt": PROMPT + " Use plain language."},
+    "breakdown": {"components": [{"type": "system_role", "content": "You are a helpful assistant.", "explanation": "Sets the persona."}]},
+    "optimize": {"optimized_prompt": PROMPT, "reasoning_summary": "Already specific."},
+}
+provider_calls = 0
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+async def fake_generate(model, model_name, contents, **kwargs):
+    global provider_calls
+    provider_calls += 1
+    await asyncio.sleep(PROVIDER_LATENCY_MS / 1000)
+    kind = "diagnose" if "boolean flags" in contents else "breakdown" if "components" in contents else "optimize"
+    return FakeResponse(json.dumps(REPLIES[kind]))
+
+def variants(text: str):
+    """The same prompt as different clients might submit it."""
+    return [text, text + "  \n", text.replace("\n", "\r\n"), "\n" + text]
+
+async def measure(label, call, make_request):
+    start = time.perf_counter()
+    await call(make_request(PROMPT))
+    miss_ms = (time.perf_counter() - start) * 1000
+    hit_us = []
+    for i in range(REPEATS):
+        request = make_request(variants(PROMPT)[i % 4])
+        start = time.perf_counter()
+        await call(request)
+        hit_us.append((time.perf_counter() - start) * 1_000_000)
+    hit_us.sort()
+    stats = analysis_cache.get_stats()["endpoints"][label]
+    print(f"   {label:<9} miss={miss_ms:7.1f} ms   hit p50={statistics.median(hit_us):6.1f} us   "
+          f"p99={hit_us[int(len(hit_us) * 0.99)]:6.1f} us   hit_rate={stats['hit_rate']:.4f}")
+
+async def main():
+    llm_service._scheduled_generate = fake_generate
+    print(f"--- {REPEATS} repeats per endpoint, provider latency {PROVIDER_LATENCY_MS} ms ---")
+    await measure("diagnose", llm_service.diagnose_prompt, lambda text: DiagnoseRequest(prompt_text=text))
+    await measure("breakdown", llm_service.breakdown_prompt, lambda text: BreakdownRequest(prompt_text=text))
+    await measure("optimize", llm_service.generate_optimized_prompt, lambda text: APEOptimizeRequest(
+        task_description=text, examples=[APEExample(input="long article", output="- point one")]))
+    print(f"   provider calls: {provider_calls} (without the cache: {3 * (REPEATS + 1)})")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,147 @@
+# bench_api_key_cache.py
+# Measures the pre-LLM overhead of a managed execution, i.e. the time spent in
+# firestore_service.get_decrypted_user_api_key before any provider call:
+#   legacy - Firestore read + Fernet decrypt on every call (previous behaviour)
+#   cached - the decrypted-key cache (first call per user misses, later calls hit)
+# Firestore is an in-memory stand-in with a simulated round trip, so no emulator or
+# credentials are needed. Also checks that invalidation (a local save and one published
+# by another replica over Redis) drops and zeroes the cached key, and that a read racing
+# a save elsewhere does not cache the old key.
+#
+# Usage:
+#   python bench_api_key_cache.py
+import os
+import json
+import time
+import asyncio
+import statistics
+from datetime import datetime, timezone
+
+from cryptography.fernet import Fernet
+
+# The real AsyncClient is constructed on import but never used.
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8080")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from app.core import redis_client
+from app.services import firestore_service
+from app.services.security_service import decrypt_key, encrypt_key
+
+SIMULATED_RTT_MS = float(os.getenv("BENCH_RTT_MS", "8"))
+USERS = 20
+CALLS = int(os.getenv("BENCH_CALLS", "500"))
+
+# --- In-memory Firestore stand-in ---
+class FakeSnapshot:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+class FakeRef:
+    def __init__(self, store, path):
+        self._store, self.path = store, path
+
+    def collection(self, name):
+        return FakeRef(self._store, f"{self.path}/{name}" if self.path else name)
+
+    def document(self, doc_id):
+        return FakeRef(self._store, f"{self.path}/{doc_id}")
+
+    async def get(self):
+        await asyncio.sleep(SIMULATED_RTT_MS / 1000)
+        return FakeSnapshot(self._store.get(self.path))
+
+    async def set(self, data):
+        await asyncio.sleep(SIMULATED_RTT_MS / 1000)
+        self._store[self.path] = data
+
+class FakeFirestore(FakeRef):
+    def __init__(self):
+        super().__init__({}, "")
+
+class FakeRedis:
+    """Just the pub/sub calls the invalidation subscriber and save_user_api_key make."""
+    def __init__(self):
+        self.subscribers = []
+
+    async def publish(self, channel, message):
+        for queue in self.subscribers:
+            queue.put_nowait({"type": "message", "channel": channel, "data": message})
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+class FakePubSub:
+    def __init__(self, redis):
+        self._redis, self._queue = redis, asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self._redis.subscribers.append(self._queue)
+
+    async def listen(self):
+        while True:
+            yield await self._queue.get()
+
+    async def aclose(self):
+        self._redis.subscribers.remove(self._queue)
+
+# --- The previous implementation, for comparison ---
+async def legacy_get_decrypted_user_api_key(user_id: str, provider: str):
+    key_doc = await firestore_service._credentials_ref(user_id, provider).get()
+    if not key_doc.exists: return None
+    return decrypt_key(key_doc.to_dict()["key"])
+
+async def measure(label: str, fn):
+    latencies = []
+    for i in range(CALLS):
+        start = time.perf_counter()
+        await fn(f"user_{i % USERS}", "openai")
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(f"   {label:<7} mean={statistics.mean(latencies):7.3f} ms   p50={statistics.median(latencies):7.3f} ms   "
+          f"max={max(latencies):7.3f} ms")
+
+async def check_invalidation():
+    uid, provider = "user_0", "openai"
+    await firestore_service.get_decrypted_user_api_key(uid, provider)
+    secret = firestore_service.api_key_cache.get((uid, provider))
+    await firestore_service.save_user_api_key(uid, provider, "sk-rotated")
+    assert secret == bytearray(len(secret)), "evicted key was not zeroed"
+    assert await firestore_service.get_decrypted_user_api_key(uid, provider) == "sk-rotated"
+
+    # A key saved through another replica arrives over Redis.
+    await firestore_service.get_decrypted_user_api_key(uid, provider)
+    remote_save = {"user_id": uid, "provider": provider, "updated_at": datetime.now(timezone.utc).isoformat()}
+    await redis_client.redis_client.publish(firestore_service.API_KEY_INVALIDATION_CHANNEL, json.dumps(remote_save))
+    await asyncio.sleep(0)
+    assert (uid, provider) not in firestore_service.api_key_cache, "subscriber did not invalidate"
+
+    # A read that started before that save (and so saw the old document) must not cache it.
+    uid = "user_1"
+    firestore_service.api_key_cache.pop((uid, provider))
+    read = asyncio.create_task(firestore_service.get_decrypted_user_api_key(uid, provider))
+    await asyncio.sleep(0)
+    remote_save["user_id"] = uid
+    remote_save["updated_at"] = datetime.now(timezone.utc).isoformat()
+    await redis_client.redis_client.publish(firestore_service.API_KEY_INVALIDATION_CHANNEL, json.dumps(remote_save))
+    await read
+    assert (uid, provider) not in firestore_service.api_key_cache, "stale read was cached"
+    print("   ✅ local saves and published invalidations drop and zero cached keys; racing reads are not cached")
+
+async def main():
+    firestore_service.db = FakeFirestore()
+    redis_client.redis_client = FakeRedis()
+    subscriber = asyncio.create_task(firestore_service.run_api_key_invalidation_subscriber())
+    await asyncio.sleep(0)
+    for u in range(USERS):
+        await firestore_service._credentials_ref(f"user_{u}", "openai").set({"key": encrypt_key(f"sk-user_{u}")})
+    print(f"--- {CALLS} key lookups across {USERS} users (simulated RTT {SIMULATED_RTT_MS} ms) ---")
+    await measure("legacy", legacy_get_decrypted_user_api_key)
+    await measure("cached", firestore_service.get_decrypted_user_api_key)
+    await check_invalidation()
+    subscriber.cancel()
+
+if __name__ == "__main__":
+    asyncio.run(main())
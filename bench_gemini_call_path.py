@@ -0,0 +1,73 @@
+# bench_gemini_call_path.py
+# Compares the previous Gemini call path (count_tokens -> generate -> count_tokens)
+# with the single-call path in llm_service._call_gemini_with_client, against the
+# local stub provider (stub_llm_provider.py) with a simulated per-request latency.
+#
+# The generativelanguage async client only speaks gRPC, so the SDK is used over its
+# REST transport and each call is run in a worker thread; responses are still parsed
+# by the real SDK, including usage_metadata.
+#
+# Usage:
+#   STUB_LATENCY_MS=100 python bench_gemini_call_path.py
+import os
+import time
+import asyncio
+import statistics
+
+from cryptography.fernet import Fernet
+
+# The Firestore client is constructed on import but never used.
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8080")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+import google.generativeai as genai
+
+from app.services import llm_service
+from stub_llm_provider import app as stub_app, reset_stats, run_stub_server
+
+MODEL_NAME = "gemini-2.5-flash-lite"
+CALLS = int(os.getenv("BENCH_CALLS", "20"))
+PROMPT = "Summarise the following release notes in three bullet points for a product manager."
+
+class ThreadedRestModel:
+    """Exposes the async GenerativeModel methods the service uses on top of the sync REST client."""
+    def __init__(self, model: genai.GenerativeModel):
+        self._model = model
+
+    async def generate_content_async(self, contents):
+        return await asyncio.to_thread(self._model.generate_content, contents)
+
+    async def count_tokens_async(self, contents):
+        return await asyncio.to_thread(self._model.count_tokens, contents)
+
+# --- The previous implementation, for comparison ---
+async def legacy_call_gemini_with_client(client, prompt_text: str) -> tuple[str, int, int]:
+    input_token_response = await client.count_tokens_async(prompt_text)
+    input_tokens = input_token_response.total_tokens
+    response = await client.generate_content_async(prompt_text)
+    generated_text = response.text
+    output_token_response = await client.count_tokens_async(generated_text)
+    output_tokens = output_token_response.total_tokens
+    return generated_text, input_tokens, output_tokens
+
+async def measure(label: str, fn, client):
+    reset_stats()
+    latencies = []
+    for _ in range(CALLS):
+        start = time.perf_counter()
+        _, input_tokens, output_tokens = await fn(client, PROMPT)
+        latencies.append((time.perf_counter() - start) * 1000)
+    upstream = sum(stub_app.state.calls.values())
+    print(f"   {label:<8} p50={statistics.median(latencies):8.1f} ms   max={max(latencies):8.1f} ms   "
+          f"upstream_calls/request={upstream / CALLS:.1f}   tokens={input_tokens}/{output_tokens}")
+
+async def main(base_url: str):
+    genai.configure(api_key="stub-key", transport="rest", client_options={"api_endpoint": base_url})
+    client = ThreadedRestModel(genai.GenerativeModel(MODEL_NAME))
+    print(f"--- {CALLS} sequential Gemini calls, stub latency {stub_app.state.latency_ms:.0f} ms/request ---")
+    await measure("legacy", legacy_call_gemini_with_client, client)
+    await measure("single", llm_service._call_gemini_with_client, client)
+
+if __name__ == "__main__":
+    with run_stub_server() as url:
+        asyncio.run(main(url))
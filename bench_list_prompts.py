@@ -0,0 +1,92 @@
+# bench_list_prompts.py
+# Benchmarks GET /prompts/ data access against a local Firestore emulator:
+# the legacy full-collection scan vs. the owner-indexed query in firestore_service.
+#
+# Usage:
+#   gcloud emulators firestore start --host-port=127.0.0.1:8080
+#   FIRESTORE_EMULATOR_HOST=127.0.0.1:8080 python bench_list_prompts.py
+import os
+import sys
+import time
+import random
+import asyncio
+import statistics
+from datetime import datetime, timezone, timedelta
+
+from cryptography.fernet import Fernet
+
+if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+    print("❌ FIRESTORE_EMULATOR_HOST is not set. Refusing to seed a real Firestore project.")
+    sys.exit(1)
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+from app.core.db import db
+from app.services import firestore_service
+
+TOTAL_PROMPTS = int(os.getenv("BENCH_TOTAL_PROMPTS", "100000"))
+TOTAL_USERS = int(os.getenv("BENCH_TOTAL_USERS", "1000"))
+SAMPLES = int(os.getenv("BENCH_SAMPLES", "30"))
+BATCH_SIZE = 500
+
+def user_id_for(index: int) -> str:
+    return f"bench_user_{index:05d}"
+
+async def seed_prompts():
+    """Writes TOTAL_PROMPTS prompt documents spread evenly across TOTAL_USERS users."""
+    print(f"🌱 Seeding {TOTAL_PROMPTS} prompts across {TOTAL_USERS} users...")
+    base_time = datetime.now(timezone.utc)
+    collection = db.collection(firestore_service.PROMPTS_COLLECTION)
+    for start in range(0, TOTAL_PROMPTS, BATCH_SIZE):
+        batch = db.batch()
+        for i in range(start, min(start + BATCH_SIZE, TOTAL_PROMPTS)):
+            uid = user_id_for(i % TOTAL_USERS)
+            batch.set(collection.document(f"bench_prompt_{i:07d}"), {
+                "name": f"Prompt {i}",
+                "task_description": "Benchmark prompt",
+                "created_at": base_time - timedelta(seconds=i),
+                "latest_version": 1,
+                "owner": {"uid": uid, "name": "Bench User", "email": None},
+                "user_id": uid,
+                "deleted_at": None,
+                "average_rating": 0,
+                "rating_count": 0
+            })
+        await batch.commit()
+    print("✅ Seeding complete.")
+
+async def legacy_list_prompts_for_user(user_id: str) -> list[dict]:
+    """The previous implementation: stream every non-deleted prompt and filter in memory."""
+    prompts_list = []
+    query = db.collection(firestore_service.PROMPTS_COLLECTION).where(
+        filter=FieldFilter("deleted_at", "==", None)
+    )
+    async for doc in query.stream():
+        prompt_data = doc.to_dict()
+        if prompt_data.get("user_id") == user_id:
+            prompt_data["id"] = doc.id
+            prompts_list.append(prompt_data)
+    return prompts_list
+
+async def measure(label: str, fn) -> None:
+    latencies = []
+    for _ in range(SAMPLES):
+        uid = user_id_for(random.randrange(TOTAL_USERS))
+        start = time.perf_counter()
+        await fn(uid)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"   {label:<28} p50={p50:9.2f} ms   p99={p99:9.2f} ms   (n={SAMPLES})")
+
+async def main():
+    if "--skip-seed" not in sys.argv:
+        await seed_prompts()
+    print("\n--- list_prompts_for_user latency ---")
+    await measure("before (full scan)", legacy_list_prompts_for_user)
+    await measure("after (owner index)", firestore_service.list_prompts_for_user)
+    await measure("after (page of 20)", lambda uid: firestore_service.list_prompts_for_user(uid, limit=20))
+
+if __name__ == "__main__":
+    asyncio.run(main())
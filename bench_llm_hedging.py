@@ -0,0 +1,75 @@
+# bench_llm_hedging.py
+# Tail latency of platform executions against a stub provider where a small fraction of
+# requests are slow, with hedging off (previous behaviour) and on. Reports p50/p95/p99,
+# the number of upstream requests (the extra spend) and how many hedges won.
+#
+# Usage:
+#   python bench_llm_hedging.py
+import os
+import time
+import random
+import asyncio
+import logging
+
+from cryptography.fernet import Fernet
+
+# The real clients are constructed on import but never used.
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8080")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from openai import AsyncOpenAI
+
+from app.schemas.prompt import PromptExecuteRequest
+from app.services import llm_hedging, llm_scheduler, llm_service
+from app.services.llm_scheduler import TokenBucket
+from stub_llm_provider import app as stub_app, reset_stats, run_stub_server
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+CALLS = int(os.getenv("BENCH_CALLS", "400"))
+CONCURRENCY = 8
+MODEL_NAME = "gpt-4o-mini"
+LATENCY_MS, SLOW_MS, SLOW_RATE = 50, 1000, 0.03
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def run_calls() -> list[float]:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    request = PromptExecuteRequest(prompt_text="Explain quantum computing in simple terms.", model=MODEL_NAME)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await llm_service.execute_platform_prompt(request)
+            return (time.perf_counter() - start) * 1000
+    return await asyncio.gather(*(one() for _ in range(CALLS)))
+
+async def measure(label: str, hedging: bool):
+    llm_hedging.LLM_HEDGING_ENABLED = hedging
+    llm_hedging._latencies.clear()
+    llm_hedging._budget = TokenBucket(llm_hedging.LLM_HEDGE_BUDGET_PER_MINUTE)
+    random.seed(7)
+    reset_stats()
+    latencies = await run_calls()
+    stats = llm_hedging.get_stats()["models"][MODEL_NAME]
+    print(f"   {label:<8} p50={percentile(latencies, 0.5):7.1f} ms   p95={percentile(latencies, 0.95):7.1f} ms   "
+          f"p99={percentile(latencies, 0.99):7.1f} ms   max={max(latencies):7.1f} ms   "
+          f"upstream_calls={stub_app.state.calls['openai:chat']}   hedged={stats['hedged']}   "
+          f"hedge_wins={stats['hedge_wins']}   over_budget={stats['over_budget']}")
+
+async def main(base_url: str):
+    llm_service.platform_openai_client = AsyncOpenAI(api_key="stub-key", base_url=f"{base_url}/v1", max_retries=0)
+    # Keep the scheduler's default RPM/TPM from throttling the run.
+    llm_scheduler.LIMIT_OVERRIDES = {"openai": {"rpm": 60_000, "tpm": 10_000_000}}
+    stub_app.state.latency_ms, stub_app.state.slow_ms, stub_app.state.slow_rate = LATENCY_MS, SLOW_MS, SLOW_RATE
+    print(f"--- {CALLS} platform executions, concurrency {CONCURRENCY}, stub latency {LATENCY_MS} ms "
+          f"with {SLOW_RATE:.0%} at {SLOW_MS} ms, hedge at p{llm_hedging.HEDGE_PERCENTILE * 100:.0f}, "
+          f"budget {llm_hedging.LLM_HEDGE_BUDGET_PER_MINUTE}/min ---")
+    await measure("off", hedging=False)
+    await measure("hedged", hedging=True)
+
+if __name__ == "__main__":
+    with run_stub_server() as url:
+        asyncio.run(main(url))
@@ -0,0 +1,100 @@
+# bench_llm_scheduler.py
+# Fan-out of several large sandbox runs at once against the local stub provider:
+#   unbounded - every prompt goes to the provider at once (previous behaviour)
+#   scheduled - llm_service.run_sandbox_test through the LLM scheduler
+# Reports the peak number of concurrent upstream requests seen by the stub, wall time,
+# the scheduler's queue/wait metrics, and how many calls backpressure rejects when the
+# queue bound is lowered.
+#
+# Usage:
+#   python bench_llm_scheduler.py
+import os
+import time
+import asyncio
+
+from cryptography.fernet import Fernet
+
+# The real clients are constructed on import but never used.
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8080")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from fastapi import HTTPException
+from openai import AsyncOpenAI
+
+from app.core import redis_client
+from app.schemas.prompt import SandboxPromptInput, SandboxRequest
+from app.services import llm_scheduler, llm_service, response_cache
+from stub_llm_provider import app as stub_app, reset_stats, run_stub_server
+
+CONCURRENT_REQUESTS = int(os.getenv("BENCH_REQUESTS", "10"))
+PROMPTS_PER_REQUEST = 50
+MODEL_NAME = "gpt-4o-mini"
+CONCURRENCY_LIMIT = 20
+
+class NullFirestore:
+    """Response cache L3 stand-in that never hits, so every prompt reaches the provider."""
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        return self
+
+    async def get(self):
+        class Missing:
+            exists = False
+        return Missing()
+
+    async def set(self, data):
+        pass
+
+def sandbox_requests(run: str) -> list[SandboxRequest]:
+    return [
+        SandboxRequest(model=MODEL_NAME, input_text="", prompts=[
+            SandboxPromptInput(id=f"p{i}", text=f"{run} request {r} prompt {i}") for i in range(PROMPTS_PER_REQUEST)
+        ])
+        for r in range(CONCURRENT_REQUESTS)
+    ]
+
+# --- The previous behaviour, for comparison ---
+async def unbounded_sandbox(request: SandboxRequest):
+    return await asyncio.gather(*(
+        llm_service._call_openai_with_client(llm_service.platform_openai_client, MODEL_NAME, prompt.text)
+        for prompt in request.prompts
+    ))
+
+async def measure(label: str, run_one, requests):
+    reset_stats()
+    response_cache.l1_cache.clear()
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(run_one(request) for request in requests), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    rejected = sum(1 for outcome in outcomes if isinstance(outcome, HTTPException) and outcome.status_code == 503)
+    print(f"   {label:<11} upstream_calls={stub_app.state.calls['openai:chat']:4d}   "
+          f"peak_concurrent={stub_app.state.peak_in_flight:4d}   wall={elapsed * 1000:8.1f} ms   "
+          f"rejected_requests={rejected}")
+
+async def main(base_url: str):
+    llm_service.platform_openai_client = AsyncOpenAI(api_key="stub-key", base_url=f"{base_url}/v1")
+    response_cache.db = NullFirestore()
+    redis_client.redis_client = None
+    llm_scheduler.LIMIT_OVERRIDES = {
+        "openai": {"concurrency": CONCURRENCY_LIMIT, "rpm": 60_000, "tpm": 10_000_000},
+        MODEL_NAME: {"concurrency": CONCURRENCY_LIMIT},
+    }
+    print(f"--- {CONCURRENT_REQUESTS} concurrent sandbox runs x {PROMPTS_PER_REQUEST} prompts, "
+          f"stub latency {stub_app.state.latency_ms:.0f} ms, provider concurrency limit {CONCURRENCY_LIMIT} ---")
+    await measure("unbounded", unbounded_sandbox, sandbox_requests("a"))
+
+    llm_scheduler.LLM_MAX_QUEUE_DEPTH = 10_000
+    await measure("scheduled", llm_service.run_sandbox_test, sandbox_requests("b"))
+    openai_stats = llm_scheduler.get_stats()["providers"]["openai"]
+    print(f"   scheduler   completed={openai_stats['completed']}   wait_ms avg={openai_stats['wait_ms_avg']}   "
+          f"p95={openai_stats['wait_ms_p95']}   max={openai_stats['wait_ms_max']}")
+
+    llm_scheduler.LLM_MAX_QUEUE_DEPTH = 100
+    await measure("queue<=100", llm_service.run_sandbox_test, sandbox_requests("c"))
+    print(f"   scheduler   rejected_calls={llm_scheduler.get_stats()['providers']['openai']['rejected']}")
+
+if __name__ == "__main__":
+    with run_stub_server() as url:
+        asyncio.run(main(url))
@@ -0,0 +1,131 @@
+# bench_middleware_stack.py
+# Requests per second of the root health endpoint through the full middleware stack:
+#   before - bot filter and velocity trap as @app.middleware("http"), LoggingMiddleware on
+#            BaseHTTPMiddleware (each layer spawns a task and re-streams the response)
+#   after  - the pure ASGI layers from app/middleware
+# Both stacks also carry the proxy-headers and CORS middleware and log at INFO to memory.
+# Redis is the in-memory stand-in from bench_velocity_trap.py with no added latency, and
+# requests are driven straight through the ASGI interface so only the app's cost is timed.
+#
+# Usage:
+#   python bench_middleware_stack.py
+import io
+import os
+import json
+import time
+import asyncio
+import logging
+
+os.environ.setdefault("BENCH_REDIS_RTT_MS", "0")
+
+from fastapi import FastAPI, Request, Response, status
+from fastapi.middleware.cors import CORSMiddleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from app.core import velocity
+from app.core.bot_matcher import DEFAULT_BOT_SIGNATURES as BAD_BOTS
+from app.middleware.logging_middleware import LoggingMiddleware
+from app.middleware.security_middleware import BotBlockMiddleware, VelocityTrapMiddleware
+from bench_velocity_trap import FakeRedis
+
+REQUESTS = 20_000
+CONCURRENCY = 50
+ROUNDS = 3
+
+# --- The previous BaseHTTPMiddleware access log, for comparison ---
+class PreviousLoggingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        process_time_ms = (time.time() - start_time) * 1000
+        user_id = "anonymous"
+        if hasattr(request.state, "user") and request.state.user:
+            user_id = request.state.user.get("uid", "unknown")
+        logging.getLogger("bench").info(
+            f"method={request.method} path='{request.url.path}' status_code={response.status_code} "
+            f"user_id='{user_id}' client_ip='{request.client.host}' latency_ms={process_time_ms:.2f}"
+        )
+        return response
+
+def build_app(pure_asgi: bool) -> FastAPI:
+    app = FastAPI()
+    cache = FakeRedis()
+    if pure_asgi:
+        app.add_middleware(BotBlockMiddleware)
+        app.add_middleware(VelocityTrapMiddleware, redis=cache)
+    else:
+        @app.middleware("http")
+        async def block_bad_bots(request: Request, call_next):
+            user_agent = request.headers.get("user-agent", "").lower()
+            if any(bot in user_agent for bot in BAD_BOTS):
+                return Response(content=json.dumps({"detail": "Bot access denied."}),
+                                status_code=status.HTTP_403_FORBIDDEN, media_type="application/json")
+            return await call_next(request)
+
+        @app.middleware("http")
+        async def velocity_trap(request: Request, call_next):
+            try:
+                verdict = await velocity.check(cache, request.headers["x-forwarded-for"])
+            except Exception:
+                return await call_next(request)
+            if verdict != velocity.ALLOWED:
+                return Response(content=json.dumps({"detail": "banned"}), status_code=403, media_type="application/json")
+            return await call_next(request)
+    app.add_middleware(ProxyHeadersMiddleware, trusted_hosts=["*"])
+    app.add_middleware(LoggingMiddleware if pure_asgi else PreviousLoggingMiddleware)
+    app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True,
+                       allow_methods=["*"], allow_headers=["*"])
+
+    @app.get("/")
+    def read_root():
+        return {"status": "ok", "message": "Welcome to the PromptForge API v1!"}
+    return app
+
+def make_scope(i: int) -> dict:
+    # Spread requests over enough client IPs that none of them trips the velocity limit.
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/", "raw_path": b"/", "root_path": "", "query_string": b"",
+        "server": ("test", 80), "client": ("10.0.0.1", 50000),
+        "headers": [(b"host", b"test"), (b"user-agent", b"bench/1.0"),
+                    (b"x-forwarded-for", f"10.{i % 250}.{i // 250 % 250}.1".encode())],
+    }
+
+async def call(app, i: int) -> int:
+    sent = []
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        sent.append(message)
+    await app(make_scope(i), receive, send)
+    return sent[0]["status"]
+
+async def rps(app) -> float:
+    counter = iter(range(REQUESTS))
+    statuses = set()
+    async def worker():
+        for i in counter:
+            statuses.add(await call(app, i))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+    assert statuses == {200}, statuses
+    return REQUESTS / elapsed
+
+async def main():
+    log = logging.getLogger()
+    log.setLevel(logging.INFO)
+    log.addHandler(logging.StreamHandler(io.StringIO()))
+    print(f"--- GET / x{REQUESTS}, concurrency {CONCURRENCY}, best of {ROUNDS} ---")
+    results = {}
+    for label, pure_asgi in (("before", False), ("after", True)):
+        app = build_app(pure_asgi)
+        await call(app, 0)  # warm-up: builds the middleware stack
+        results[label] = max([await rps(app) for _ in range(ROUNDS)])
+        velocity.local_bans.clear()
+        print(f"   {label:<7} {results[label]:8.0f} req/s")
+    print(f"   speedup x{results['after'] / results['before']:.2f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
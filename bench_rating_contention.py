@@ -0,0 +1,112 @@
+# bench_rating_contention.py
+# Fires hundreds of concurrent ratings at a single prompt against a local Firestore
+# emulator and reports latency, transaction attempts and failures for the previous
+# read-all-ratings aggregation vs. the incremental one in firestore_service.
+#
+# Usage:
+#   gcloud emulators firestore start --host-port=127.0.0.1:8080
+#   FIRESTORE_EMULATOR_HOST=127.0.0.1:8080 python bench_rating_contention.py
+import os
+import sys
+import time
+import random
+import asyncio
+import statistics
+from datetime import datetime, timezone
+
+from cryptography.fernet import Fernet
+
+if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+    print("❌ FIRESTORE_EMULATOR_HOST is not set. Refusing to write to a real Firestore project.")
+    sys.exit(1)
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from app.core.db import db
+from app.services import firestore_service
+
+CONCURRENT_RATINGS = int(os.getenv("BENCH_RATINGS", "300"))
+DISTINCT_USERS = int(os.getenv("BENCH_USERS", "200"))
+MAX_ATTEMPTS = 20
+
+attempts = {"count": 0}
+
+async def seed_prompt(label: str, preexisting_ratings: int) -> str:
+    """Creates a prompt that already carries `preexisting_ratings` ratings from other users."""
+    prompt_ref = db.collection(firestore_service.PROMPTS_COLLECTION).document(f"bench_rating_{label}")
+    batch = db.batch()
+    batch.set(prompt_ref, {
+        "name": f"Contention {label}", "user_id": "bench_owner", "deleted_at": None,
+        "created_at": datetime.now(timezone.utc), "latest_version": 1,
+        "average_rating": 3.0 if preexisting_ratings else 0,
+        "rating_count": preexisting_ratings, "rating_sum": 3 * preexisting_ratings
+    })
+    await batch.commit()
+    for start in range(0, preexisting_ratings, 250):
+        batch = db.batch()
+        for i in range(start, min(start + 250, preexisting_ratings)):
+            uid = f"historic_{i}"
+            batch.set(db.collection(firestore_service.RATINGS_COLLECTION).document(f"{prompt_ref.id}_v1_{uid}"), {
+                "prompt_id": prompt_ref.id, "version_number": 1, "user_id": uid, "rating": 3,
+                "created_at": datetime.now(timezone.utc)
+            })
+            batch.set(prompt_ref.collection(firestore_service.RATING_VOTES_SUBCOLLECTION).document(uid), {"rating": 3})
+        await batch.commit()
+    return prompt_ref.id
+
+# --- The previous implementation, for comparison ---
+async def legacy_rating(transaction, prompt_id, version_number, rating, user_id):
+    attempts["count"] += 1
+    prompt_ref = db.collection(firestore_service.PROMPTS_COLLECTION).document(prompt_id)
+    prompt_snapshot = await prompt_ref.get(transaction=transaction)
+    if not prompt_snapshot.exists:
+        raise FileNotFoundError(prompt_id)
+    query = db.collection(firestore_service.RATINGS_COLLECTION).where(filter=FieldFilter("prompt_id", "==", prompt_id))
+    docs = await query.get(transaction=transaction)
+    ratings_by_user = {doc.to_dict().get("user_id"): doc.to_dict().get("rating", 0) for doc in docs}
+    ratings_by_user[user_id] = rating
+    rating_ref = db.collection(firestore_service.RATINGS_COLLECTION).document(f"{prompt_id}_v{version_number}_{user_id}")
+    transaction.set(rating_ref, {"prompt_id": prompt_id, "version_number": version_number, "user_id": user_id,
+                                 "rating": rating, "created_at": datetime.now(timezone.utc)})
+    transaction.update(prompt_ref, {"rating_count": len(ratings_by_user),
+                                    "average_rating": sum(ratings_by_user.values()) / len(ratings_by_user)})
+
+async def incremental_rating(transaction, prompt_id, version_number, rating, user_id):
+    attempts["count"] += 1
+    return await firestore_service._create_or_update_rating.to_wrap(transaction, prompt_id, version_number, rating, user_id)
+
+async def run(label: str, fn, preexisting_ratings: int):
+    prompt_id = await seed_prompt(label, preexisting_ratings)
+    transactional = firestore.async_transactional(fn)
+    attempts["count"] = 0
+    latencies, failures = [], 0
+
+    async def one(i):
+        nonlocal failures
+        uid = f"bench_user_{i % DISTINCT_USERS}"
+        start = time.perf_counter()
+        try:
+            await transactional(db.transaction(max_attempts=MAX_ATTEMPTS), prompt_id, 1, random.randint(1, 5), uid)
+            latencies.append((time.perf_counter() - start) * 1000)
+        except Exception:
+            failures += 1
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(CONCURRENT_RATINGS)))
+    wall_ms = (time.perf_counter() - wall_start) * 1000
+    latencies.sort()
+    p50 = statistics.median(latencies) if latencies else 0
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+    print(f"   {label:<12} wall={wall_ms:9.1f} ms  p50={p50:8.1f} ms  p99={p99:8.1f} ms  "
+          f"attempts={attempts['count']:5d}  failures={failures}")
+
+async def main():
+    print(f"--- {CONCURRENT_RATINGS} concurrent ratings on one prompt, {DISTINCT_USERS} distinct users ---")
+    for preexisting in (0, 1000):
+        print(f"\n   (prompt already has {preexisting} ratings)")
+        await run(f"legacy_{preexisting}", legacy_rating, preexisting)
+        await run(f"incr_{preexisting}", incremental_rating, preexisting)
+
+if __name__ == "__main__":
+    asyncio.run(main())
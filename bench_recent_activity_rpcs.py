@@ -0,0 +1,187 @@
+# bench_recent_activity_rpcs.py
+# Counts Firestore RPCs (and simulated wall time) per call of
+# firestore_service.get_recent_activity_for_user: the original per-version parent
+# reads, the batched versions scan (now the fallback for un-backfilled users), and
+# the users/{uid}/activity feed read. Runs entirely in memory: the service's client
+# is swapped for a counting stand-in, so no emulator or credentials are needed.
+#
+# Usage:
+#   python bench_recent_activity_rpcs.py
+import os
+import time
+import random
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+from cryptography.fernet import Fernet
+
+# The real AsyncClient is constructed on import but never used; point it at a
+# (non-running) emulator so no service account is required.
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8080")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from google.cloud import firestore
+from app.services import firestore_service
+
+SIMULATED_RTT_MS = float(os.getenv("BENCH_RTT_MS", "5"))
+TOTAL_USERS = 200
+PROMPTS_PER_USER = 5
+VERSIONS_PER_PROMPT = 10
+TARGET_USER = "user_0007"
+
+# --- Counting in-memory Firestore stand-in ---
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+class FakeCollectionRef:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.split("/")[-1]
+
+    def document(self, doc_id):
+        return FakeDocumentRef(self._db, f"{self.path}/{doc_id}")
+
+    def order_by(self, field, direction=None):
+        return FakeQuery(self._db, self.id, prefix=self.path).order_by(field, direction)
+
+    @property
+    def parent(self):
+        parts = self.path.split("/")
+        return FakeDocumentRef(self._db, "/".join(parts[:-1])) if len(parts) > 1 else None
+
+class FakeDocumentRef:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.split("/")[-1]
+
+    @property
+    def parent(self):
+        return FakeCollectionRef(self._db, "/".join(self.path.split("/")[:-1]))
+
+    def collection(self, name):
+        return FakeCollectionRef(self._db, f"{self.path}/{name}")
+
+    async def get(self, transaction=None):
+        await self._db.rpc()
+        return FakeSnapshot(self, self._db.docs.get(self.path))
+
+class FakeQuery:
+    def __init__(self, db, group, filters=(), descending_field=None, limit_count=None, prefix=None):
+        self._db, self._group, self._prefix = db, group, prefix
+        self._filters, self._order, self._limit = list(filters), descending_field, limit_count
+
+    def _copy(self, **changes):
+        fields = dict(filters=self._filters, descending_field=self._order, limit_count=self._limit, prefix=self._prefix)
+        fields.update(changes)
+        return FakeQuery(self._db, self._group, **fields)
+
+    def where(self, filter):
+        return self._copy(filters=self._filters + [filter])
+
+    def order_by(self, field, direction=None):
+        return self._copy(descending_field=field)
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    async def stream(self):
+        await self._db.rpc()
+        rows = [(p, d) for p, d in self._db.docs.items() if p.split("/")[-2] == self._group]
+        if self._prefix:
+            rows = [(p, d) for p, d in rows if p.rsplit("/", 1)[0] == self._prefix]
+        for f in self._filters:
+            rows = [(p, d) for p, d in rows if d.get(f.field_path) == f.value]
+        if self._order:
+            rows.sort(key=lambda row: row[1][self._order], reverse=True)
+        for path, data in rows[:self._limit]:
+            yield FakeSnapshot(FakeDocumentRef(self._db, path), data)
+
+class CountingFirestore:
+    def __init__(self):
+        self.docs = {}
+        self.rpc_count = 0
+
+    async def rpc(self):
+        self.rpc_count += 1
+        await asyncio.sleep(SIMULATED_RTT_MS / 1000)
+
+    def collection(self, name):
+        return FakeCollectionRef(self, name)
+
+    def collection_group(self, name):
+        return FakeQuery(self, name)
+
+    async def get_all(self, references, **kwargs):
+        await self.rpc()
+        for ref in references:
+            yield FakeSnapshot(ref, self.docs.get(ref.path))
+
+def seed(fake: CountingFirestore):
+    """Interleaves version writes from every user; TARGET_USER is one tenant among many."""
+    now = datetime.now(timezone.utc)
+    tick = 0
+    for v in range(1, VERSIONS_PER_PROMPT + 1):
+        for p in range(PROMPTS_PER_USER):
+            for u in range(TOTAL_USERS):
+                uid = f"user_{u:04d}"
+                prompt_path = f"prompts/{uid}_p{p}"
+                fake.docs[prompt_path] = {"name": f"Prompt {p}", "user_id": uid, "deleted_at": None}
+                created_at = now - timedelta(seconds=tick + random.random())
+                fake.docs[f"{prompt_path}/versions/{v}"] = {
+                    "version_number": v, "author_uid": uid, "commit_message": f"v{v}",
+                    "created_at": created_at
+                }
+                if uid == TARGET_USER:
+                    entry_id = f"{uid}_p{p}_v{v}"
+                    fake.docs[f"users/{uid}/activity/{entry_id}"] = firestore_service._activity_entry(
+                        "version", f"{uid}_p{p}", f"Prompt {p}", v, f"v{v}", created_at
+                    )
+                tick += 1
+
+# --- The previous implementation, for comparison ---
+async def legacy_get_recent_activity_for_user(user_id: str, limit: int = 10):
+    query = (
+        firestore_service.db.collection_group('versions')
+        .order_by("created_at", direction=firestore.Query.DESCENDING)
+        .limit(limit * 5)
+    )
+    activity_list = []
+    async for doc in query.stream():
+        version_data = doc.to_dict()
+        prompt_ref = doc.reference.parent.parent
+        prompt_doc = await prompt_ref.get()
+        if prompt_doc.exists and prompt_doc.to_dict().get("user_id") == user_id:
+            if version_data.get("author_uid") == user_id and prompt_doc.to_dict().get("deleted_at") is None:
+                activity_list.append({"id": doc.id, "promptId": prompt_ref.id})
+    return activity_list[:limit]
+
+async def measure(label, fn, fake):
+    fake.rpc_count = 0
+    start = time.perf_counter()
+    items = await fn(TARGET_USER, 10)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"   {label:<10} rpcs={fake.rpc_count:3d}   items={len(items):2d}   wall={elapsed_ms:8.2f} ms")
+
+async def main():
+    fake = CountingFirestore()
+    seed(fake)
+    firestore_service.db = fake
+    print(f"--- get_recent_activity_for_user (simulated RTT {SIMULATED_RTT_MS} ms/RPC) ---")
+    await measure("legacy", legacy_get_recent_activity_for_user, fake)
+    await measure("batched", firestore_service._recent_activity_from_versions, fake)
+    await measure("feed", firestore_service.get_recent_activity_for_user, fake)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+# bench_response_cache.py
+# Compares execute_single_model_benchmark with the previous Firestore-only api_cache
+# (a remote read on every call, a blocking remote write on every miss) against the
+# two-tier response cache (L1 memory -> L2 Redis -> L3 Firestore, background writes).
+# Firestore and Redis are in-memory stand-ins with simulated round trips and the LLM
+# call is a sleep, so no network, emulator or credentials are needed.
+#
+# Usage:
+#   python bench_response_cache.py
+import os
+import time
+import random
+import asyncio
+import hashlib
+import statistics
+from datetime import datetime, timezone, timedelta
+
+from cryptography.fernet import Fernet
+
+# The real clients are constructed on import but never used.
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8080")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from app.core import redis_client
+from app.schemas.prompt import BenchmarkResult
+from app.services import llm_service, response_cache
+
+FIRESTORE_RTT_MS = float(os.getenv("BENCH_FIRESTORE_RTT_MS", "15"))
+REDIS_RTT_MS = float(os.getenv("BENCH_REDIS_RTT_MS", "1"))
+LLM_LATENCY_MS = float(os.getenv("BENCH_LLM_MS", "300"))
+CALLS = int(os.getenv("BENCH_CALLS", "400"))
+DISTINCT_PROMPTS = int(os.getenv("BENCH_PROMPTS", "40"))
+MODEL_NAME = "gpt-4o-mini"
+
+# --- In-memory stand-ins ---
+class FakeSnapshot:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+class FakeDocRef:
+    def __init__(self, store, path):
+        self._store, self._path = store, path
+
+    async def get(self):
+        await asyncio.sleep(FIRESTORE_RTT_MS / 1000)
+        return FakeSnapshot(self._store.get(self._path))
+
+    async def set(self, data):
+        await asyncio.sleep(FIRESTORE_RTT_MS / 1000)
+        self._store[self._path] = data
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs = {}
+
+    def collection(self, name):
+        firestore = self
+
+        class Collection:
+            def document(self, doc_id):
+                return FakeDocRef(firestore.docs, f"{name}/{doc_id}")
+        return Collection()
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        await asyncio.sleep(REDIS_RTT_MS / 1000)
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        await asyncio.sleep(REDIS_RTT_MS / 1000)
+        self.values[key] = value
+
+async def fake_openai_call(client, model_name, prompt_text):
+    await asyncio.sleep(LLM_LATENCY_MS / 1000)
+    return f"reply to {prompt_text}", 10, 20
+
+# --- The previous implementation, for comparison ---
+async def legacy_execute_single_model_benchmark(model_name: str, prompt_text: str) -> BenchmarkResult:
+    cache_key = hashlib.sha256(f"{model_name}:{prompt_text}".encode()).hexdigest()
+    cache_ref = response_cache.db.collection(response_cache.API_CACHE_COLLECTION).document(cache_key)
+    cached_doc = await cache_ref.get()
+    if cached_doc.exists:
+        cached_data = cached_doc.to_dict()
+        if datetime.now(timezone.utc) - cached_data["created_at"] < timedelta(minutes=response_cache.CACHE_DURATION_MINUTES):
+            return BenchmarkResult(**cached_data.get("result", {}))
+    start_time = time.perf_counter()
+    generated_text, input_tokens, output_tokens = await fake_openai_call(None, model_name, prompt_text)
+    result = BenchmarkResult(model_name=model_name, generated_text=generated_text,
+                             latency_ms=(time.perf_counter() - start_time) * 1000,
+                             input_token_count=input_tokens, output_token_count=output_tokens)
+    await cache_ref.set({"created_at": datetime.now(timezone.utc), "result": result.model_dump()})
+    return result
+
+def fresh_backends():
+    response_cache.db = FakeFirestore()
+    redis_client.redis_client = FakeRedis()
+    response_cache.l1_cache.clear()
+    for counts in response_cache.stats.values():
+        counts.update(hits=0, misses=0)
+
+async def measure(label: str, fn, workload):
+    repeat_latencies, first_latencies = [], []
+    seen = set()
+    for prompt in workload:
+        start = time.perf_counter()
+        await fn(MODEL_NAME, prompt)
+        elapsed = (time.perf_counter() - start) * 1000
+        (repeat_latencies if prompt in seen else first_latencies).append(elapsed)
+        seen.add(prompt)
+    await asyncio.sleep(0.1)  # let background writes land before the next phase
+    print(f"   {label:<22} repeat p50={statistics.median(repeat_latencies):7.2f} ms   "
+          f"first-seen p50={statistics.median(first_latencies):7.2f} ms   "
+          f"total={sum(repeat_latencies) + sum(first_latencies):8.0f} ms")
+
+async def main():
+    llm_service._call_openai_with_client = fake_openai_call
+    llm_service.platform_openai_client = object()
+    workload = [f"prompt {random.randrange(DISTINCT_PROMPTS)}" for _ in range(CALLS)]
+    print(f"--- {CALLS} benchmark calls over {DISTINCT_PROMPTS} prompts (Firestore RTT {FIRESTORE_RTT_MS} ms, "
+          f"Redis RTT {REDIS_RTT_MS} ms, LLM {LLM_LATENCY_MS} ms) ---")
+
+    fresh_backends()
+    await measure("legacy (Firestore)", legacy_execute_single_model_benchmark, workload)
+
+    fresh_backends()
+    await measure("two-tier", llm_service.execute_single_model_benchmark, workload)
+    # A second replica (empty L1) serving the same workload is answered from Redis.
+    response_cache.l1_cache.clear()
+    await measure("two-tier, cold replica", llm_service.execute_single_model_benchmark, workload)
+    print(f"   stats: {response_cache.get_stats()}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+# bench_token_verification.py
+# Microbenchmark of authenticated requests per second through get_current_user:
+#   legacy  - synchronous verification on the event loop (previous behaviour)
+#   pool    - verification on the thread pool, claims cache disabled
+#   cached  - verification on the thread pool with the claims cache
+# Tokens are RS256 JWTs signed with a locally generated key and verified for real
+# (signature, audience, expiry) against its public key, so no network is involved.
+#
+# Usage:
+#   python bench_token_verification.py
+import os
+import time
+import random
+import asyncio
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+# The Firestore client is constructed on import but never used.
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8080")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+import httpx
+from fastapi import FastAPI, Depends, HTTPException
+from google.auth import crypt, jwt
+
+from app.core.cache import TTLCache
+from app.services import security_service
+
+PROJECT_ID = "promptforge-bench"
+KEY_ID = "bench-key"
+TOTAL_REQUESTS = int(os.getenv("BENCH_REQUESTS", "3000"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "50"))
+DISTINCT_TOKENS = int(os.getenv("BENCH_TOKENS", "100"))
+
+private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+private_pem = private_key.private_bytes(
+    serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+).decode()
+public_pem = private_key.public_key().public_bytes(
+    serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+).decode()
+signer = crypt.RSASigner.from_string(private_pem, key_id=KEY_ID)
+
+def make_token(uid: str) -> str:
+    now = int(time.time())
+    payload = {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}", "aud": PROJECT_ID,
+        "sub": uid, "uid": uid, "iat": now, "exp": now + 3600
+    }
+    return jwt.encode(signer, payload).decode()
+
+def local_verify(token: str) -> dict:
+    """Stands in for auth.verify_id_token: full RS256 signature and claim checks."""
+    return jwt.decode(token, certs={KEY_ID: public_pem}, audience=PROJECT_ID)
+
+async def legacy_get_current_user(token: str = Depends(security_service.oauth2_scheme)):
+    try:
+        return local_verify(token)
+    except Exception:
+        raise HTTPException(status_code=401)
+
+def build_app(dependency) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/me")
+    async def me(user: dict = Depends(dependency)):
+        return {"uid": user["uid"]}
+
+    return app
+
+async def measure(label: str, app: FastAPI, tokens: list):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue = asyncio.Queue()
+        for _ in range(TOTAL_REQUESTS):
+            queue.put_nowait(random.choice(tokens))
+
+        async def worker():
+            while not queue.empty():
+                token = queue.get_nowait()
+                response = await client.get("/me", headers={"Authorization": f"Bearer {token}"})
+                assert response.status_code == 200, response.text
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+        elapsed = time.perf_counter() - start
+    print(f"   {label:<8} {TOTAL_REQUESTS / elapsed:9.1f} req/s   ({elapsed * 1000:8.1f} ms total)")
+
+async def main():
+    tokens = [make_token(f"user_{i}") for i in range(DISTINCT_TOKENS)]
+    security_service._verify_token_sync = local_verify
+    print(f"--- {TOTAL_REQUESTS} authenticated requests, concurrency {CONCURRENCY}, {DISTINCT_TOKENS} distinct tokens ---")
+
+    await measure("legacy", build_app(legacy_get_current_user), tokens)
+
+    security_service.token_cache = TTLCache(maxsize=0, ttl_seconds=3600)
+    await measure("pool", build_app(security_service.get_current_user), tokens)
+
+    security_service.token_cache = TTLCache(maxsize=security_service.TOKEN_CACHE_MAX_ENTRIES, ttl_seconds=3600)
+    await measure("cached", build_app(security_service.get_current_user), tokens)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+# bench_velocity_trap.py
+# Per-request latency added by the velocity trap middleware, measured through a minimal
+# ASGI app against an in-memory Redis stand-in with a simulated network round trip:
+#   previous  - GET ban, INCR, EXPIRE on first hit, SETEX on ban (sequential round trips)
+#   script    - app.core.velocity.check: one EVALSHA, or nothing for a locally known ban
+# for normal traffic (many IPs under the limit) and for an IP that is already banned.
+#
+# Usage:
+#   python bench_velocity_trap.py
+import os
+import json
+import time
+import asyncio
+import statistics
+
+import httpx
+from fastapi import FastAPI, Request, Response
+
+from app.core import velocity
+
+RTT_MS = float(os.getenv("BENCH_REDIS_RTT_MS", "0.5"))
+REQUESTS = 2000
+
+class FakeRedis:
+    """In-memory Redis with a fixed delay per command (or per script call) and a round-trip counter."""
+    def __init__(self):
+        self.values, self.expires_at, self.round_trips = {}, {}, 0
+
+    async def _rtt(self):
+        self.round_trips += 1
+        await asyncio.sleep(RTT_MS / 1000)
+
+    def _live(self, key):
+        if key in self.expires_at and self.expires_at[key] <= time.monotonic():
+            self.values.pop(key, None)
+            self.expires_at.pop(key, None)
+        return key in self.values
+
+    # --- commands used by the previous middleware ---
+    async def get(self, key):
+        await self._rtt()
+        return self.values.get(key) if self._live(key) else None
+
+    async def incr(self, key):
+        await self._rtt()
+        self.values[key] = int(self.values.get(key, 0) if self._live(key) else 0) + 1
+        return self.values[key]
+
+    async def expire(self, key, seconds):
+        await self._rtt()
+        self.expires_at[key] = time.monotonic() + seconds
+
+    async def setex(self, key, seconds, value):
+        await self._rtt()
+        self.values[key], self.expires_at[key] = value, time.monotonic() + seconds
+
+    # --- the velocity script, evaluated in Python with one round trip ---
+    def register_script(self, source):
+        async def run(keys, args):
+            await self._rtt()
+            ban_key, counter_key = keys
+            if self._live(ban_key):
+                return [1, int((self.expires_at[ban_key] - time.monotonic()) * 1000)]
+            self.values[counter_key] = int(self.values.get(counter_key, 0) if self._live(counter_key) else 0) + 1
+            count = self.values[counter_key]
+            if count == 1:
+                self.expires_at[counter_key] = time.monotonic() + 2
+            if count > int(args[0]):
+                self.values[ban_key], self.expires_at[ban_key] = "banned", time.monotonic() + int(args[1])
+                return [2, count]
+            return [0, count]
+        return run
+
+def json_response(detail, status_code):
+    return Response(content=json.dumps({"detail": detail}), status_code=status_code, media_type="application/json")
+
+# --- The previous middleware body, for comparison ---
+async def previous_trap(cache, client_ip):
+    if await cache.get(f"ban:{client_ip}"):
+        return json_response("IP Banned for suspicious velocity. Try again in 1 hour.", 403)
+    velocity_key = f"vel:{client_ip}:{int(time.time())}"
+    request_count = await cache.incr(velocity_key)
+    if request_count == 1:
+        await cache.expire(velocity_key, 2)
+    if request_count > 15:
+        await cache.setex(f"ban:{client_ip}", 3600, "banned")
+        return json_response("Velocity limit exceeded. You are banned.", 429)
+    return None
+
+async def script_trap(cache, client_ip):
+    verdict = await velocity.check(cache, client_ip)
+    if verdict == velocity.BANNED:
+        return json_response("IP Banned for suspicious velocity. Try again in 1 hour.", 403)
+    if verdict == velocity.BAN_ISSUED:
+        return json_response("Velocity limit exceeded. You are banned.", 429)
+    return None
+
+def build_app(trap, cache):
+    app = FastAPI()
+
+    @app.get("/")
+    async def root():
+        return {"status": "ok"}
+
+    if trap:
+        @app.middleware("http")
+        async def velocity_trap(request: Request, call_next):
+            client_ip = request.headers["X-Forwarded-For"]
+            return await trap(cache, client_ip) or await call_next(request)
+    return app
+
+async def per_request_us(app, ip_for) -> tuple[list, list]:
+    latencies, statuses = [], []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        for i in range(REQUESTS):
+            start = time.perf_counter()
+            response = await client.get("/", headers={"X-Forwarded-For": ip_for(i)})
+            latencies.append((time.perf_counter() - start) * 1_000_000)
+            statuses.append(response.status_code)
+    return latencies, statuses
+
+async def main():
+    normal_ip = lambda i: f"10.0.{i // 250}.{i % 250}"  # each IP stays far below the limit
+    baseline, _ = await per_request_us(build_app(None, None), normal_ip)
+    base = statistics.median(baseline)
+    print(f"--- {REQUESTS} requests per scenario, simulated Redis RTT {RTT_MS} ms, baseline p50 {base:.0f} us ---")
+    for label, trap in (("previous", previous_trap), ("script", script_trap)):
+        for traffic, ip_for in (("normal", normal_ip), ("banned", lambda i: "203.0.113.9")):
+            velocity.local_bans.clear()
+            cache = FakeRedis()
+            if traffic == "banned":
+                cache.values["ban:203.0.113.9"], cache.expires_at["ban:203.0.113.9"] = "banned", time.monotonic() + 3600
+            latencies, statuses = await per_request_us(build_app(trap, cache), ip_for)
+            added = [l - base for l in latencies]
+            print(f"   {label:<9}{traffic:<7} added p50={statistics.median(added):7.0f} us   "
+                  f"p99={sorted(added)[int(len(added) * 0.99)]:7.0f} us   "
+                  f"redis_round_trips/request={cache.round_trips / REQUESTS:.3f}   statuses={sorted(set(statuses))}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
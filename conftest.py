@@ -0,0 +1,116 @@
+# conftest.py
+# Shared setup for the offline pytest suites (test_job_queue.py, test_batch_jobs.py,
+# test_llm_*.py, test_singleflight.py, test_streaming_execution.py): the environment the
+# app modules need at import time, in-memory stand-ins for Redis and Firestore, and
+# fixtures around the local stub provider (stub_llm_provider.py).
+import os
+import json
+import time
+import asyncio
+
+from cryptography.fernet import Fernet
+
+# The real clients are constructed on import but never used.
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8080")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+import pytest
+from openai import AsyncOpenAI
+
+from app.core import redis_client
+from app.services import llm_service
+from stub_llm_provider import reset_stats, run_stub_server
+
+class FakeRedis:
+    """Just enough of redis.asyncio for the job queue, the response cache and its fill lock."""
+    def __init__(self):
+        self.values, self.lists = {}, {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def exists(self, key):
+        return int(key in self.values)
+
+    async def eval(self, script, numkeys, key, token):
+        # The response cache's compare-and-delete unlock script.
+        if self.values.get(key) == token:
+            del self.values[key]
+            return 1
+        return 0
+
+    async def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    async def lpush(self, key, value):
+        self.lists.setdefault(key, []).insert(0, value)
+
+    async def brpop(self, key, timeout=0):
+        deadline = time.monotonic() + timeout
+        while not self.lists.get(key):
+            if time.monotonic() > deadline:
+                return None
+            await asyncio.sleep(0.01)
+        return key, self.lists[key].pop()
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+class FakeFirestore:
+    """A single in-memory collection with document get/set (the response cache's L3 tier)."""
+    def __init__(self):
+        self.docs = {}
+
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        firestore = self
+
+        class Doc:
+            async def get(self):
+                return FakeSnapshot(firestore.docs.get(doc_id))
+
+            async def set(self, data):
+                firestore.docs[doc_id] = data
+        return Doc()
+
+def parse_sse(body: str) -> list[tuple[str, dict]]:
+    """Splits a text/event-stream body into (event, data) pairs."""
+    frames = [dict(line.split(": ", 1) for line in frame.splitlines()) for frame in body.strip().split("\n\n")]
+    return [(frame["event"], json.loads(frame["data"])) for frame in frames]
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(redis_client, "redis_client", fake)
+    return fake
+
+@pytest.fixture
+def stub_url():
+    """Runs the stub provider for one test, with its call counters and queued faults reset."""
+    with run_stub_server() as base_url:
+        reset_stats()
+        yield base_url
+
+@pytest.fixture
+def stub_client(stub_url):
+    """An OpenAI client for the stub provider, without the SDK's own retries."""
+    return AsyncOpenAI(api_key="stub-key", base_url=f"{stub_url}/v1", max_retries=0)
+
+@pytest.fixture
+def platform_client(stub_client, monkeypatch):
+    """Makes the stub client the platform OpenAI client for this test."""
+    monkeypatch.setattr(llm_service, "platform_openai_client", stub_client)
+    return stub_client
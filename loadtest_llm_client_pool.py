@@ -0,0 +1,108 @@
+# loadtest_llm_client_pool.py
+# Load test for managed (user-key) executions against the local stub provider:
+#   legacy - a new AsyncOpenAI client per request (previous behaviour)
+#   pooled - llm_service.execute_managed_prompt with the per-key client pool
+# Reports TCP connections opened at the stub and latency, and checks that every
+# response was produced with the caller's own key (the stub echoes the key back).
+# Gemini clients are gRPC-only in the async SDK, so their isolation is checked by
+# inspecting the pooled clients' credentials and the untouched global genai config.
+#
+# Usage:
+#   python loadtest_llm_client_pool.py
+import os
+import time
+import asyncio
+import logging
+import statistics
+
+from cryptography.fernet import Fernet
+
+# The Firestore client is constructed on import but never used.
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8080")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+from openai import AsyncOpenAI
+
+from app.services import firestore_service, llm_client_pool, llm_service
+from stub_llm_provider import app as stub_app, reset_stats, run_stub_server
+
+USERS = int(os.getenv("LOADTEST_USERS", "20"))
+REQUESTS = int(os.getenv("LOADTEST_REQUESTS", "1000"))
+CONCURRENCY = int(os.getenv("LOADTEST_CONCURRENCY", "50"))
+MODEL_NAME = "gpt-4o-mini"
+
+def key_for(user_id: str) -> str:
+    return f"sk-{user_id}"
+
+async def fake_get_decrypted_user_api_key(user_id: str, provider: str):
+    return key_for(user_id)
+
+# --- The previous implementation, for comparison ---
+async def legacy_execute(user_id: str, prompt_text: str) -> str:
+    client = AsyncOpenAI(api_key=key_for(user_id))
+    generated_text, _, _ = await llm_service._call_openai_with_client(client, MODEL_NAME, prompt_text)
+    return generated_text
+
+async def pooled_execute(user_id: str, prompt_text: str) -> str:
+    response = await llm_service.execute_managed_prompt(user_id, MODEL_NAME, prompt_text)
+    return response.final_text
+
+async def run(label: str, execute):
+    reset_stats()
+    latencies, mismatches = [], 0
+    queue = asyncio.Queue()
+    for i in range(REQUESTS):
+        queue.put_nowait(f"user_{i % USERS}")
+
+    async def worker():
+        nonlocal mismatches
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            start = time.perf_counter()
+            text = await execute(user_id, f"hello from {user_id}")
+            latencies.append((time.perf_counter() - start) * 1000)
+            if f"[key={key_for(user_id)}]" not in text:
+                mismatches += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"   {label:<7} connections={len(stub_app.state.connections):5d}   "
+          f"p50={statistics.median(latencies):7.1f} ms   p99={latencies[int(len(latencies) * 0.99) - 1]:7.1f} ms   "
+          f"{REQUESTS / elapsed:7.1f} req/s   key_mismatches={mismatches}")
+    return mismatches
+
+async def check_gemini_isolation() -> int:
+    global_config = dict(genai_client._client_manager.client_config)
+
+    async def one(i):
+        model = llm_client_pool.get_gemini_model(key_for(f"user_{i % USERS}"), "gemini-2.5-flash-lite")
+        await asyncio.sleep(0)
+        return i, model._async_client.transport._credentials.token
+
+    results = await asyncio.gather(*(one(i) for i in range(REQUESTS)))
+    mismatches = sum(1 for i, token in results if token != key_for(f"user_{i % USERS}"))
+    untouched = genai_client._client_manager.client_config == global_config
+    print(f"   gemini  pooled_clients={sum(1 for key, _ in llm_client_pool.client_pool._data if key == 'google'):3d}   "
+          f"key_mismatches={mismatches}   global_config_untouched={untouched}")
+    return mismatches + (0 if untouched else 1)
+
+async def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    firestore_service.get_decrypted_user_api_key = fake_get_decrypted_user_api_key
+    print(f"--- {REQUESTS} managed OpenAI executions, {USERS} users, concurrency {CONCURRENCY}, "
+          f"stub latency {stub_app.state.latency_ms:.0f} ms ---")
+    failures = await run("legacy", legacy_execute)
+    failures += await run("pooled", pooled_execute)
+    failures += await check_gemini_isolation()
+    if failures:
+        raise SystemExit(f"❌ {failures} key isolation failures")
+    print("✅ Every response used the caller's own key.")
+
+if __name__ == "__main__":
+    with run_stub_server() as url:
+        os.environ["OPENAI_BASE_URL"] = f"{url}/v1"
+        asyncio.run(main())
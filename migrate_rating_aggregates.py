@@ -0,0 +1,24 @@
+# migrate_rating_aggregates.py
+# Computes the initial rating_sum / rating_count on every prompt (and the per-user
+# rating_votes documents) used by incremental rating aggregation. Run once before
+# deploying the new rating path; safe to re-run.
+#
+# Usage:
+#   python migrate_rating_aggregates.py [--dry-run]
+import sys
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.services import firestore_service
+
+async def main():
+    dry_run = "--dry-run" in sys.argv
+    mode = "DRY RUN" if dry_run else "LIVE"
+    print(f"🚀 Migrating rating aggregates ({mode})...")
+    stats = await firestore_service.migrate_rating_aggregates(dry_run=dry_run)
+    print(f"✅ Processed {stats['prompts']} prompts with {stats['votes']} distinct user votes.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
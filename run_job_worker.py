@@ -0,0 +1,39 @@
+# run_job_worker.py
+# Runs background job workers (see app/services/job_queue.py) in a dedicated process, so
+# analysis load can be scaled separately from the API tier. This is how `mode=async` jobs
+# get executed: API replicas run no workers unless JOB_WORKER_CONCURRENCY is set for them.
+#
+# Usage:
+#   JOB_WORKER_CONCURRENCY=16 python run_job_worker.py
+import os
+import signal
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+from app.core import redis_client
+from app.core.db import initialize_firebase
+from app.services import job_queue
+
+async def main():
+    concurrency = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+    if not await redis_client.ping():
+        raise SystemExit(f"Redis at {redis_client.REDIS_URL} is unreachable; nothing to run.")
+    workers = job_queue.start_workers(concurrency)
+    if not workers:
+        raise SystemExit("JOB_WORKER_CONCURRENCY=0; nothing to run.")
+    logging.info(f"Running {len(workers)} job worker(s) on {job_queue.JOB_QUEUE_KEY}.")
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+    await stop.wait()
+    logging.info("Shutting down job workers.")
+    await job_queue.stop_workers(workers)
+
+if __name__ == "__main__":
+    initialize_firebase()
+    asyncio.run(main())
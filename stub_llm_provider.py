@@ -0,0 +1,343 @@
+# stub_llm_provider.py
+# A local stand-in for the Gemini and OpenAI HTTP APIs, used by the benchmarks and tests
+# so LLM code paths can be exercised without network access or real keys.
+#
+# Run standalone:
+#   python stub_llm_provider.py            # listens on 127.0.0.1:8765
+# Or in-process:
+#   with run_stub_server() as base_url: ...
+import os
+import json
+import time
+import random
+import socket
+import asyncio
+import threading
+import itertools
+from email import policy
+from email.parser import BytesParser
+from contextlib import contextmanager
+from collections import Counter, deque
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "100"))
+# Streamed replies send the first word after STUB_LATENCY_MS, then one word per STUB_TOKEN_DELAY_MS.
+STUB_TOKEN_DELAY_MS = float(os.getenv("STUB_TOKEN_DELAY_MS", "20"))
+# A random STUB_SLOW_RATE fraction of requests take STUB_SLOW_MS instead (a latency tail).
+STUB_SLOW_RATE = float(os.getenv("STUB_SLOW_RATE", "0"))
+STUB_SLOW_MS = float(os.getenv("STUB_SLOW_MS", "1000"))
+# How long an injected "stall" fault hangs before answering normally.
+STUB_STALL_SECONDS = float(os.getenv("STUB_STALL_SECONDS", "2"))
+
+app = FastAPI(title="Stub LLM Provider")
+app.state.latency_ms = STUB_LATENCY_MS
+app.state.token_delay_ms = STUB_TOKEN_DELAY_MS
+app.state.calls = Counter()
+app.state.keys = Counter()           # requests seen per API key
+app.state.connections = set()        # distinct (client host, port) pairs = TCP connections opened
+
+app.state.files = {}                 # Files API: id -> (filename, bytes)
+app.state.batches = {}               # Batch API: id -> batch object
+app.state.batch_delay_ms = float(os.getenv("STUB_BATCH_DELAY_MS", "200"))
+app.state.slow_rate = STUB_SLOW_RATE
+app.state.slow_ms = STUB_SLOW_MS
+app.state.stall_seconds = STUB_STALL_SECONDS
+app.state.faults = deque()           # injected faults, consumed one per LLM request (see inject_faults)
+app.state.in_flight = 0
+app.state.peak_in_flight = 0         # highest number of requests being served at once
+
+@app.middleware("http")
+async def record_connection(request: Request, call_next):
+    if request.client:
+        app.state.connections.add((request.client.host, request.client.port))
+    app.state.in_flight += 1
+    app.state.peak_in_flight = max(app.state.peak_in_flight, app.state.in_flight)
+    try:
+        return await call_next(request)
+    finally:
+        app.state.in_flight -= 1
+
+def _api_key(request: Request) -> str:
+    auth_header = request.headers.get("authorization", "")
+    if auth_header.startswith("Bearer "):
+        return auth_header[len("Bearer "):]
+    return request.headers.get("x-goog-api-key") or request.query_params.get("key", "")
+
+def reset_stats():
+    app.state.calls.clear()
+    app.state.keys.clear()
+    app.state.connections.clear()
+    app.state.peak_in_flight = 0
+    app.state.faults.clear()
+    app.state.files.clear()
+    app.state.batches.clear()
+
+def inject_faults(*faults):
+    """
+    Queues faults for the next LLM requests, one per request: an HTTP status code (e.g. 429,
+    500, 503) returns that error, "stall" hangs for stall_seconds before answering, and None
+    lets the request through. Requests after the queue is drained are served normally.
+    """
+    app.state.faults.extend(faults)
+
+_GOOGLE_STATUS = {400: "INVALID_ARGUMENT", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+
+async def _injected_fault(provider: str) -> JSONResponse | None:
+    """Applies the next queued fault; returns the error response to send, if any."""
+    fault = app.state.faults.popleft() if app.state.faults else None
+    if fault == "stall":
+        await asyncio.sleep(app.state.stall_seconds)
+        return None
+    if fault is None:
+        return None
+    status, message = int(fault), f"Injected stub fault {fault}"
+    if provider == "gemini":
+        error = {"code": status, "message": message, "status": _GOOGLE_STATUS.get(status, "UNKNOWN")}
+    else:
+        error = {"message": message, "type": "server_error" if status >= 500 else "invalid_request_error", "code": None}
+    return JSONResponse({"error": error}, status_code=status)
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text.split()))
+
+def _reply_for(prompt_text: str, api_key: str) -> str:
+    # The key is echoed back so callers can check their request was not sent with someone else's.
+    return f"[key={api_key}] stub reply to: {prompt_text[:60]}"
+
+async def _simulate_latency():
+    slow = app.state.slow_rate and random.random() < app.state.slow_rate
+    await asyncio.sleep((app.state.slow_ms if slow else app.state.latency_ms) / 1000)
+
+async def _stream_words(reply: str):
+    """Yields the reply word by word with the configured first-token and inter-token delays."""
+    await _simulate_latency()
+    words = reply.split(" ")
+    for i, word in enumerate(words):
+        if i:
+            await asyncio.sleep(app.state.token_delay_ms / 1000)
+        yield word if i == len(words) - 1 else word + " "
+
+def _sse(payload: dict | str) -> str:
+    return f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n"
+
+# --- Gemini (generativelanguage v1beta REST) ---
+@app.post("/v1beta/models/{model_action}")
+async def gemini_endpoint(model_action: str, request: Request):
+    model, _, action = model_action.partition(":")
+    body = await request.json()
+    # countTokens wraps the request as {"generateContentRequest": {...}}
+    body = body.get("generateContentRequest", body)
+    prompt_text = " ".join(
+        part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])
+    )
+    app.state.calls[f"gemini:{action}"] += 1
+    app.state.keys[_api_key(request)] += 1
+    if (error := await _injected_fault("gemini")) is not None:
+        return error
+    if action == "streamGenerateContent":
+        sse = request.query_params.get("alt", "").startswith("sse")
+        return StreamingResponse(_gemini_stream(prompt_text, _api_key(request), sse),
+                                 media_type="text/event-stream" if sse else "application/json")
+    await _simulate_latency()
+    if action == "countTokens":
+        return {"totalTokens": _count_tokens(prompt_text)}
+    if action == "generateContent":
+        reply = _reply_for(prompt_text, _api_key(request))
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": reply}]}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {
+                "promptTokenCount": _count_tokens(prompt_text),
+                "candidatesTokenCount": _count_tokens(reply),
+                "totalTokenCount": _count_tokens(prompt_text) + _count_tokens(reply)
+            }
+        }
+    return JSONResponse({"error": {"code": 404, "message": f"Unknown action {action}"}}, status_code=404)
+
+async def _gemini_stream(prompt_text: str, api_key: str, sse: bool):
+    """Streams GenerateContentResponse chunks as SSE (alt=sse) or as one JSON array (the SDK's REST default)."""
+    reply = _reply_for(prompt_text, api_key)
+
+    async def chunks():
+        async for word in _stream_words(reply):
+            yield {"candidates": [{"content": {"role": "model", "parts": [{"text": word}]}, "index": 0}]}
+        yield {
+            "candidates": [{"content": {"role": "model", "parts": []}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": _count_tokens(prompt_text), "candidatesTokenCount": _count_tokens(reply)}
+        }
+
+    first = True
+    async for chunk in chunks():
+        if sse:
+            yield _sse(chunk)
+        else:
+            yield ("[" if first else ",\n") + json.dumps(chunk)
+        first = False
+    if not sse:
+        yield "]"
+
+# --- OpenAI (chat completions) ---
+async def _openai_stream(body: dict, prompt_text: str, api_key: str):
+    reply = _reply_for(prompt_text, api_key)
+    base = {"id": "chatcmpl-stub-stream", "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model")}
+    async for word in _stream_words(reply):
+        yield _sse({**base, "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]})
+    yield _sse({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+    if body.get("stream_options", {}).get("include_usage"):
+        yield _sse({**base, "choices": [], "usage": {
+            "prompt_tokens": _count_tokens(prompt_text), "completion_tokens": _count_tokens(reply),
+            "total_tokens": _count_tokens(prompt_text) + _count_tokens(reply)
+        }})
+    yield _sse("[DONE]")
+
+@app.post("/v1/chat/completions")
+async def openai_chat_completions(request: Request):
+    body = await request.json()
+    prompt_text = " ".join(m.get("content", "") for m in body.get("messages", []))
+    app.state.calls["openai:chat"] += 1
+    app.state.keys[_api_key(request)] += 1
+    if (error := await _injected_fault("openai")) is not None:
+        return error
+    if "invalid" in body.get("model", ""):  # Same rule as batch lines: an unknown model.
+        return JSONResponse({"error": {"message": f"The model `{body['model']}` does not exist",
+                                       "type": "invalid_request_error", "code": "model_not_found"}}, status_code=404)
+    if body.get("stream"):
+        return StreamingResponse(_openai_stream(body, prompt_text, _api_key(request)), media_type="text/event-stream")
+    await _simulate_latency()
+    reply = _reply_for(prompt_text, _api_key(request))
+    return {
+        "id": f"chatcmpl-stub-{app.state.calls['openai:chat']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": _count_tokens(prompt_text),
+            "completion_tokens": _count_tokens(reply),
+            "total_tokens": _count_tokens(prompt_text) + _count_tokens(reply)
+        }
+    }
+
+# --- OpenAI (files and batches) ---
+_ids = itertools.count(1)
+_batch_tasks = set()
+
+def _file_object(file_id: str, filename: str, content: bytes, purpose: str) -> dict:
+    return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "status": "processed"}
+
+def _store_file(filename: str, content: bytes, purpose: str) -> dict:
+    file_id = f"file-stub-{next(_ids)}"
+    app.state.files[file_id] = (filename, content)
+    return _file_object(file_id, filename, content, purpose)
+
+@app.post("/v1/files")
+async def openai_upload_file(request: Request):
+    # Parsed by hand so the stub does not need python-multipart.
+    header = f"Content-Type: {request.headers['content-type']}\r\n\r\n".encode()
+    message = BytesParser(policy=policy.default).parsebytes(header + await request.body())
+    fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+    upload = fields["file"]
+    app.state.calls["openai:file_upload"] += 1
+    return _store_file(upload.get_filename(), upload.get_payload(decode=True), fields["purpose"].get_payload(decode=True).decode())
+
+@app.get("/v1/files/{file_id}/content")
+async def openai_file_content(file_id: str):
+    if file_id not in app.state.files:
+        return JSONResponse({"error": {"message": f"No such file: {file_id}", "type": "invalid_request_error"}}, status_code=404)
+    return PlainTextResponse(app.state.files[file_id][1].decode())
+
+def _batch_line_result(line: dict, api_key: str) -> dict:
+    """One output record. Model names containing "invalid" get a per-line 404, like an unknown model."""
+    body = line["body"]
+    model = body.get("model", "")
+    if "invalid" in model:
+        error = {"message": f"The model `{model}` does not exist", "type": "invalid_request_error"}
+        return {"id": f"batch_req_{next(_ids)}", "custom_id": line["custom_id"],
+                "response": {"status_code": 404, "body": {"error": error}}, "error": None}
+    prompt_text = " ".join(m.get("content", "") for m in body.get("messages", []))
+    reply = _reply_for(prompt_text, api_key)
+    completion = {
+        "id": f"chatcmpl-stub-batch-{next(_ids)}", "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": _count_tokens(prompt_text), "completion_tokens": _count_tokens(reply),
+                  "total_tokens": _count_tokens(prompt_text) + _count_tokens(reply)},
+    }
+    return {"id": f"batch_req_{next(_ids)}", "custom_id": line["custom_id"],
+            "response": {"status_code": 200, "body": completion}, "error": None}
+
+async def _process_batch(batch_id: str, api_key: str):
+    batch = app.state.batches[batch_id]
+    await asyncio.sleep(app.state.batch_delay_ms / 1000)
+    lines = [json.loads(line) for line in app.state.files[batch["input_file_id"]][1].decode().splitlines() if line.strip()]
+    results = [_batch_line_result(line, api_key) for line in lines]
+    app.state.calls["openai:batch_request"] += len(results)
+    failed = sum(1 for r in results if r["response"]["status_code"] != 200)
+    output = "\n".join(json.dumps(r) for r in results).encode()
+    batch.update({
+        "status": "completed", "completed_at": int(time.time()),
+        "output_file_id": _store_file(f"{batch_id}_output.jsonl", output, "batch_output")["id"],
+        "request_counts": {"total": len(results), "completed": len(results) - failed, "failed": failed},
+    })
+
+@app.post("/v1/batches")
+async def openai_create_batch(request: Request):
+    body = await request.json()
+    app.state.calls["openai:batch"] += 1
+    if (error := await _injected_fault("openai")) is not None:
+        return error
+    batch_id = f"batch_stub_{next(_ids)}"
+    app.state.batches[batch_id] = {
+        "id": batch_id, "object": "batch", "endpoint": body["endpoint"], "input_file_id": body["input_file_id"],
+        "completion_window": body["completion_window"], "status": "in_progress", "created_at": int(time.time()),
+        "output_file_id": None, "error_file_id": None, "metadata": body.get("metadata"),
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+    }
+    task = asyncio.create_task(_process_batch(batch_id, _api_key(request)))
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+    return app.state.batches[batch_id]
+
+@app.get("/v1/batches/{batch_id}")
+async def openai_retrieve_batch(batch_id: str):
+    app.state.calls["openai:batch_poll"] += 1
+    if (error := await _injected_fault("openai")) is not None:
+        return error
+    return app.state.batches[batch_id]
+
+# --- Introspection ---
+@app.get("/stub/stats")
+async def stub_stats():
+    return {"calls": dict(app.state.calls), "keys": dict(app.state.keys), "connections": len(app.state.connections),
+            "peak_in_flight": app.state.peak_in_flight, "pending_faults": list(app.state.faults)}
+
+@app.post("/stub/faults")
+async def stub_faults(request: Request):
+    """Body: a JSON list of faults, as accepted by inject_faults()."""
+    inject_faults(*await request.json())
+    return {"queued": len(app.state.faults)}
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def run_stub_server(port: int | None = None):
+    """Runs the stub in a background thread and yields its base URL."""
+    port = port or _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("STUB_PORT", "8765")))
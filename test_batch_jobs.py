@@ -0,0 +1,151 @@
+# test_batch_jobs.py
+# The batch job worker against the stub provider's Files and Batch API stand-in: OpenAI
+# items are grouped per model into batch submissions and every item ends up with a result.
+# Job storage is an in-memory stand-in for the firestore_service batch functions.
+#
+# Usage:
+#   python -m pytest -q test_batch_jobs.py
+import asyncio
+
+import pytest
+
+from app.services import batch_service, firestore_service, llm_resilience
+from stub_llm_provider import app as stub_app, inject_faults
+
+class FakeJobStore:
+    """Just the firestore_service batch job functions the worker uses, kept in memory."""
+    def __init__(self):
+        self.jobs, self.items = {}, {}
+        self.lease_taken_over = False
+
+    async def create_batch_job(self, user_id, items):
+        job_id = f"job{len(self.jobs) + 1}"
+        self.jobs[job_id] = {"user_id": user_id, "status": "queued", "total": len(items), "completed": 0, "failed": 0}
+        self.items[job_id] = {f"{i:06d}": {**item, "index": i, "status": "pending"} for i, item in enumerate(items)}
+        return {"id": job_id, **self.jobs[job_id]}
+
+    async def claim_batch_job(self, job_id, owner, lease_seconds):
+        return not self.lease_taken_over and self.jobs[job_id]["status"] not in ("completed", "failed")
+
+    async def set_batch_items_submission(self, job_id, item_ids, openai_batch_id):
+        for item_id in item_ids:
+            self.items[job_id][item_id]["openai_batch_id"] = openai_batch_id
+
+    async def update_batch_job(self, job_id, **fields):
+        self.jobs[job_id].update(fields)
+
+    async def list_pending_batch_items(self, job_id):
+        return [{"id": item_id, **item} for item_id, item in self.items[job_id].items() if item["status"] == "pending"]
+
+    async def save_batch_results(self, job_id, results):
+        for item_id, result in results.items():
+            self.items[job_id][item_id].update(result)
+            self.jobs[job_id]["completed" if result["status"] == "succeeded" else "failed"] += 1
+
+@pytest.fixture
+def store(platform_client, monkeypatch):
+    store = FakeJobStore()
+    for name in ("create_batch_job", "claim_batch_job", "set_batch_items_submission", "update_batch_job",
+                 "list_pending_batch_items", "save_batch_results"):
+        monkeypatch.setattr(firestore_service, name, getattr(store, name))
+    monkeypatch.setattr(batch_service, "BATCH_POLL_SECONDS", 0.05)
+    monkeypatch.setattr(llm_resilience, "POLICY_OVERRIDES", {"openai": {"backoff_base_seconds": 0.01, "backoff_max_seconds": 0.05}})
+    llm_resilience._breakers.clear()
+    monkeypatch.setattr(batch_service, "BATCH_MAX_REQUESTS_PER_SUBMISSION", 4)
+    monkeypatch.setattr(stub_app.state, "batch_delay_ms", 100)
+    return store
+
+def items(model, count):
+    return [{"model": model, "prompt_text": f"{model} prompt {i}", "custom_id": f"{model}-{i}"} for i in range(count)]
+
+def test_openai_items_go_through_batch_submissions(store):
+    async def run():
+        job = await store.create_batch_job("u1", items("gpt-4o-mini", 6) + items("gpt-4o", 3))
+        await batch_service.run_batch_job(job["id"])
+        return job["id"]
+
+    job_id = asyncio.run(run())
+    job, results = store.jobs[job_id], store.items[job_id]
+    assert job["status"] == "completed"
+    assert (job["completed"], job["failed"]) == (9, 0)
+    # 6 gpt-4o-mini items split 4 + 2, plus one gpt-4o submission; no interactive calls.
+    assert stub_app.state.calls["openai:batch"] == 3
+    assert stub_app.state.calls["openai:batch_request"] == 9
+    assert stub_app.state.calls["openai:chat"] == 0
+    for item in results.values():
+        assert item["status"] == "succeeded"
+        assert item["generated_text"] == f"[key=stub-key] stub reply to: {item['prompt_text']}"
+        assert item["input_token_count"] == len(item["prompt_text"].split())
+
+def test_per_item_failures_and_resume(store):
+    async def run():
+        job = await store.create_batch_job("u1", items("gpt-4o-mini", 2) + items("invalid-model", 1))
+        # Simulates a restart after the first item was already stored.
+        await store.save_batch_results(job["id"], {"000000": batch_service._succeeded("earlier", 1, 1)})
+        await batch_service.run_batch_job(job["id"])
+        return job["id"]
+
+    job_id = asyncio.run(run())
+    job, results = store.jobs[job_id], store.items[job_id]
+    assert job["status"] == "completed"
+    assert (job["completed"], job["failed"]) == (2, 1)
+    assert results["000000"]["generated_text"] == "earlier"
+    assert stub_app.state.calls["openai:batch_request"] == 2
+    assert results["000002"]["status"] == "failed" and "does not exist" in results["000002"]["error"]
+
+def test_transient_poll_errors_do_not_fail_the_items(store):
+    async def run():
+        job = await store.create_batch_job("u1", items("gpt-4o-mini", 3))
+        # The create call goes through; the next polls fail with 500/503/429 before succeeding.
+        inject_faults(None, 500, 503, 429)
+        await batch_service.run_batch_job(job["id"])
+        return job["id"]
+
+    job_id = asyncio.run(run())
+    job = store.jobs[job_id]
+    assert job["status"] == "completed"
+    assert (job["completed"], job["failed"]) == (3, 0)
+    assert stub_app.state.calls["openai:batch"] == 1
+
+def test_resumed_job_attaches_to_submitted_batch(store):
+    async def run():
+        job = await store.create_batch_job("u1", items("gpt-4o-mini", 3))
+        # The first worker dies after submitting the batch, before it finishes.
+        worker = asyncio.create_task(batch_service.run_batch_job(job["id"]))
+        while not all(item.get("openai_batch_id") for item in store.items[job["id"]].values()):
+            await asyncio.sleep(0.01)
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+        assert store.jobs[job["id"]]["status"] == "running"
+
+        await batch_service.run_batch_job(job["id"])
+        return job["id"]
+
+    job_id = asyncio.run(run())
+    job = store.jobs[job_id]
+    assert job["status"] == "completed"
+    assert (job["completed"], job["failed"]) == (3, 0)
+    assert stub_app.state.calls["openai:batch"] == 1
+    assert stub_app.state.calls["openai:batch_request"] == 3
+
+def test_worker_stops_when_its_lease_is_taken_over(store, monkeypatch):
+    monkeypatch.setattr(batch_service, "BATCH_LEASE_SECONDS", 0.15)
+    monkeypatch.setattr(stub_app.state, "batch_delay_ms", 2000)
+
+    async def run():
+        job = await store.create_batch_job("u1", items("gpt-4o-mini", 3))
+        worker = asyncio.create_task(batch_service.run_batch_job(job["id"]))
+        while not all(item.get("openai_batch_id") for item in store.items[job["id"]].values()):
+            await asyncio.sleep(0.01)
+        # Another replica takes the job over while this worker is polling the batch.
+        store.lease_taken_over = True
+        await asyncio.wait_for(worker, timeout=1)
+        return job["id"]
+
+    job_id = asyncio.run(run())
+    job = store.jobs[job_id]
+    # The job and its items are left for the new lease holder to finish.
+    assert job["status"] == "running"
+    assert (job["completed"], job["failed"]) == (0, 0)
+    assert all(item["status"] == "pending" for item in store.items[job_id].values())
+    assert stub_app.state.calls["openai:batch"] == 1
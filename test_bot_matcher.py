@@ -0,0 +1,78 @@
+# test_bot_matcher.py
+# The compiled bot blocklist: case-insensitive substring matches, the bounded verdict
+# cache, and hot reload when the blocklist file changes on disk.
+#
+# Usage:
+#   python -m pytest -q test_bot_matcher.py
+import os
+
+import pytest
+
+from app.core import bot_matcher
+from app.core.bot_matcher import BotMatcher
+
+BROWSER_UA = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36"
+
+@pytest.fixture
+def blocklist(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot_matcher, "BOT_BLOCKLIST_RELOAD_SECONDS", 0)
+    path = tmp_path / "bot_blocklist.txt"
+    path.write_text("# crawlers\nGPTBot\nccbot   # Common Crawl\n\nbadbot-extended\nbadbot\n")
+    return path
+
+def rewrite(path, text: str):
+    """Writes the file and moves its mtime forward, so the change is seen even on coarse clocks."""
+    stat = os.stat(path)
+    path.write_text(text)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+def test_matches_signatures_anywhere_in_the_user_agent(blocklist):
+    matcher = BotMatcher(str(blocklist))
+    assert matcher.signature_count == 4
+    assert matcher.match("Mozilla/5.0 AppleWebKit/537.36 (compatible; GPTBot/1.1; +https://openai.com/gptbot)") == "gptbot"
+    assert matcher.match("CCBot/2.0 (https://commoncrawl.org/faq/)") == "ccbot"
+    # The shorter signature already decides the verdict for the longer one.
+    assert matcher.match("BadBot-Extended/3.1") == "badbot"
+    assert matcher.match(BROWSER_UA) is None
+    assert matcher.match("") is None
+
+def test_verdicts_are_cached_by_digest_and_long_user_agents_are_not(blocklist, monkeypatch):
+    monkeypatch.setattr(bot_matcher, "BOT_VERDICT_CACHE_MAX_UA_LENGTH", 200)
+    matcher = BotMatcher(str(blocklist))
+    matcher.match(BROWSER_UA)
+    matcher.match("ccbot/2.0")
+    keys = [key for key, _ in matcher._verdicts.items()]
+    assert len(keys) == 2
+    assert all(isinstance(key, bytes) and len(key) == 16 for key in keys)
+
+    long_bot = "x" * 5000 + " GPTBot"
+    assert matcher.match(long_bot) == "gptbot"
+    assert matcher.match("y" * 5000) is None
+    assert len(matcher._verdicts) == 2
+
+def test_reloads_when_the_file_changes(blocklist):
+    matcher = BotMatcher(str(blocklist))
+    assert matcher.match("NewCrawler/1.0") is None
+    assert matcher.match("ccbot/2.0") == "ccbot"
+
+    rewrite(blocklist, "newcrawler\n")
+    assert matcher.match("NewCrawler/1.0") == "newcrawler"
+    # Cached verdicts from the old list are dropped with it.
+    assert matcher.match("ccbot/2.0") is None
+    assert matcher.signature_count == 1
+
+def test_falls_back_to_defaults_when_the_file_is_removed(blocklist):
+    matcher = BotMatcher(str(blocklist))
+    assert matcher.match("ClaudeBot/1.0") is None
+    blocklist.unlink()
+    assert matcher.match("ClaudeBot/1.0") == "claudebot"
+    assert matcher.signature_count == len(bot_matcher.DEFAULT_BOT_SIGNATURES)
+
+def test_reload_is_rate_limited(blocklist, monkeypatch):
+    matcher = BotMatcher(str(blocklist))
+    monkeypatch.setattr(bot_matcher, "BOT_BLOCKLIST_RELOAD_SECONDS", 3600)
+    matcher.maybe_reload(force=True)
+    rewrite(blocklist, "newcrawler\n")
+    assert matcher.match("NewCrawler/1.0") is None
+    matcher.maybe_reload(force=True)
+    assert matcher.match("NewCrawler/1.0") == "newcrawler"
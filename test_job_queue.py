@@ -0,0 +1,97 @@
+# test_job_queue.py
+# `mode=async` on the meta-prompt endpoints: the request returns 202 at once, a worker
+# runs the LLM call from the Redis-backed queue, and the client gets the normal response
+# body by polling the job or from the `done` event of its SSE stream.
+# Redis is an in-memory stand-in; the LLM call is replaced by a slow fake.
+#
+# Usage:
+#   python -m pytest -q test_job_queue.py
+import time
+import asyncio
+
+import httpx
+import pytest
+from fastapi import APIRouter, FastAPI, HTTPException
+
+from app.routers import jobs, prompts
+from app.services import job_queue, llm_service
+from conftest import parse_sse
+
+DIAGNOSIS = {
+    "overall_score": 4.0, "diagnosis": "Too vague.", "key_issues": ["No audience"],
+    "suggested_prompt": "Write a 300-word story for children.",
+    "criteria": {"clarity": True, "specificity": False, "context": False, "constraints": False},
+}
+LLM_SECONDS = 0.3
+
+@pytest.fixture
+def app(fake_redis, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_POLL_SECONDS", 0.05)
+    api = APIRouter()
+    api.include_router(prompts.router, prefix="/prompts")
+    api.include_router(jobs.router, prefix="/jobs")
+    app = FastAPI()
+    app.include_router(api, prefix="/api/v1")
+    return app
+
+async def submit_and_follow(app):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        start = time.perf_counter()
+        accepted = await client.post("/api/v1/prompts/diagnose?mode=async", json={"prompt_text": "Make a story."})
+        accept_seconds = time.perf_counter() - start
+        worker = asyncio.create_task(job_queue.run_worker())
+        try:
+            events = await client.get(accepted.json()["events_url"])
+            status = await client.get(accepted.headers["location"])
+        finally:
+            worker.cancel()
+    return accepted, accept_seconds, events, status
+
+def test_async_mode_returns_202_and_delivers_result(app, monkeypatch):
+    async def slow_diagnose(request):
+        await asyncio.sleep(LLM_SECONDS)
+        return DIAGNOSIS
+    monkeypatch.setattr(llm_service, "diagnose_prompt", slow_diagnose)
+
+    accepted, accept_seconds, events, status = asyncio.run(submit_and_follow(app))
+    assert accepted.status_code == 202 and accepted.json()["status"] == "queued"
+    assert accept_seconds < LLM_SECONDS / 3
+    names = [name for name, _ in parse_sse(events.text)]
+    assert names[0] == "status" and names[-1] == "done"
+    done = parse_sse(events.text)[-1][1]
+    assert done["status"] == "succeeded" and done["result"] == DIAGNOSIS
+    assert status.status_code == 200 and status.json()["result"] == DIAGNOSIS
+
+def test_handler_errors_are_stored_on_the_job(app, monkeypatch):
+    async def failing_diagnose(request):
+        raise HTTPException(status_code=500, detail="Failed to diagnose prompt.")
+    monkeypatch.setattr(llm_service, "diagnose_prompt", failing_diagnose)
+
+    accepted, _, events, status = asyncio.run(submit_and_follow(app))
+    assert accepted.status_code == 202
+    job = status.json()
+    assert job["status"] == "failed"
+    assert job["error"] == {"status_code": 500, "detail": "Failed to diagnose prompt."}
+    assert parse_sse(events.text)[-1] == ("done", job)
+
+async def stop_during_job(app, drain_seconds):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        accepted = await client.post("/api/v1/prompts/diagnose?mode=async", json={"prompt_text": "Make a story."})
+        workers = job_queue.start_workers(2)
+        while (await client.get(accepted.headers["location"])).json()["status"] != "running":
+            await asyncio.sleep(0.01)
+        await job_queue.stop_workers(workers, drain_seconds=drain_seconds)
+        assert all(worker.done() for worker in workers)
+        return (await client.get(accepted.headers["location"])).json()
+
+@pytest.mark.parametrize("drain_seconds, status", [(5, "succeeded"), (LLM_SECONDS / 10, "failed")])
+def test_stopping_workers_drains_the_running_job(app, monkeypatch, drain_seconds, status):
+    async def slow_diagnose(request):
+        await asyncio.sleep(LLM_SECONDS)
+        return DIAGNOSIS
+    monkeypatch.setattr(llm_service, "diagnose_prompt", slow_diagnose)
+
+    job = asyncio.run(stop_during_job(app, drain_seconds))
+    assert job["status"] == status
+    if status == "failed":
+        assert job["error"]["status_code"] == 503
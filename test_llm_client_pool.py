@@ -0,0 +1,71 @@
+# test_llm_client_pool.py
+# Pooled provider clients: one client per API key, reused across calls, and an evicted
+# client is only closed once no call holds a lease on it. Gemini models are
+# bound to their pooled client through GenerativeModel._async_client, which is not public
+# SDK API; google-generativeai is pinned in requirements.txt and this test fails if an
+# upgrade renames the attribute or stops routing calls through it.
+#
+# Usage:
+#   python -m pytest -q test_llm_client_pool.py
+import asyncio
+
+from google.ai import generativelanguage as glm
+
+from app.core.cache import TTLCache
+from app.services import llm_client_pool
+
+MODEL_NAME = "gemini-2.5-flash-lite"
+
+def test_openai_clients_are_pooled_per_key():
+    llm_client_pool.client_pool.clear()
+    first = llm_client_pool.get_openai_client("sk-a")
+    assert llm_client_pool.get_openai_client("sk-a") is first
+    assert llm_client_pool.get_openai_client("sk-b") is not first
+    assert first.max_retries == 0
+
+def test_gemini_model_calls_go_through_the_pooled_client(monkeypatch):
+    llm_client_pool.client_pool.clear()
+    requests = []
+
+    async def generate_content(request, **kwargs):
+        requests.append(request)
+        return glm.GenerateContentResponse(
+            candidates=[{"content": {"role": "model", "parts": [{"text": "pooled reply"}]}, "finish_reason": "STOP"}],
+            usage_metadata={"prompt_token_count": 2, "candidates_token_count": 2},
+        )
+
+    async def run():
+        model = llm_client_pool.get_gemini_model("key-a", MODEL_NAME)
+        pooled = llm_client_pool.client_pool.get(llm_client_pool._pool_key("google", "key-a"))
+        assert llm_client_pool.get_gemini_model("key-a", MODEL_NAME)._async_client is pooled
+        assert llm_client_pool.get_gemini_model("key-b", MODEL_NAME)._async_client is not pooled
+        monkeypatch.setattr(pooled, "generate_content", generate_content)
+        return await model.generate_content_async("hello there")
+
+    response = asyncio.run(run())
+    assert response.text == "pooled reply"
+    assert len(requests) == 1 and requests[0].model == f"models/{MODEL_NAME}"
+
+def test_evicted_client_is_closed_only_after_its_last_lease(monkeypatch):
+    closed = []
+
+    async def record_close(client):
+        closed.append(client)
+
+    monkeypatch.setattr(llm_client_pool, "_close", record_close)
+    monkeypatch.setattr(llm_client_pool, "client_pool", TTLCache(maxsize=1, ttl_seconds=3600, on_evict=llm_client_pool._on_evict))
+
+    async def run():
+        with llm_client_pool.lease_openai_client("sk-a") as leased:
+            # A second key pushes the leased client out of the one-entry pool.
+            with llm_client_pool.lease_openai_client("sk-b") as other:
+                pass
+            llm_client_pool.get_openai_client("sk-c")
+            await asyncio.sleep(0)
+            assert closed == [other], "an evicted client with no leases is closed right away"
+        await asyncio.sleep(0)
+        return leased
+
+    leased = asyncio.run(run())
+    assert closed[-1] is leased
+    assert llm_client_pool._leases == {} and not llm_client_pool._retired
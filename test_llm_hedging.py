@@ -0,0 +1,79 @@
+# test_llm_hedging.py
+# Request hedging against the local stub provider: a stalled first call gets a duplicate
+# after the model's latency threshold, the loser is cancelled, and no duplicate is sent
+# when the hedge budget is spent or the scheduler has no free slot for it.
+#
+# Usage:
+#   python -m pytest -q test_llm_hedging.py
+import time
+import asyncio
+
+import pytest
+
+from app.services import llm_hedging, llm_scheduler, llm_service
+from app.services.llm_scheduler import TokenBucket
+from stub_llm_provider import app as stub_app, inject_faults
+
+MODEL_NAME = "gpt-4o-mini"
+PROMPT = "Explain quantum computing in simple terms."
+STALL_SECONDS = 0.5
+
+@pytest.fixture
+def client(stub_client, monkeypatch):
+    monkeypatch.setattr(llm_hedging, "LLM_HEDGING_ENABLED", True)
+    monkeypatch.setattr(llm_hedging, "_latencies", {})
+    monkeypatch.setattr(llm_hedging, "_budget", TokenBucket(60))
+    monkeypatch.setattr(llm_scheduler, "LIMIT_OVERRIDES", {"openai": {"rpm": 60_000, "tpm": 10_000_000}})
+    # Recent calls took ~20 ms, so the hedge threshold is the 50 ms floor.
+    llm_hedging._latency(MODEL_NAME).samples_ms.extend([20.0] * llm_hedging.HEDGE_MIN_SAMPLES)
+    monkeypatch.setattr(stub_app.state, "stall_seconds", STALL_SECONDS)
+    return stub_client
+
+async def hedged_call(client, cancelled: list):
+    """One platform call as llm_service makes it: the caller holds a slot, hedging runs inside."""
+    async def fn():
+        try:
+            return await llm_service._call_openai_with_client(client, MODEL_NAME, PROMPT)
+        except asyncio.CancelledError:
+            cancelled.append(fn)
+            raise
+    async with llm_scheduler.slot(MODEL_NAME, PROMPT):
+        start = time.perf_counter()
+        result = await llm_hedging.run(MODEL_NAME, fn, PROMPT, llm_service._token_usage)
+        elapsed = time.perf_counter() - start
+    in_flight = llm_scheduler.get_stats()["providers"]["openai"]["in_flight"]
+    return result, elapsed, in_flight
+
+def test_slow_call_is_hedged_and_loser_cancelled(client):
+    inject_faults("stall")
+    cancelled = []
+    (text, _, _), elapsed, in_flight = asyncio.run(hedged_call(client, cancelled))
+    stats = llm_hedging.get_stats()["models"][MODEL_NAME]
+    assert text.endswith(PROMPT)
+    assert elapsed < STALL_SECONDS
+    assert stub_app.state.calls["openai:chat"] == 2
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+    assert len(cancelled) == 1
+    assert in_flight == 0
+
+def test_no_hedge_once_budget_is_spent(client):
+    llm_hedging._budget.tokens = 0
+    inject_faults("stall")
+    (text, _, _), elapsed, _ = asyncio.run(hedged_call(client, []))
+    stats = llm_hedging.get_stats()["models"][MODEL_NAME]
+    assert text.endswith(PROMPT)
+    assert elapsed >= STALL_SECONDS
+    assert stub_app.state.calls["openai:chat"] == 1
+    assert stats["hedged"] == 0 and stats["over_budget"] == 1
+
+def test_no_hedge_without_a_free_scheduler_slot(client, monkeypatch):
+    # The caller's call holds the model's only slot, so the duplicate cannot get one.
+    monkeypatch.setitem(llm_scheduler.LIMIT_OVERRIDES, MODEL_NAME, {"concurrency": 1})
+    inject_faults("stall")
+    budget_before = llm_hedging._budget.tokens
+    (text, _, _), elapsed, _ = asyncio.run(hedged_call(client, []))
+    stats = llm_hedging.get_stats()["models"][MODEL_NAME]
+    assert text.endswith(PROMPT)
+    assert stub_app.state.calls["openai:chat"] == 1
+    assert stats["hedged"] == 0 and stats["no_capacity"] == 1
+    assert llm_hedging._budget.tokens >= budget_before - 0.01
@@ -0,0 +1,116 @@
+# test_llm_resilience.py
+# Deadlines, retries and circuit breaking around provider calls, exercised against the
+# local stub provider with injected faults (429/500 responses and stalled requests).
+#
+# Usage:
+#   python -m pytest -q test_llm_resilience.py
+import time
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from openai import AsyncOpenAI
+
+from app.schemas.prompt import PromptExecuteRequest
+from app.services import llm_resilience, llm_service
+from stub_llm_provider import app as stub_app, inject_faults
+
+MODEL_NAME = "gpt-4o-mini"
+REQUEST = PromptExecuteRequest(prompt_text="Explain quantum computing in simple terms.", model=MODEL_NAME)
+
+@pytest.fixture(autouse=True)
+def fast_policy(platform_client, monkeypatch):
+    monkeypatch.setattr(llm_resilience, "POLICY_OVERRIDES", {"openai": {
+        "timeout_seconds": 0.5, "backoff_base_seconds": 0.01, "backoff_max_seconds": 0.05,
+        "failure_threshold": 3, "reset_timeout_seconds": 0.3,
+    }})
+    monkeypatch.setattr(stub_app.state, "stall_seconds", 1.0)
+    llm_resilience._breakers.clear()
+    yield
+    llm_resilience._breakers.clear()
+
+def execute():
+    return asyncio.run(llm_service.execute_platform_prompt(REQUEST))
+
+def test_transient_errors_are_retried():
+    inject_faults(429, 500)
+    response = execute()
+    assert stub_app.state.calls["openai:chat"] == 3
+    assert response.final_text.endswith(REQUEST.prompt_text)
+
+def test_stalled_call_hits_deadline_and_is_retried():
+    inject_faults("stall")
+    start = time.perf_counter()
+    response = execute()
+    assert stub_app.state.calls["openai:chat"] == 2
+    assert time.perf_counter() - start < stub_app.state.stall_seconds
+    assert response.final_text.endswith(REQUEST.prompt_text)
+
+def test_client_errors_are_not_retried():
+    inject_faults(400)
+    with pytest.raises(HTTPException) as exc_info:
+        execute()
+    assert exc_info.value.status_code == 500
+    assert stub_app.state.calls["openai:chat"] == 1
+
+def test_circuit_opens_then_recovers():
+    async def scenario():
+        inject_faults(*[500] * 3)
+        with pytest.raises(HTTPException) as exc_info:
+            await llm_service.execute_platform_prompt(REQUEST)
+        assert exc_info.value.status_code == 503
+        assert llm_resilience.get_stats()["openai:platform"]["state"] == "open"
+
+        # While open, calls fail fast without reaching the provider.
+        with pytest.raises(HTTPException) as exc_info:
+            await llm_service.execute_platform_prompt(REQUEST)
+        assert exc_info.value.status_code == 503 and "Retry-After" in exc_info.value.headers
+        assert stub_app.state.calls["openai:chat"] == 3
+
+        # After the reset timeout one trial call goes through and closes the circuit.
+        await asyncio.sleep(0.35)
+        return await llm_service.execute_platform_prompt(REQUEST)
+
+    response = asyncio.run(scenario())
+    assert stub_app.state.calls["openai:chat"] == 4
+    assert response.final_text.endswith(REQUEST.prompt_text)
+    assert llm_resilience.get_stats()["openai:platform"]["state"] == "closed"
+
+def test_cancelled_trial_call_frees_half_open_slot():
+    async def scenario():
+        inject_faults(*[500] * 3)
+        with pytest.raises(HTTPException):
+            await llm_service.execute_platform_prompt(REQUEST)
+        await asyncio.sleep(0.35)
+
+        # The trial call stalls and its caller goes away before it finishes.
+        inject_faults("stall")
+        trial = asyncio.create_task(llm_service.execute_platform_prompt(REQUEST))
+        await asyncio.sleep(0.1)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        assert not llm_resilience._breakers.get("openai:platform").trial_in_flight
+
+        # The next call becomes the trial instead of being rejected until the breaker expires.
+        return await llm_service.execute_platform_prompt(REQUEST)
+
+    response = asyncio.run(scenario())
+    assert response.final_text.endswith(REQUEST.prompt_text)
+    assert llm_resilience.get_stats()["openai:platform"]["state"] == "closed"
+
+def test_user_scope_does_not_trip_platform_breaker(stub_url):
+    user_client = AsyncOpenAI(api_key="user-key", base_url=f"{stub_url}/v1", max_retries=0)
+
+    async def user_call():
+        return await llm_resilience.call(
+            MODEL_NAME, lambda: llm_service._call_openai_with_client(user_client, MODEL_NAME, "hi"), scope="user:u1")
+
+    async def scenario():
+        inject_faults(*[429] * 3)
+        with pytest.raises(llm_resilience.ProviderUnavailable):
+            await user_call()
+        assert llm_resilience.get_stats()["openai:user:u1"]["state"] == "open"
+        return await llm_service.execute_platform_prompt(REQUEST)
+
+    assert asyncio.run(scenario()).final_text.endswith(REQUEST.prompt_text)
@@ -1,11 +1,18 @@
 # ~/rankforge/test_log_rotation.py
 import os
+import json
 import time
+import queue
+import asyncio
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+import pytest
 
 # This import triggers the logging setup from our application
 from app.main import app
+from app.core import logging_config
+from app.middleware.logging_middleware import LoggingMiddleware
 
 LOG_FILE = "api_requests.log"
 MAX_LOG_SIZE_FOR_TEST = 1024  # 1KB for testing
@@ -13,13 +20,11 @@ BACKUP_COUNT = 3
 
 def test_log_rotation():
     logger = logging.getLogger()
-    handler = None
-    for h in logger.handlers:
-        if isinstance(h, RotatingFileHandler) and 'api_requests.log' in h.baseFilename:
-            handler = h
-            break
-    
-    assert handler is not None, "FAIL: The RotatingFileHandler was not found on the root logger."
+    # The root logger only enqueues; the RotatingFileHandler sits behind the queue listener.
+    assert any(isinstance(h, QueueHandler) for h in logger.handlers), "FAIL: No QueueHandler on the root logger."
+    handler = logging_config.file_handler
+    assert isinstance(handler, RotatingFileHandler) and 'api_requests.log' in handler.baseFilename, \
+        "FAIL: The RotatingFileHandler was not found behind the log queue."
 
     # --- KEY FIX: Temporarily override the handler's size limit for the test ---
     original_max_bytes = handler.maxBytes
@@ -27,7 +32,7 @@ def test_log_rotation():
     
     try:
         # --- Cleanup: Ensure a clean state before the test runs ---
-        logger.removeHandler(handler)
+        logging_config.flush()
         handler.close()
         if os.path.exists(LOG_FILE):
             os.remove(LOG_FILE)
@@ -35,7 +40,6 @@ def test_log_rotation():
             backup_file = f"{LOG_FILE}.{i}"
             if os.path.exists(backup_file):
                 os.remove(backup_file)
-        logger.addHandler(handler)
 
         print(f"--- Triggering log rotation (test limit: {MAX_LOG_SIZE_FOR_TEST} bytes) ---")
         
@@ -44,8 +48,8 @@ def test_log_rotation():
         logger.info(large_log_message)
         logger.info("This second message will trigger the rotation.")
         
-        # Force the rotation to complete by closing the handler
-        logger.removeHandler(handler)
+        # Wait for the listener thread to write (and rotate), then close the file
+        logging_config.flush()
         handler.close()
 
         print("--- Verifying rotation results ---")
@@ -65,7 +69,41 @@ def test_log_rotation():
         handler.maxBytes = original_max_bytes
         print(f"--- Restored log handler maxBytes to {original_max_bytes} ---")
 
+def test_full_log_queue_drops_instead_of_blocking():
+    handler = logging_config.DroppingQueueHandler(queue.Queue(maxsize=2))
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "hello", None, None)
+    for _ in range(5):
+        handler.emit(record)
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+def test_json_lines_format_carries_structured_fields():
+    record = logging.LogRecord("access", logging.INFO, __file__, 1, "method=GET path='/'", None, None)
+    record.fields = {"method": "GET", "path": "/", "status_code": 200, "latency_ms": 1.5}
+    entry = json.loads(logging_config.JsonLinesFormatter().format(record))
+    assert entry["level"] == "INFO" and entry["message"] == "method=GET path='/'"
+    assert entry["status_code"] == 200 and entry["latency_ms"] == 1.5
+
+def test_request_failing_before_a_response_is_still_logged(caplog):
+    async def failing_app(scope, receive, send):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": "/boom", "client": ("10.0.0.1", 1234), "state": {}}
+    caplog.set_level(logging.INFO, logger="app.middleware.logging_middleware")
+    # The exception still propagates, to the error middleware that answers 500.
+    with pytest.raises(RuntimeError):
+        asyncio.run(LoggingMiddleware(failing_app)(scope, None, send))
+    [record] = [r for r in caplog.records if r.name == "app.middleware.logging_middleware"]
+    assert record.fields["path"] == "/boom" and record.fields["status_code"] == 500
+    assert record.fields["latency_ms"] >= 10
+
 
 if __name__ == "__main__":
     test_log_rotation()
+    test_full_log_queue_drops_instead_of_blocking()
+    test_json_lines_format_carries_structured_fields()
     print("\n🎉 Log rotation test passed successfully!")
\ No newline at end of file
@@ -0,0 +1,51 @@
+# test_singleflight.py
+# Identical concurrent benchmark calls must share a single upstream provider call.
+# Runs offline: the provider is stub_llm_provider.py, and Firestore/Redis behind the
+# response cache are in-memory stand-ins.
+#
+# Usage:
+#   python -m pytest -q test_singleflight.py
+import asyncio
+
+import pytest
+
+from app.services import llm_service, response_cache
+from conftest import FakeFirestore
+from stub_llm_provider import app as stub_app
+
+CONCURRENT_CALLS = 100
+MODEL_NAME = "gpt-4o-mini"
+
+@pytest.fixture(autouse=True)
+def empty_cache(platform_client, fake_redis, monkeypatch):
+    monkeypatch.setattr(response_cache, "db", FakeFirestore())
+    response_cache.l1_cache.clear()
+
+def test_identical_concurrent_calls_share_one_upstream_call():
+    async def burst():
+        return await asyncio.gather(*(
+            llm_service.execute_single_model_benchmark(MODEL_NAME, "same prompt") for _ in range(CONCURRENT_CALLS)
+        ))
+
+    results = asyncio.run(burst())
+
+    assert stub_app.state.calls["openai:chat"] == 1
+    assert len(results) == CONCURRENT_CALLS
+    assert all(r.generated_text == results[0].generated_text for r in results)
+    assert not results[0].generated_text.startswith("Error")
+
+def test_redis_fill_lock_coalesces_across_replicas(monkeypatch):
+    # Bypasses the in-process layer so every call behaves like a separate replica.
+    monkeypatch.setattr(response_cache, "SINGLEFLIGHT_REDIS_LOCK", True)
+    monkeypatch.setattr(response_cache, "FILL_WAIT_POLL_SECONDS", 0.01)
+
+    async def burst():
+        def fresh_replica():
+            response_cache.l1_cache.clear()
+            return llm_service._execute_single_model_benchmark("replica-key", MODEL_NAME, "shared prompt")
+        return await asyncio.gather(*(fresh_replica() for _ in range(20)))
+
+    results = asyncio.run(burst())
+
+    assert stub_app.state.calls["openai:chat"] == 1
+    assert len({r.generated_text for r in results}) == 1
@@ -0,0 +1,131 @@
+# test_streaming_execution.py
+# Exercises the SSE execution path against the local stub provider (no network or keys):
+# token events arrive in order and the final `done` event carries token counts, cost and
+# the time-to-first-token / total latency split. Streamed benchmark and sandbox runs report
+# each model or prompt as a `result` or `error` event, then a `done` event with the counts.
+#
+# Usage:
+#   python -m pytest -q test_streaming_execution.py
+import json
+import asyncio
+
+import httpx
+import google.generativeai as genai
+from fastapi import FastAPI
+
+from app.core import redis_client
+from app.routers import prompts, sandbox
+from app.schemas.prompt import PromptExecuteRequest
+from app.services import llm_service, response_cache
+from conftest import FakeFirestore, parse_sse
+from stub_llm_provider import app as stub_app, inject_faults
+
+PROMPT = "Explain quantum computing in simple terms."
+
+class ThreadedRestStreamModel:
+    """The async SDK client is gRPC-only; this drives the REST transport's stream from a thread."""
+    def __init__(self, model: genai.GenerativeModel):
+        self._model = model
+
+    async def generate_content_async(self, contents, stream=False):
+        response = await asyncio.to_thread(self._model.generate_content, contents, stream=True)
+        iterator = iter(response)
+
+        async def chunks():
+            while (chunk := await asyncio.to_thread(next, iterator, None)) is not None:
+                yield chunk
+        return chunks()
+
+def assert_well_formed(events: list[tuple[str, dict]], expected_text: str):
+    names = [name for name, _ in events]
+    assert names[-1] == "done" and set(names[:-1]) == {"token"}
+    assert len(names) > 2, "the reply should arrive as several token events"
+    assert "".join(data["text"] for name, data in events if name == "token") == expected_text
+    summary = events[-1][1]
+    assert summary["input_token_count"] == len(PROMPT.split())
+    assert summary["output_token_count"] == len(expected_text.split())
+    assert summary["cost"] > 0
+    assert stub_app.state.latency_ms * 0.8 <= summary["time_to_first_token_ms"] < summary["latency_ms"]
+
+def test_platform_execute_stream_openai(platform_client):
+    app = FastAPI()
+    app.include_router(prompts.router, prefix="/prompts")
+
+    async def call():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/prompts/execute/stream", json={"prompt_text": PROMPT, "model": "gpt-4o-mini"})
+
+    response = asyncio.run(call())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert_well_formed(parse_sse(response.text), f"[key=stub-key] stub reply to: {PROMPT}")
+
+def test_gemini_stream_events(stub_url):
+    genai.configure(api_key="stub-key", transport="rest", client_options={"api_endpoint": stub_url})
+    model = ThreadedRestStreamModel(genai.GenerativeModel("gemini-2.5-flash-lite"))
+
+    async def collect():
+        usage = {}
+        chunks = llm_service._stream_gemini_with_client(model, PROMPT, usage)
+        events = llm_service._execution_events("gemini-2.5-flash-lite", PROMPT, "platform-run", chunks, usage, "Failed")
+        return "".join([frame async for frame in events])
+
+    body = asyncio.run(collect())
+    assert_well_formed(parse_sse(body), f"[key=stub-key] stub reply to: {PROMPT}")
+
+def run_streamed(monkeypatch, path: str, payload: dict, headers: dict | None = None):
+    """POSTs to a streaming benchmark/sandbox route with the response cache emptied and disabled."""
+    monkeypatch.setattr(redis_client, "redis_client", None)
+    monkeypatch.setattr(response_cache, "db", FakeFirestore())
+    monkeypatch.setattr(response_cache, "put", lambda key, result: None)
+    response_cache.l1_cache.clear()
+    app = FastAPI()
+    app.include_router(prompts.router, prefix="/prompts")
+    app.include_router(sandbox.router, prefix="/sandbox")
+
+    async def call():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post(f"{path}?stream=true", json=payload, headers=headers or {})
+    return asyncio.run(call())
+
+def test_benchmark_stream_reports_failed_models_as_error_events(platform_client, monkeypatch):
+    models = ["gpt-4o-mini", "gpt-invalid-model", "gpt-4o"]
+    response = run_streamed(monkeypatch, "/prompts/benchmark", {"prompt_text": PROMPT, "models": models},
+                            headers={"Accept": "text/event-stream"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert events[-1] == ("done", {"completed": 2, "failed": 1})
+    results = {data["model_name"]: data for name, data in events if name == "result"}
+    errors = [data for name, data in events if name == "error"]
+    assert set(results) == {"gpt-4o-mini", "gpt-4o"}
+    assert all(r["generated_text"] == f"[key=stub-key] stub reply to: {PROMPT}" for r in results.values())
+    assert len(errors) == 1 and errors[0]["model_name"] == "gpt-invalid-model"
+    assert "does not exist" in errors[0]["error"]
+
+def test_sandbox_stream_reports_failed_prompts_as_error_events(platform_client, monkeypatch):
+    prompts_in = [{"id": f"p{i}", "text": f"Variant {i} of the prompt"} for i in range(3)]
+    # The second call to reach the provider is rejected as a bad request.
+    inject_faults(None, 400)
+    response = run_streamed(monkeypatch, "/sandbox/run", {"model": "gpt-4o-mini", "input_text": "", "prompts": prompts_in})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1] == {"completed": 2, "failed": 1}
+    results = [line for line in lines[:-1] if "generated_text" in line]
+    errors = [line for line in lines[:-1] if "error" in line]
+    assert len(results) == 2 and len(errors) == 1
+    assert {line["prompt_id"] for line in results + errors} == {"p0", "p1", "p2"}
+    for line in results:
+        assert line["generated_text"].endswith(prompts_in[int(line["prompt_id"][1:])]["text"])
+    assert "Error calling gpt-4o-mini" in errors[0]["error"]
+
+def test_platform_stream_without_a_client_reports_an_error_event(monkeypatch):
+    monkeypatch.setattr(llm_service, "platform_openai_client", None)
+
+    async def collect():
+        return "".join([frame async for frame in llm_service.stream_platform_prompt(
+            PromptExecuteRequest(prompt_text=PROMPT, model="gpt-4o-mini"))])
+
+    assert parse_sse(asyncio.run(collect())) == [
+        ("error", {"detail": "Failed to execute prompt with platform key: OpenAI client is not configured."})]